@@ -1,30 +1,37 @@
 # Import required libraries
 
 import numpy as np                          # For numerical operations
-import tensorflow as tf                     # For deep learning model handling (TensorFlow/Keras)
-import cv2                                  # For image preprocessing (OpenCV)
+import threading                            # For loading the models in the background
 
-from flask import Flask, request, jsonify, send_file  # Flask for creating web API
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context, g  # Flask for creating web API
 from flask_cors import CORS                           # To handle Cross-Origin Resource Sharing (CORS) issues
 
-from tensorflow.keras.models import load_model        # For loading pre-trained Keras models
-from tensorflow.keras.preprocessing import image      # For image preprocessing utilities
-
-import pytesseract                         # For Optical Character Recognition (OCR) on text from images
-import joblib                              # For loading serialized models (like sklearn models)
-import tempfile                            # To create temporary files
 import os                                  # For file path and OS-level operations
-import matplotlib.pyplot as plt            # For plotting and visualization
 import logging                             # For logging and debugging
-
-from lime.lime_text import LimeTextExplainer     # LIME explainer for text data
-from lime.lime_image import LimeImageExplainer   # LIME explainer for image data
-
-from reportlab.lib.pagesizes import letter                 # For setting PDF page size
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Image, Spacer  # For PDF report generation
-from reportlab.lib.styles import getSampleStyleSheet       # For text styling in PDF
-
-from skimage.segmentation import mark_boundaries           # To highlight image regions (used with LIME explanations)
+import json                                # For NDJSON batch responses
+import time                                # For request latency metrics
+import itertools                           # For streaming batch items from several uploads
+from io import BytesIO                     # For serving reports from memory
+
+from reports import ReportRenderer, encode_lime_image, REPORT_RENDER_MODE  # PDF report rendering (sync / process pool / lazy)
+from ocr import route_and_extract, classify_by_statistics, OCRPool  # Single-pass OCR stage (routing + text extraction), page OCR pool
+from ocr_engine import describe_ocr, merge_results  # OCR settings for the cache key, joining page results
+from documents import Document, is_document, score_study              # Multi-page reports and CT slice stacks
+from uploads import DecodedUpload, UploadError, validate_upload, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, CT_INPUT_SIZE  # In-memory upload validation and decoding
+from lime_engine import CTExplainer, LIME_NUM_SAMPLES, LIME_NUM_FEATURES  # Batched LIME engine for CT scans
+from segmentation import Segmenter                                       # LIME superpixel settings (for the cache fingerprint)
+from cnn_runtime import load_ct_predict_fn, CT_RUNTIME, CT_ARTIFACT, CT_CLASS_LABELS, FORK_SAFE_RUNTIMES  # Keras / frozen graph / TFLite CNN runtimes
+from batching import MicroBatcher                                       # Micro-batching of concurrent CNN calls
+from result_cache import ResultCache, cache_key, model_fingerprint      # Content-addressed result cache
+import metrics                                                          # In-process metrics registry
+from profiling import RequestProfiler                                   # Opt-in cProfile/pyinstrument traces of sampled requests
+import text_preprocessing                                               # Same text normalisation as NLP training
+from text_explainer import TreeContributionExplainer                    # Exact tree-path word attributions
+from compact_text_model import load_text_model, text_model_files, TEXT_RUNTIME  # sklearn pickles or the compact memory-mapped export
+from report_store import ReportStore, new_report_id                     # Per-request report storage
+from jobs import InProcessJobQueue, QueueFull                           # Async job queue for /predict?async=1
+from batch_predict import BatchPredictor, iter_zip_items, is_image_name # Bulk prediction for /predict/batch
+from serving import Readiness, configure_tf_threads, TF_INTRA_OP_THREADS  # Per-worker TF threads and health state
 
 
 app = Flask(__name__)
@@ -33,89 +40,322 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-ct_scan_model = load_model("lung_cancer_detection_model.h5")
-text_classifier = joblib.load("lung_cancer_classifier.pkl")
-tfidf_vectorizer = joblib.load("tfidf_vectorizer.pkl")
-logger.info("Models loaded successfully")
-
-# Custom function for adding bold and space in titles
-def bold_title_style():
-    styles = getSampleStyleSheet()
-    bold_style = styles["Heading2"]
-    bold_style.fontName = "Helvetica-Bold"
-    return bold_style
-
-#Reads CT scan images, resizes them to 256x256, normalizes pixel values to [0,1], and converts them into an array 
-#format suitable for model input.
-def preprocess_ct_scan(img_path):
-    img = image.load_img(img_path, target_size=(256, 256))
-    img = image.img_to_array(img)
-    img = np.expand_dims(img, axis=0) / 255.0
-    return img
-
-def preprocess_ct_scan2(img_path):
-    img = image.load_img(img_path, target_size=(256, 256))
-    img = image.img_to_array(img)
-    img = img / 255.0
-    return img
-
-#Uses pytesseract to check if an image contains text or is a CT scan.
-def detect_ct_or_text(img_path):
-    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    text = pytesseract.image_to_string(img).strip()
-    return "text" if text else "ct"
-
-#Reads a medical report image and extracts the text using OCR (Tesseract).
-def extract_text(img_path):
-    img = cv2.imread(img_path)
-    return pytesseract.image_to_string(img).strip()
-
-#Converts extracted text into TF-IDF vectors for classification.
+CT_MODEL_PATH = "lung_cancer_detection_model.h5"
+TEXT_MODEL_PATH = "lung_cancer_classifier.pkl"
+VECTORIZER_PATH = "tfidf_vectorizer.pkl"
+
+# Models, and everything built on them, are set up in two steps so a pre-forking server can share them:
+# preload_models() loads what is safe to share across a fork (once, in the master), init_worker() builds
+# the per-process TensorFlow runtime, background threads and warm-up (once per serving process).
+# Importing this module loads nothing: start_background_init() runs the setup in a thread while the
+# server already answers /healthz, and /readyz reports ready once it has finished.
+# See wsgi.py and gunicorn.conf.py; `python app.py` does the same.
+text_classifier = None
+tfidf_vectorizer = None
+tree_text_explainer = None
+ct_predict_fn = None
+ct_explainer = None
+ct_batcher = None
+batch_predictor = None
+job_queue = None
+readiness = Readiness()
+
+# Text explanations default to exact tree-path contributions; LIME stays available per request and as a fallback
+TEXT_EXPLAINER = os.environ.get("MEDREAD_TEXT_EXPLAINER", "tree")
+
+# Repeat uploads of the same file are answered from this cache; the fingerprint changes whenever a model file does
+result_cache = ResultCache()
+ct_model_file = CT_ARTIFACT or CT_MODEL_PATH
+models_fingerprint = None
+
+# Each request's PDF is kept under its own ID until the TTL sweeper removes it; MEDREAD_REPORT_RENDER
+# chooses whether it is rendered in the request, in a process pool, or on first download
+report_store = ReportStore()
+# With several workers (shared mode) a lazy report could only be rendered by the worker holding it
+if report_store.shared and REPORT_RENDER_MODE == "lazy":
+    logger.warning("MEDREAD_REPORT_RENDER=lazy is not supported with MEDREAD_SHARED_STATE, rendering reports in the pool")
+    report_renderer = ReportRenderer("pool")
+else:
+    report_renderer = ReportRenderer()
+
+# Regions of large pages and pages of multi-page reports are OCR'd in this pool of worker processes
+# (started with each serving process, see init_worker)
+ocr_pool = OCRPool()
+
+# Every pipeline stage is timed into the stage_duration_seconds histogram (see metrics.py and GET /metrics);
+# MEDREAD_PROFILE_SAMPLE_RATE additionally writes a full profile for a sample of predictions
+request_profiler = RequestProfiler()
+
+#Loads the models that are safe to share copy-on-write with forked workers: the text model (sklearn
+#pickles, or the memory-mapped compact export with MEDREAD_TEXT_RUNTIME=compact), the tree explainer
+#tables and, for the TFLite runtime, the CNN flatbuffer. Runs no TensorFlow ops.
+def preload_models():
+    global text_classifier, tfidf_vectorizer, tree_text_explainer, ct_predict_fn, models_fingerprint
+    # The LIME segmentation and OCR settings change results, so they are part of the fingerprint too
+    models_fingerprint = model_fingerprint([ct_model_file] + text_model_files(TEXT_MODEL_PATH, VECTORIZER_PATH),
+                                           extra=f"{CT_RUNTIME}|{TEXT_RUNTIME}|{Segmenter().describe()}|{describe_ocr()}")
+    text_classifier, tfidf_vectorizer = load_text_model(TEXT_MODEL_PATH, VECTORIZER_PATH)
+    try:
+        tree_text_explainer = TreeContributionExplainer(text_classifier, tfidf_vectorizer)
+    except (TypeError, AttributeError) as e:
+        tree_text_explainer = None
+        logger.warning(f"Tree text explainer unavailable, using LIME for text reports: {e}")
+    if CT_RUNTIME in FORK_SAFE_RUNTIMES:
+        ct_predict_fn = load_ct_predict_fn(CT_MODEL_PATH, num_threads=TF_INTRA_OP_THREADS or None)
+
+#Sets up this serving process: TensorFlow thread caps, the CNN runtime (unless it was preloaded),
+#the explainers, batchers and worker threads, then a warm-up inference before reporting ready.
+def init_worker():
+    global ct_predict_fn, ct_explainer, ct_batcher, batch_predictor, job_queue
+    try:
+        if text_classifier is None:
+            preload_models()
+        configure_tf_threads()
+        if ct_predict_fn is None:
+            # The CNN is served through a predict_fn; MEDREAD_CT_RUNTIME selects Keras, a frozen graph or TFLite
+            ct_predict_fn = load_ct_predict_fn(CT_MODEL_PATH)
+        ct_explainer = CTExplainer(ct_predict_fn)
+        ct_batcher = MicroBatcher(ct_predict_fn)
+        # Bulk predictions: OCR/routing in a process pool, CNN and text classifier in large batches
+        batch_predictor = BatchPredictor(ct_predict_fn, text_classifier, tfidf_vectorizer, CT_CLASS_LABELS,
+                                         explain_ct=explain_ct_tensor, explain_text=lambda text: explain_text(text)[0])
+        # Background workers for /predict?async=1
+        job_queue = InProcessJobQueue(run_prediction, state_dir=report_store.directory if report_store.shared else None)
+        report_store.start_sweeper()
+        metrics.start_publisher(cache_gauges)
+        ocr_pool.warm_up()
+        warm_up()
+    except Exception as e:
+        readiness.mark_failed(e)
+        logger.exception(f"Worker initialisation failed: {e}")
+        return
+    readiness.mark_ready(ct_runtime=CT_RUNTIME)
+    logger.info(f"Models loaded and warmed up (CT runtime: {CT_RUNTIME}, pid {os.getpid()})")
+
+#Runs init_worker() in a background thread so the server can start answering straight away.
+def start_background_init():
+    thread = threading.Thread(target=init_worker, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
+
+#Runs one inference through each model so graph tracing, interpreter allocation and NLTK loading
+#happen before the first request rather than during it.
+def warm_up():
+    ct_predict_fn(np.zeros((1, *CT_INPUT_SIZE, 3), dtype=np.float32))
+    text_classifier.predict_proba(preprocess_text("warm up"))
+
+#Resizes the decoded CT scan to CT_INPUT_SIZE (256x256 by default) and normalizes pixel values to [0,1], in a format suitable for model
+#input (no batch axis; the micro-batcher stacks requests together). The same tensor is the LIME input.
+def preprocess_ct_scan(upload):
+    return upload.ct_tensor()
+
+#Decides whether the decoded upload is a CT scan or a text report.
+#For text reports the OCR result is returned as well, so Tesseract only ever runs once per request;
+#the regions of a large page are read concurrently by the OCR pool.
+def detect_ct_or_text(upload):
+    return route_and_extract(upload.gray, read=ocr_pool.read_page)
+
+#Reads the per-request LIME quality/latency knobs (?num_samples=...&num_features=...), falling back to the defaults.
+def lime_options():
+    num_samples = request.values.get("num_samples", LIME_NUM_SAMPLES, type=int)
+    num_features = request.values.get("num_features", LIME_NUM_FEATURES, type=int)
+    return max(1, num_samples), max(1, num_features)
+
+#Normalises extracted text exactly like the training pipeline, then converts it into TF-IDF vectors for classification.
 def preprocess_text(text):
-    return tfidf_vectorizer.transform([text])
+    return tfidf_vectorizer.transform([text_preprocessing.preprocess_text(text)])
+
+#Reads the per-request text explanation backend (?text_explainer=tree|lime), falling back to the default.
+def text_explainer_option():
+    method = request.values.get("text_explainer", TEXT_EXPLAINER)
+    return method if method in ("tree", "lime") else TEXT_EXPLAINER
+
+#Reads whether the prediction should be explained (?explain=0 skips LIME / tree explanations).
+def explain_option():
+    return request.values.get("explain", "1") not in ("0", "false", "no")
+
+#Explains a text prediction as [(word, weight), ...] with the requested backend.
+#Returns the explanation and the backend that actually produced it.
+def explain_text(text, method=TEXT_EXPLAINER):
+    if method == "tree" and tree_text_explainer is not None:
+        try:
+            return tree_text_explainer.explain(text_preprocessing.preprocess_text(text)), "tree"
+        except Exception as e:
+            logger.warning(f"Tree text explanation failed, falling back to LIME: {e}")
+    return explain_lime(text), "lime"
 
 #Uses LIME to explain the classifier's predictions by showing important words influencing the decision.
 def explain_lime(text):
+    from lime.lime_text import LimeTextExplainer     # LIME explainer for text data (only needed for this fallback)
     explainer = LimeTextExplainer(class_names=list(text_classifier.classes_))
-    exp = explainer.explain_instance(text, lambda x: text_classifier.predict_proba(tfidf_vectorizer.transform(x)), num_features=10, num_samples=500)
+    exp = explainer.explain_instance(text, lambda x: text_classifier.predict_proba(tfidf_vectorizer.transform(text_preprocessing.preprocess_batch(x))), num_features=10, num_samples=500)
     return exp.as_list()
 
-def generate_pdf(output_path, report_type, predicted_class, probability=None, extracted_text=None, lime_explanation=None, img_path=None, lime_img_path=None):
-    doc = SimpleDocTemplate(output_path, pagesize=letter)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    elements.append(Paragraph("<b>Lung Cancer Detection Report</b>", styles["Title"]))
-    elements.append(Spacer(1, 12))
-    elements.append(Paragraph(f"Type: {report_type}", bold_title_style()))
-    elements.append(Spacer(1, 6))
-    elements.append(Paragraph(f"Predicted Class: {predicted_class}", styles["Normal"]))
-    elements.append(Spacer(1, 12))
-
-    if report_type == "CT scan":
-        elements.append(Paragraph(f"Prediction Probability: {probability:.4f}", styles["Normal"]))
-        elements.append(Spacer(1, 6))
-        if lime_img_path:
-            elements.append(Paragraph("LIME Explanation (CT Scan):", bold_title_style()))
-            elements.append(Spacer(1, 6))
-            elements.append(Image(lime_img_path, width=200, height=200))
-    else:
-        elements.append(Paragraph("Extracted Text:", bold_title_style()))
-        elements.append(Spacer(1, 6))
-        elements.append(Paragraph(extracted_text, styles["Normal"]))
-        elements.append(Spacer(1, 12))
-        
-        elements.append(Paragraph("LIME Explanation:", bold_title_style()))
-        elements.append(Spacer(1, 6))
-        for word, weight in lime_explanation:
-            elements.append(Paragraph(f"{word}: {weight:.4f}", styles["Normal"]))
-            elements.append(Spacer(1, 6))
-
-    doc.build(elements)
-    return output_path
+#Stores the report (bytes, or a report still being rendered) under a new ID and returns the response
+#with its per-request download link.
+def with_report(response, pdf):
+    report_id = new_report_id()
+    report_store.put(report_id, pdf)
+    return dict(response, report_id=report_id, pdf_report=f"/download_report/{report_id}")
+
+#Adds a report that is still rendering in the pool (a Future) to the result cache entry once it is done,
+#so later hits serve the stored PDF instead of rendering it again. Bytes are cached by the caller and lazy
+#reports stay unrendered until downloaded.
+def cache_pdf_when_rendered(key, response, pdf, lime_image=None):
+    if not hasattr(pdf, "add_done_callback"):
+        return
+
+    def store(future):
+        if not future.cancelled() and future.exception() is None:
+            result_cache.put(key, response, pdf=future.result(), lime_image=lime_image)
+
+    pdf.add_done_callback(store)
+
+#Counts a successful prediction by result type and predicted class; `source` is "model" or "cache".
+def record_prediction(response, source):
+    result_type = "ct" if response["type"] == "CT scan" else "text"
+    metrics.increment("predictions_total", type=result_type, predicted_class=response["predicted_class"], source=source)
+
+#Runs the full pipeline (cache lookup, OCR/routing, inference, explanation, PDF) for one upload.
+#Returns (response_dict, status_code); `progress` is called with the name of each stage as it starts.
+#With explain=False the explanation stage is skipped and the report has no explanation.
+def run_prediction(data, num_samples, num_features, text_explainer=TEXT_EXPLAINER, explain=True, progress=None):
+    with request_profiler.profile("predict"):
+        response, status_code = _run_prediction(data, num_samples, num_features, text_explainer, explain, progress or (lambda stage: None))
+    if status_code != 200:
+        metrics.increment("prediction_errors_total", status=status_code)
+    return response, status_code
+
+def _run_prediction(data, num_samples, num_features, text_explainer, explain, progress):
+    try:
+        key = cache_key(data, models_fingerprint, num_samples=num_samples, num_features=num_features, text_explainer=text_explainer, explain=explain)
+        cached = result_cache.get(key)
+        if cached is not None:
+            pdf = cached["pdf"]
+            if pdf is None:
+                pdf = report_renderer.submit(cached["response"], cached["lime_image"])
+                cache_pdf_when_rendered(key, cached["response"], pdf, cached["lime_image"])
+            record_prediction(cached["response"], "cache")
+            return with_report(cached["response"], pdf), 200
+
+        # Multi-page TIFFs, PDFs and zip archives of slices are read page by page
+        if is_document(data):
+            return predict_document(key, Document(data), num_samples, num_features, text_explainer, explain, progress)
+
+        # Decode once, in memory; routing/OCR and the CNN both work from this buffer
+        with metrics.timer("decode"):
+            upload = DecodedUpload.from_bytes(data)
+
+        progress("ocr")
+        image_type, ocr_result = detect_ct_or_text(upload)
+
+        if image_type == "ct":
+            progress("inference")
+            img2 = preprocess_ct_scan(upload)
+            with metrics.timer("cnn_inference"):        # Queueing in the micro-batcher plus the forward pass
+                prediction = ct_batcher.predict(img2)
+            return respond_ct(key, img2, prediction, num_samples, num_features, explain, progress)
+        return respond_text(key, ocr_result.text, text_explainer, explain, progress, details={"ocr": ocr_result.summary()})
+    except UploadError as e:
+        return {"status": "error", "message": str(e)}, e.status_code
+    except Exception as e:
+        logger.error(f"Error during prediction: {e}")
+        return {"status": "error", "message": str(e)}, 500
+
+#Finishes a CT prediction from the CNN output: LIME explanation of `img`, response, report and cache entry.
+#`details` are extra response fields (e.g. the slices of a study).
+def respond_ct(key, img, prediction, num_samples, num_features, explain, progress, details=None):
+    predicted_class = int(np.argmax(prediction))
+    class_labels = CT_CLASS_LABELS
+    probability = float(np.max(prediction))
+
+    # Generate LIME explanation (vectorized perturbations, batched compiled inference, early stopping)
+    lime_image = None
+    if explain:
+        progress("explanation")
+        with metrics.timer("lime"):
+            explanation = ct_explainer.explain(img, num_samples=num_samples, num_features=num_features)
+            explanation_image = explanation.render()
+        logger.info(f"CT LIME explanation used {explanation.num_samples_used}/{num_samples} samples")
+
+        # Encode the LIME explanation image in memory
+        with metrics.timer("lime_image_encode"):
+            lime_image = encode_lime_image(explanation_image)
+
+    progress("report")
+    response = {"status": "success", "type": "CT scan", "predicted_class": class_labels[predicted_class], "probability": probability, **(details or {})}
+    pdf = report_renderer.submit(response, lime_image)
+    result_cache.put(key, response, pdf=pdf if isinstance(pdf, bytes) else None, lime_image=lime_image)
+    cache_pdf_when_rendered(key, response, pdf, lime_image)
+    record_prediction(response, "model")
+    return with_report(response, pdf), 200
+
+#Finishes a text prediction from the OCR output: TF-IDF, classification, explanation, response, report and
+#cache entry. `details` are extra response fields (e.g. the page count of a document).
+def respond_text(key, extracted_text, text_explainer, explain, progress, details=None):
+    progress("inference")
+    with metrics.timer("tfidf"):
+        processed_text = preprocess_text(extracted_text)
+    with metrics.timer("text_classifier"):
+        text_prediction = text_classifier.predict(processed_text)[0]
+    lime_explanation, explanation_method = [], None
+    if explain:
+        progress("explanation")
+        with metrics.timer("text_explanation", method=text_explainer):
+            lime_explanation, explanation_method = explain_text(extracted_text, text_explainer)
+    progress("report")
+    response = {"status": "success", "type": "Text report", "extracted_text": extracted_text, "predicted_class": str(text_prediction), "lime_explanation": lime_explanation, "explanation_method": explanation_method, **(details or {})}
+    pdf = report_renderer.submit(response)
+    result_cache.put(key, response, pdf=pdf if isinstance(pdf, bytes) else None)
+    cache_pdf_when_rendered(key, response, pdf)
+    record_prediction(response, "model")
+    return with_report(response, pdf), 200
+
+#Predicts a multi-page upload. A report has its pages OCR'd in parallel and is classified once on the
+#joined text; a stack of CT slices (or a document without text) is scored in CNN batches and aggregated
+#into one study-level prediction, explained on its key slice.
+def predict_document(key, document, num_samples, num_features, text_explainer, explain, progress):
+    progress("ocr")
+    with metrics.timer("routing"):
+        looks_like_ct = classify_by_statistics(document.first_page().gray) == "ct"
+    if not looks_like_ct:
+        with metrics.timer("ocr", source="document"):
+            results = ocr_pool.extract_pages(page.gray for page in document.pages())
+        ocr_result = merge_results(results)
+        if ocr_result.text:
+            return respond_text(key, ocr_result.text, text_explainer, explain, progress,
+                                details={"pages": len(results), "ocr": ocr_result.summary()})
+
+    progress("inference")
+    study = score_study(document.pages(), ct_predict_fn)
+    details = {
+        "slices": len(study.slice_probabilities),
+        "aggregation": study.aggregation,
+        "key_slice": study.key_slice,
+        "slice_predictions": [{"slice": index, "predicted_class": CT_CLASS_LABELS[int(np.argmax(row))], "probability": float(np.max(row))}
+                              for index, row in enumerate(study.slice_probabilities)],
+    }
+    return respond_ct(key, study.key_tensor, study.probabilities, num_samples, num_features, explain, progress, details=details)
+
+#LIME image (JPEG bytes) for one preprocessed CT tensor, used by batch requests with explanations.
+def explain_ct_tensor(img):
+    return encode_lime_image(ct_explainer.explain(img).render())
+
+# Room for the multipart headers around a single file of MAX_UPLOAD_BYTES
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+#Answer for prediction routes while this process is still loading its models.
+def not_ready():
+    if readiness.error:
+        return jsonify({"status": "error", "message": f"Models failed to load: {readiness.error}"}), 503
+    return jsonify({"status": "error", "message": "Models are still loading"}), 503, {"Retry-After": "5"}
 
 @app.route('/predict', methods=['POST'])
 def predict():
+    if not readiness.is_ready():
+        return not_ready()
+    # Oversized bodies are refused from the Content-Length header, before the upload is read
+    request.max_content_length = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD
     if 'file' not in request.files:
         return jsonify({"status": "error", "message": "No file part"}), 400
 
@@ -123,70 +363,146 @@ def predict():
     if file.filename == '':
         return jsonify({"status": "error", "message": "No selected file"}), 400
 
+    data = file.read()
     try:
-        with tempfile.NamedTemporaryFile(suffix=".jpg", delete=False) as temp_file:
-            file.save(temp_file.name)
-            img_path = temp_file.name
-
-        image_type = detect_ct_or_text(img_path)
-        pdf_path = os.path.join(tempfile.gettempdir(), "report.pdf")
-
-        if image_type == "ct":
-            img = preprocess_ct_scan(img_path)
-            img2 = preprocess_ct_scan2(img_path)
-            prediction = ct_scan_model.predict(img)
-            predicted_class = np.argmax(prediction, axis=1)[0]
-            class_labels = ['Benign', 'Malignant', 'Normal']
-            probability = float(np.max(prediction))
-            
-            # Generate LIME explanation
-            explainer = LimeImageExplainer()
-            explanation = explainer.explain_instance(
-                img2.astype('double'),  # Convert to double precision
-                ct_scan_model.predict,
-                top_labels=5,
-                hide_color=0,
-                num_samples=1000
-            )
-
-            # Extract the explanation image and mask
-            temp, mask = explanation.get_image_and_mask(
-                explanation.top_labels[0], 
-                positive_only=True, 
-                num_features=10, 
-                hide_rest=False
-            )
-
-            # Convert the explanation into a properly visualized image
-            explanation_image = mark_boundaries(temp, mask)
-
-            # Save the LIME explanation image
-            lime_output_path = os.path.join(tempfile.gettempdir(), "lime_explanation.jpg")
-            plt.imsave(lime_output_path, explanation_image)
-
-
-            generate_pdf(pdf_path, "CT scan", class_labels[predicted_class], probability=probability, lime_img_path=lime_output_path)
-            return jsonify({"status": "success", "type": "CT scan", "predicted_class": class_labels[predicted_class], "probability": probability, "pdf_report": "/download_report"}), 200
-        else:
-            extracted_text = extract_text(img_path)
-            processed_text = preprocess_text(extracted_text)
-            text_prediction = text_classifier.predict(processed_text)[0]
-            lime_explanation = explain_lime(extracted_text)
-            generate_pdf(pdf_path, "Text report", text_prediction, extracted_text=extracted_text, lime_explanation=lime_explanation)
-            return jsonify({"status": "success", "type": "Text report", "extracted_text": extracted_text, "predicted_class": text_prediction, "lime_explanation": lime_explanation, "pdf_report": "/download_report"}), 200
+        validate_upload(data)
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status_code
+    num_samples, num_features = lime_options()
+    text_explainer = text_explainer_option()
+    explain = explain_option()
+
+    # Async mode: queue the work and hand back a job ID to poll
+    if request.args.get("async") in ("1", "true", "yes"):
+        try:
+            job_id = job_queue.submit(data, num_samples, num_features, text_explainer, explain)
+        except QueueFull as e:
+            return jsonify({"status": "error", "message": str(e)}), 429, {"Retry-After": "5"}
+        return jsonify({"status": "queued", "job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+    response, status_code = run_prediction(data, num_samples, num_features, text_explainer=text_explainer, explain=explain)
+    return jsonify(response), status_code
+
+#Predicts a whole set of uploads: several `files` parts and/or zip archives of images.
+#Results are streamed back as NDJSON, one line per item, as soon as each batch completes.
+#?explain=1 adds explanations and ?pdf=1 stores a report per item (linked via `pdf_report`).
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    if not readiness.is_ready():
+        return not_ready()
+    request.max_content_length = MAX_BATCH_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD
+    uploads = request.files.getlist('files') + request.files.getlist('file')
+    if not uploads:
+        return jsonify({"status": "error", "message": "No files uploaded"}), 400
+
+    # Archives are checked against the size limits up front but decompressed lazily, one entry at a
+    # time as the predictor's window of items in flight allows
+    sources = []
+    try:
+        for upload in uploads:
+            name, data = upload.filename or "upload", upload.read()
+            if name.lower().endswith(".zip"):
+                sources.append(iter_zip_items(data))
+            elif is_image_name(name):
+                sources.append([(name, data)])
+    except UploadError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status_code
+    items = itertools.chain.from_iterable(sources)
+    first = next(items, None)
+    if first is None:
+        return jsonify({"status": "error", "message": "No images found in the upload"}), 400
+    items = itertools.chain([first], items)
+
+    explain = request.args.get("explain") in ("1", "true", "yes")
+    pdf_sink = (lambda result, lime_image: with_report({}, report_renderer.submit(result, lime_image))) if request.args.get("pdf") in ("1", "true", "yes") else None
+
+    def generate():
+        for result in batch_predictor.predict(items, explain=explain, pdf_sink=pdf_sink):
+            yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+#Uploads over the request size limit get a JSON error like every other rejection.
+@app.errorhandler(413)
+def request_too_large(e):
+    limit = MAX_BATCH_UPLOAD_BYTES if request.path == "/predict/batch" else MAX_UPLOAD_BYTES
+    return jsonify({"status": "error", "message": f"Upload exceeds {limit} bytes"}), 413
+
+#Reports the progress of an async prediction job and, once it has finished, its result.
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if job_queue is None:
+        return not_ready()
+    status = job_queue.status(job_id)
+    if status is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(status), 200
+
+#Streams the report generated for one /predict request, waiting for it (or rendering it) if needed.
+@app.route('/download_report/<report_id>', methods=['GET'])
+def download_report(report_id):
+    try:
+        stored = report_store.get(report_id)
     except Exception as e:
-        logger.error(f"Error during prediction: {e}")
-        return jsonify({"status": "error", "message": str(e)}), 500
-    finally:
-        if os.path.exists(img_path):
-            os.remove(img_path)
-
-@app.route('/download_report', methods=['GET'])
-def download_report():
-    pdf_path = os.path.join(tempfile.gettempdir(), "report.pdf")
-    if os.path.exists(pdf_path):
-        return send_file(pdf_path, as_attachment=True)
-    return jsonify({"status": "error", "message": "Report not found"}), 404
-
+        logger.error(f"Report {report_id} could not be rendered: {e}")
+        return jsonify({"status": "error", "message": "Report could not be generated"}), 500
+    if stored is None:
+        return jsonify({"status": "error", "message": "Report not found"}), 404
+    kind, value = stored
+    source = BytesIO(value) if kind == "bytes" else value
+    return send_file(source, mimetype="application/pdf", as_attachment=True, download_name="report.pdf")
+
+#Times every request into http_request_duration_seconds{endpoint, method, status}. For the streamed
+#/predict/batch response this only covers the time until streaming starts.
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    started = g.get("request_started")
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started, buckets=metrics.LATENCY_SECONDS_BUCKETS,
+                        endpoint=endpoint, method=request.method, status=response.status_code)
+    return response
+
+#Exports the in-process metrics (stage latencies, prediction counts, cache hits/misses, ...) in the
+#Prometheus text format, or as JSON with ?format=json.
+#With MEDREAD_METRICS_DIR (set by gunicorn.conf.py) the numbers are summed over every worker.
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if metrics.METRICS_DIR:
+        data = metrics.aggregate(gauges=cache_gauges())
+    else:
+        data = dict(metrics.snapshot(), gauges=cache_gauges(), processes=1)
+    if request.args.get("format") == "json":
+        gauges = data["gauges"]
+        cache = {"entries": gauges.get("result_cache_entries", 0), "bytes": gauges.get("result_cache_bytes", 0),
+                 "max_bytes": gauges.get("result_cache_max_bytes", 0)}
+        return jsonify(dict(data, cache=cache)), 200
+    return Response(metrics.prometheus_text(data=data), mimetype="text/plain; version=0.0.4"), 200
+
+#Result cache sizes, exported as gauges.
+def cache_gauges():
+    cache_stats = result_cache.stats()
+    return {"result_cache_entries": cache_stats["entries"], "result_cache_bytes": cache_stats["bytes"],
+            "result_cache_max_bytes": cache_stats["max_bytes"]}
+
+#Liveness: the process is up and serving HTTP (models may still be loading).
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "alive", "pid": os.getpid()}), 200
+
+#Readiness: 200 only once this process has loaded its models and run a warm-up inference.
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    return jsonify(readiness.status()), 200 if readiness.is_ready() else 503
+
+# Development server. MEDREAD_DEBUG=1 turns on Flask's debugger and reloader; the reloader serves from a
+# child process (WERKZEUG_RUN_MAIN set), and only that process loads the models and starts the pools.
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    debug = os.environ.get("MEDREAD_DEBUG", "0") in ("1", "true", "yes")
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_init()
+    app.run(debug=debug, use_reloader=debug, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -0,0 +1,117 @@
+# Bulk predictions over a folder (or zip archive) of scans and scanned reports, without the web server.
+#
+# Usage (from medread_backend/):
+#   python batch_cli.py path/to/folder --output results.ndjson --pdf-dir reports/ --explain
+#
+# Writes one JSON line per image to --output (stdout by default). The same BatchPredictor as
+# POST /predict/batch is used: decoding and OCR run in a process pool, the models run in large batches.
+
+import argparse                             # For the command line interface
+import json                                 # For NDJSON output
+import os                                   # For path handling
+import sys                                  # For stdout
+import time                                 # For the throughput summary
+
+from batch_predict import BATCH_CNN_SIZE, BATCH_TEXT_SIZE, BatchPredictor, iter_directory_items, iter_zip_items
+from uploads import UploadError
+from cnn_runtime import CT_CLASS_LABELS, load_ct_predict_fn
+from compact_text_model import load_text_model
+from reports import REPORT_RENDER_WORKERS, ReportRenderer, render_response_pdf
+
+CT_MODEL_PATH = "lung_cancer_detection_model.h5"
+TEXT_MODEL_PATH = "lung_cancer_classifier.pkl"
+VECTORIZER_PATH = "tfidf_vectorizer.pkl"
+
+# The command line has the machine to itself: one decode/OCR process per core
+CLI_WORKERS = int(os.environ.get("MEDREAD_BATCH_WORKERS", os.cpu_count() or 1))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Predict every image in a folder or zip archive.")
+    parser.add_argument("input", help="Folder of images or a .zip archive")
+    parser.add_argument("--output", help="NDJSON output file (default: stdout)")
+    parser.add_argument("--pdf-dir", help="Write one PDF report per image into this folder")
+    parser.add_argument("--explain", action="store_true", help="Include LIME / tree explanations")
+    parser.add_argument("--workers", type=int, default=CLI_WORKERS, help="Decode/OCR worker processes")
+    parser.add_argument("--cnn-batch-size", type=int, default=BATCH_CNN_SIZE)
+    parser.add_argument("--text-batch-size", type=int, default=BATCH_TEXT_SIZE)
+    parser.add_argument("--report-workers", type=int, default=REPORT_RENDER_WORKERS, help="PDF render processes")
+    return parser.parse_args()
+
+
+#Builds the predictor from the model files, with explainers only when they are requested.
+def build_predictor(args):
+    ct_predict_fn = load_ct_predict_fn(CT_MODEL_PATH)
+    text_classifier, tfidf_vectorizer = load_text_model(TEXT_MODEL_PATH, VECTORIZER_PATH)
+
+    explain_ct = explain_text = None
+    if args.explain:
+        import text_preprocessing
+        from lime_engine import CTExplainer
+        from reports import encode_lime_image
+        from text_explainer import TreeContributionExplainer
+
+        ct_explainer = CTExplainer(ct_predict_fn)
+        tree_explainer = TreeContributionExplainer(text_classifier, tfidf_vectorizer)
+        explain_ct = lambda img: encode_lime_image(ct_explainer.explain(img).render())
+        explain_text = lambda text: tree_explainer.explain(text_preprocessing.preprocess_text(text))
+
+    return BatchPredictor(ct_predict_fn, text_classifier, tfidf_vectorizer, CT_CLASS_LABELS,
+                          explain_ct=explain_ct, explain_text=explain_text, workers=args.workers,
+                          cnn_batch_size=args.cnn_batch_size, text_batch_size=args.text_batch_size)
+
+
+#Returns a pdf_sink that renders each report in the renderer's process pool and writes it, named after
+#the image, once it is done. Call renderer.close() to wait for the outstanding reports.
+def pdf_writer(pdf_dir, renderer):
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    def sink(result, lime_image):
+        path = os.path.join(pdf_dir, result["name"].replace("/", "_").replace("\\", "_") + ".pdf")
+
+        def write(future):
+            if future.exception() is not None:
+                print(f"Report for {result['name']} failed: {future.exception()}", file=sys.stderr)
+                return
+            with open(path, "wb") as f:
+                f.write(future.result())
+
+        renderer.pool().submit(render_response_pdf, dict(result), lime_image).add_done_callback(write)
+        return {"pdf_path": path}
+
+    return sink
+
+
+def main():
+    args = parse_args()
+    if args.input.lower().endswith(".zip"):
+        with open(args.input, "rb") as f:
+            try:
+                items = iter_zip_items(f.read())
+            except UploadError as e:
+                sys.exit(f"{args.input}: {e}")
+    else:
+        items = iter_directory_items(args.input)
+
+    predictor = build_predictor(args)
+    renderer = ReportRenderer("pool", workers=args.report_workers)
+    pdf_sink = pdf_writer(args.pdf_dir, renderer) if args.pdf_dir else None
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    start, count = time.perf_counter(), 0
+    try:
+        for result in predictor.predict(items, explain=args.explain, pdf_sink=pdf_sink):
+            output.write(json.dumps(result) + "\n")
+            count += 1
+    finally:
+        predictor.close()
+        renderer.close()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{count} items in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f} items/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
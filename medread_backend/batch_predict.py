@@ -0,0 +1,218 @@
+# Bulk prediction for archives of scans and OCR'd reports.
+#
+# Used by POST /predict/batch and by batch_cli.py. Decoding, routing and OCR run in a process pool
+# (one Tesseract per core: all cores for batch_cli.py, this worker's share of them when serving); routed items are then grouped so the CNN sees large batches and the
+# text classifier transforms and scores many reports in one call. Explanations and PDFs are
+# optional. Results are yielded one by one as each group completes, ready to be streamed as NDJSON.
+#
+# Only a bounded window of items is in flight at any time, so memory stays flat on large archives.
+# This module deliberately does not import TensorFlow: worker processes only need OpenCV and
+# Tesseract.
+
+import logging                              # For worker failure logging
+import multiprocessing                      # For the spawn context of the process pool
+import os                                   # For configuration and directory walking
+import threading                            # To start the pool once across request threads
+import zipfile                              # For zip uploads
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from io import BytesIO                      # For reading zip uploads from memory
+
+import numpy as np                          # For batching tensors
+
+import text_preprocessing                   # Same text normalisation as training
+from ocr import route_and_extract           # Single-pass routing + OCR
+from serving import worker_core_share       # Per-worker core budget under a pre-forking server
+from uploads import DecodedUpload, UploadError, check_archive_sizes, validate_upload  # Same validation and in-memory decode as /predict
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get("MEDREAD_BATCH_WORKERS", worker_core_share()))
+BATCH_CNN_SIZE = int(os.environ.get("MEDREAD_BATCH_CNN_SIZE", 64))
+BATCH_TEXT_SIZE = int(os.environ.get("MEDREAD_BATCH_TEXT_SIZE", 256))
+BATCH_MAX_ITEMS = int(os.environ.get("MEDREAD_BATCH_MAX_ITEMS", 10000))
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+#True for file names the batch pipeline knows how to decode.
+def is_image_name(name):
+    return name.lower().endswith(IMAGE_SUFFIXES)
+
+
+#Checks a zip archive held in memory against the archive size limits (raising UploadError) and returns
+#a generator of (name, bytes) for its images. Entries are decompressed one at a time, as the predictor
+#reaches them; an entry that cannot be read comes through as (name, UploadError).
+def iter_zip_items(data):
+    try:
+        archive = zipfile.ZipFile(BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise UploadError(f"Not a readable zip archive: {e}") from None
+    infos = [info for info in archive.infolist() if not info.is_dir() and is_image_name(info.filename)]
+    try:
+        check_archive_sizes(infos)
+    except UploadError:
+        archive.close()
+        raise
+    return _read_zip_items(archive, infos)
+
+
+def _read_zip_items(archive, infos):
+    with archive:
+        for info in infos:
+            try:
+                yield info.filename, archive.read(info)
+            except zipfile.BadZipFile as e:
+                yield info.filename, UploadError(f"{info.filename} in the archive is corrupt: {e}")
+
+
+#Yields (relative name, path) for every image under a directory; files are read by the workers.
+def iter_directory_items(root):
+    for dirname, _, filenames in os.walk(root):
+        for filename in sorted(filenames):
+            if is_image_name(filename):
+                path = os.path.join(dirname, filename)
+                yield os.path.relpath(path, root), path
+
+
+#Worker: decodes one item, routes it, and returns either the CT tensor (uint8) or the OCR text.
+#`source` is the file content (bytes) or a path to read. Failures come back as error items: some
+#library exceptions (e.g. pytesseract's) cannot be unpickled and would otherwise break the pool.
+def prepare_item(name, source):
+    try:
+        return _prepare_item(name, source)
+    except Exception as e:
+        return {"name": name, "status": "error", "message": str(e)}
+
+
+def _prepare_item(name, source):
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            source = f.read()
+    validate_upload(source)
+    upload = DecodedUpload.from_bytes(source)
+
+    image_type, ocr_result = route_and_extract(upload.gray)
+    if image_type == "ct":
+        return {"name": name, "type": "ct", "tensor": upload.ct_pixels()}
+    return {"name": name, "type": "text", "text": ocr_result.text, "ocr": ocr_result.summary()}
+
+
+class BatchPredictor:
+    """Routes a stream of items through the process pool and scores them in large model batches."""
+
+    def __init__(self, ct_predict_fn, text_classifier, tfidf_vectorizer, ct_class_labels,
+                 explain_ct=None, explain_text=None, workers=BATCH_WORKERS,
+                 cnn_batch_size=BATCH_CNN_SIZE, text_batch_size=BATCH_TEXT_SIZE):
+        # explain_ct(tensor_float32) -> JPEG bytes of the LIME image; explain_text(text) -> [(word, weight), ...]
+        self.ct_predict_fn = ct_predict_fn
+        self.text_classifier = text_classifier
+        self.tfidf_vectorizer = tfidf_vectorizer
+        self.ct_class_labels = ct_class_labels
+        self.explain_ct = explain_ct
+        self.explain_text = explain_text
+        self.workers = max(1, workers)
+        self.cnn_batch_size = cnn_batch_size
+        self.text_batch_size = text_batch_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    # The pool is created on first use and reused; "spawn" keeps TensorFlow out of the workers. One
+    # predictor serves every /predict/batch request thread, so creation is locked
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    # Yields one result dict per item; `items` is any iterable of (name, bytes or path), consumed as the
+    # window of items in flight allows. When PDFs are requested, `pdf_sink(result, lime_image)` renders
+    # (or schedules) the report for the result and returns extra fields to merge into it (e.g. a
+    # download link or a file path); lime_image is the CT explanation JPEG or None.
+    def predict(self, items, explain=False, pdf_sink=None):
+        pending_ct, pending_text = [], []
+        in_flight, names = set(), {}
+        window = self.workers * 4
+        pool = self.pool()
+
+        for count, (name, source) in enumerate(items):
+            if count >= BATCH_MAX_ITEMS:
+                yield {"name": name, "status": "error", "message": f"Batch limit of {BATCH_MAX_ITEMS} items reached"}
+                break
+            if isinstance(source, Exception):
+                yield {"name": name, "status": "error", "message": str(source)}
+                continue
+            future = pool.submit(prepare_item, name, source)
+            in_flight.add(future)
+            names[future] = name
+            if len(in_flight) >= window:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from self._collect(done, names, pending_ct, pending_text, explain, pdf_sink)
+
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from self._collect(done, names, pending_ct, pending_text, explain, pdf_sink)
+        yield from self._flush_ct(pending_ct, explain, pdf_sink)
+        yield from self._flush_text(pending_text, explain, pdf_sink)
+
+    def _collect(self, done, names, pending_ct, pending_text, explain, pdf_sink):
+        for future in done:
+            name = names.pop(future)
+            try:
+                item = future.result()
+            except Exception as e:
+                logger.error(f"Batch worker failed on {name}: {e}")
+                yield {"name": name, "status": "error", "message": str(e)}
+                continue
+            if item.get("status") == "error":
+                yield item
+            elif item["type"] == "ct":
+                pending_ct.append(item)
+            else:
+                pending_text.append(item)
+
+        if len(pending_ct) >= self.cnn_batch_size:
+            yield from self._flush_ct(pending_ct, explain, pdf_sink)
+        if len(pending_text) >= self.text_batch_size:
+            yield from self._flush_text(pending_text, explain, pdf_sink)
+
+    def _flush_ct(self, pending, explain, pdf_sink):
+        if not pending:
+            return
+        batch, pending[:] = list(pending), []
+        x = np.stack([item["tensor"] for item in batch]).astype(np.float32) / 255.0
+        probabilities = np.asarray(self.ct_predict_fn(x))
+        for i, item in enumerate(batch):
+            predicted_class = self.ct_class_labels[int(np.argmax(probabilities[i]))]
+            probability = float(np.max(probabilities[i]))
+            result = {"name": item["name"], "status": "success", "type": "CT scan",
+                      "predicted_class": predicted_class, "probability": probability}
+            lime_image = self.explain_ct(x[i]) if explain and self.explain_ct else None
+            if pdf_sink is not None:
+                result.update(pdf_sink(result, lime_image))
+            yield result
+
+    def _flush_text(self, pending, explain, pdf_sink):
+        if not pending:
+            return
+        batch, pending[:] = list(pending), []
+        texts = [item["text"] for item in batch]
+        features = self.tfidf_vectorizer.transform(text_preprocessing.preprocess_batch(texts))
+        probabilities = self.text_classifier.predict_proba(features)
+        classes = self.text_classifier.classes_
+        for i, item in enumerate(batch):
+            predicted_class = str(classes[int(np.argmax(probabilities[i]))])
+            result = {"name": item["name"], "status": "success", "type": "Text report",
+                      "extracted_text": item["text"], "predicted_class": predicted_class, "ocr": item["ocr"]}
+            explanation = self.explain_text(item["text"]) if explain and self.explain_text else None
+            if explanation is not None:
+                result["lime_explanation"] = explanation
+            if pdf_sink is not None:
+                result.update(pdf_sink(result, None))
+            yield result
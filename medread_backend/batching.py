@@ -0,0 +1,73 @@
+# Dynamic micro-batching for CNN inference.
+#
+# Each /predict call used to run its own batch-of-one forward pass. MicroBatcher instead collects
+# preprocessed tensors from concurrent requests for up to MEDREAD_BATCH_MAX_WAIT_MS milliseconds or
+# MEDREAD_BATCH_MAX_SIZE items, runs a single batched forward pass, and hands every caller its own
+# row of the output. The first request of a batch never waits longer than the configured window.
+# Batch sizes, queue waits and forward-pass times are recorded as histograms for tuning (see /metrics).
+
+import os                                   # For reading configuration from the environment
+import queue                                # For the request queue
+import threading                            # For the batching thread
+import time                                 # For the wait window
+from concurrent.futures import Future       # To hand results back to waiting callers
+
+import numpy as np                          # For stacking tensors into a batch
+
+import metrics                              # For batch-size and wait-time histograms
+
+BATCH_MAX_SIZE = int(os.environ.get("MEDREAD_BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("MEDREAD_BATCH_MAX_WAIT_MS", 5))
+
+WAIT_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+
+class MicroBatcher:
+    """Groups single-sample predict calls from many threads into batched forward passes."""
+
+    def __init__(self, predict_fn, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name="cnn"):
+        # predict_fn takes a (batch, ...) float32 array and returns a (batch, classes) array
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+
+    # Predicts one sample (no batch axis) and returns its output row; blocks until the batch has run
+    def predict(self, sample):
+        future = Future()
+        self._queue.put((np.asarray(sample, dtype=np.float32), future, time.perf_counter()))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            metrics.observe("cnn_batch_size", len(batch), model=self.name)
+            for _, _, enqueued in batch:
+                metrics.observe("cnn_batch_wait_seconds", started - enqueued, buckets=WAIT_SECONDS_BUCKETS, model=self.name)
+
+            try:
+                with metrics.timer("cnn_forward", model=self.name):
+                    outputs = self.predict_fn(np.stack([sample for sample, _, _ in batch]))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for row, (_, future, _) in zip(outputs, batch):
+                future.set_result(row)
@@ -0,0 +1,115 @@
+# Benchmark: cold start of the backend process.
+#
+# Starts the server (wsgi.py under Flask's threaded server) in a fresh process and measures, from
+# process launch:
+#   * time to first healthy     - first 200 from GET /healthz (process up and serving HTTP);
+#   * time to ready             - first 200 from GET /readyz (models loaded and warmed up);
+#   * time to first prediction  - first 200 from POST /predict with a synthetic CT slice.
+# Each run uses a new process; medians over --runs are printed.
+#
+# Usage (from medread_backend/, next to the model files):
+#     python benchmarks/bench_cold_start.py --runs 3
+# Use --cwd to point at a folder holding the models if they live elsewhere.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_ocr_routing import make_ct_image  # noqa: E402
+
+
+#Returns the HTTP status of a request, or None while the server is not accepting connections.
+def status_of(req):
+    try:
+        with urllib.request.urlopen(req, timeout=600) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+#Builds a multipart/form-data POST /predict request for one image; extra keyword arguments become
+#query parameters (e.g. explain=0).
+def predict_request(base_url, image_bytes, num_samples=None, filename="ct.png", **params):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode() + image_bytes + f"\r\n--{boundary}--\r\n".encode()
+    if num_samples:
+        params["num_samples"] = num_samples
+    url = f"{base_url}/predict" + (f"?{urllib.parse.urlencode(params)}" if params else "")
+    return urllib.request.Request(url, data=body, method="POST",
+                                  headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+#Polls until make_request() answers 200; returns the elapsed time since `start`.
+def wait_for_200(make_request, start, timeout, interval=0.05):
+    while time.perf_counter() - start < timeout:
+        if status_of(make_request()) == 200:
+            return time.perf_counter() - start
+        time.sleep(interval)
+    raise TimeoutError("server did not answer 200 in time")
+
+
+def cold_start(args, port, image_bytes):
+    base_url = f"http://127.0.0.1:{port}"
+    command = [sys.executable, "-c",
+               f"from wsgi import application; application.run(host='127.0.0.1', port={port}, threaded=True)"]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    env.pop("MEDREAD_FORKING_SERVER", None)
+
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=args.cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        healthy = wait_for_200(lambda: f"{base_url}/healthz", start, args.timeout)
+        ready = wait_for_200(lambda: f"{base_url}/readyz", start, args.timeout)
+        first_prediction = wait_for_200(lambda: predict_request(base_url, image_bytes, args.num_samples),
+                                        start, args.timeout)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_healthy_s": healthy, "ready_s": ready, "first_prediction_s": first_prediction}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--cwd", default=BACKEND_DIR, help="Folder containing the model files")
+    parser.add_argument("--num-samples", type=int, help="LIME samples for the first prediction")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "ct.png")
+        make_ct_image(path)
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+
+    runs = [cold_start(args, args.port, image_bytes) for _ in range(args.runs)]
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    if args.json:
+        print(json.dumps({"runs": runs, "median": summary}, indent=2))
+        return
+    print(f"{'metric':<22} {'median s':>10}")
+    for key, value in summary.items():
+        print(f"{key:<22} {value:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+# Benchmark: end-to-end /predict and /download_report latency, throughput and memory.
+#
+# The backend is driven with synthetic uploads generated locally (CT-like slices and rendered text
+# reports; no dataset needed) in two modes:
+#   * "client" - through the Flask test client inside this process (no HTTP in the way);
+#   * "server" - over HTTP against a real local server (wsgi.py under Flask's threaded server).
+# Every scenario - CT or text path, with or without explanations (?explain=0), at each concurrency
+# level - sends --requests uploads nobody has sent before, so the result cache never answers, and
+# downloads each report. Per scenario the results hold:
+#   * p50/p95/p99/mean latency of /predict and of /download_report, throughput and error count;
+#   * the peak RSS of the serving process (a high-water mark, so it only grows across scenarios);
+#   * the mean time per pipeline stage (decode, routing, OCR, CNN, LIME, PDF build, ...), taken from
+#     the backend's own /metrics before and after the scenario. Both modes serve from one process, and
+#     MEDREAD_METRICS_DIR is unset for it, so the two snapshots cover exactly the scenario's requests
+#     (aggregated multi-worker metrics would include other processes' published, up to
+#     MEDREAD_METRICS_PUBLISH_INTERVAL old, values).
+# Model loading is reported per mode as the time until the backend is ready to predict.
+#
+# Results are printed as JSON, or written to --output. --compare BASELINE.json prints the change of
+# every scenario against an earlier run and exits with status 1 when a p50 latency got slower by more
+# than --tolerance (20% by default), so two commits can be compared directly.
+#
+# Usage (from medread_backend/, next to the model files):
+#     python benchmarks/bench_e2e.py --mode both --requests 20 --concurrency 1,4 --output bench.json
+#     python benchmarks/bench_e2e.py --mode server --output new.json --compare bench.json
+# The text path needs the Tesseract binary; without it those scenarios only count errors.
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_cold_start import predict_request, status_of, wait_for_200  # noqa: E402
+from bench_ocr_routing import REPORT_LINES, make_ct_image, make_text_image  # noqa: E402
+
+PATHS = ("ct", "text")
+
+
+#Builds `count` distinct uploads for one path as (filename, bytes); `first_seed` keeps scenarios apart.
+def make_uploads(kind, count, first_seed=0):
+    uploads = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for seed in range(first_seed, first_seed + count):
+            path = os.path.join(workdir, f"{kind}{seed}.png")
+            if kind == "ct":
+                make_ct_image(path, seed=seed)
+            else:
+                lines = list(REPORT_LINES)
+                lines[1] = f"Findings: A {5 + seed % 40} mm spiculated nodule, right upper lobe (case {seed})."
+                make_text_image(path, lines=lines)
+            with open(path, "rb") as f:
+                uploads.append((os.path.basename(path), f.read()))
+    return uploads
+
+
+#Latency percentiles in milliseconds (None when nothing succeeded).
+def latency_summary(seconds):
+    if not seconds:
+        return None
+    ms = np.asarray(seconds) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean())}
+
+
+#Total time and count per stage from a /metrics?format=json snapshot.
+def stage_totals(snapshot):
+    totals = {}
+    for histogram in snapshot["histograms"]:
+        if histogram["name"] == "stage_duration_seconds":
+            stage = histogram["labels"]["stage"]
+            total, count = totals.get(stage, (0.0, 0))
+            totals[stage] = (total + histogram["sum"], count + histogram["count"])
+    return totals
+
+
+#Mean milliseconds per stage for the observations made between two snapshots.
+def stage_means(before, after):
+    means = {}
+    for stage, (total, count) in sorted(after.items()):
+        previous_total, previous_count = before.get(stage, (0.0, 0))
+        if count > previous_count:
+            means[stage] = {"mean_ms": (total - previous_total) / (count - previous_count) * 1000,
+                            "count": count - previous_count}
+    return means
+
+
+class ClientTarget:
+    """The backend imported into this process and driven through the Flask test client."""
+
+    mode = "client"
+
+    def __init__(self, cwd):
+        os.environ.pop("MEDREAD_METRICS_DIR", None)
+        os.chdir(cwd)
+        sys.path.insert(0, BACKEND_DIR)
+        start = time.perf_counter()
+        import app as backend
+        backend.init_worker()
+        if not backend.readiness.is_ready():
+            raise RuntimeError(f"Models failed to load: {backend.readiness.error}")
+        self.load_s = time.perf_counter() - start
+        self.backend = backend
+        self._local = threading.local()
+
+    # One test client per benchmark thread
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.backend.app.test_client()
+        return client
+
+    def predict(self, filename, data, params):
+        response = self._client().post("/predict", query_string=params, data={"file": (BytesIO(data), filename)})
+        return response.status_code, response.get_json(silent=True)
+
+    def download(self, url):
+        response = self._client().get(url)
+        response.get_data()
+        return response.status_code
+
+    def metrics(self):
+        return self._client().get("/metrics?format=json").get_json()
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    def peak_rss_mb(self):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    def close(self):
+        self.backend.report_renderer.close()
+
+
+class ServerTarget:
+    """A real server process (wsgi.py under Flask's threaded server) driven over HTTP."""
+
+    mode = "server"
+
+    def __init__(self, cwd, port, timeout):
+        self.base_url = f"http://127.0.0.1:{port}"
+        command = [sys.executable, "-c",
+                   f"from wsgi import application; application.run(host='127.0.0.1', port={port}, threaded=True)"]
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+        env.pop("MEDREAD_FORKING_SERVER", None)
+        env.pop("MEDREAD_CACHE_DIR", None)
+        env.pop("MEDREAD_METRICS_DIR", None)
+
+        start = time.perf_counter()
+        self.server = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.load_s = wait_for_200(lambda: f"{self.base_url}/readyz", start, timeout)
+        except Exception:
+            self.close()
+            raise
+
+    def predict(self, filename, data, params):
+        request = predict_request(self.base_url, data, filename=filename, **params)
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    def download(self, url):
+        return status_of(self.base_url + url)
+
+    def metrics(self):
+        with urllib.request.urlopen(f"{self.base_url}/metrics?format=json", timeout=60) as response:
+            return json.loads(response.read())
+
+    # High-water mark of the server process from /proc (Linux only)
+    def peak_rss_mb(self):
+        try:
+            with open(f"/proc/{self.server.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def close(self):
+        self.server.terminate()
+        self.server.wait()
+
+
+#Sends every upload once (plus untimed warm-up uploads) at the given concurrency and summarises the run.
+def run_scenario(target, uploads, warmup, explain, concurrency, num_samples):
+    params = {"explain": "1" if explain else "0"}
+    if num_samples:
+        params["num_samples"] = num_samples
+
+    def one(upload):
+        filename, data = upload
+        start = time.perf_counter()
+        status, body = target.predict(filename, data, params)
+        predict_s = time.perf_counter() - start
+        if status != 200 or not body:
+            return False, predict_s, None
+        start = time.perf_counter()
+        downloaded = target.download(body["pdf_report"]) == 200
+        return downloaded, predict_s, time.perf_counter() - start
+
+    for upload in warmup:
+        one(upload)
+    before = stage_totals(target.metrics())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, uploads))
+    wall_s = time.perf_counter() - start
+
+    succeeded = [result for result in results if result[0]]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "wall_s": wall_s,
+        "throughput_rps": len(succeeded) / wall_s,
+        "predict": latency_summary([predict_s for _, predict_s, _ in succeeded]),
+        "download": latency_summary([download_s for _, _, download_s in succeeded]),
+        "peak_rss_mb": target.peak_rss_mb(),
+        "stages": stage_means(before, stage_totals(target.metrics())),
+    }
+
+
+def scenario_id(result):
+    return f"{result['mode']}/{result['path']}/{'explain' if result['explain'] else 'no-explain'}/c{result['concurrency']}"
+
+
+#Runs every scenario against one target and returns the result rows.
+def run_mode(target, args, seeds):
+    rows = []
+    for path, explain, concurrency in itertools.product(args.paths, (True, False), args.concurrency):
+        first_seed = next(seeds)
+        uploads = make_uploads(path, args.warmup + args.requests, first_seed=first_seed * 100000)
+        row = {"mode": target.mode, "path": path, "explain": explain, "concurrency": concurrency}
+        row.update(run_scenario(target, uploads[args.warmup:], uploads[:args.warmup], explain, concurrency,
+                                args.num_samples))
+        print(f"{scenario_id(row):<32} p50 {format_ms(row['predict'])}  {row['throughput_rps']:.2f} req/s  "
+              f"{row['errors']} errors", file=sys.stderr)
+        rows.append(row)
+    return rows
+
+
+def format_ms(summary, key="p50_ms"):
+    return f"{summary[key]:9.1f} ms" if summary else "      n/a   "
+
+
+#Prints the p50 change of every scenario against a baseline run; returns the scenarios over tolerance.
+def compare(results, baseline, tolerance):
+    previous = {scenario_id(row): row for row in baseline["scenarios"]}
+    regressions = []
+    print(f"{'scenario':<32} {'baseline p50':>13} {'p50':>13} {'change':>8}", file=sys.stderr)
+    for row in results["scenarios"]:
+        old = previous.get(scenario_id(row))
+        if not old or not old["predict"] or not row["predict"]:
+            continue
+        change = row["predict"]["p50_ms"] / old["predict"]["p50_ms"] - 1
+        flag = "  SLOWER" if change > tolerance else ""
+        print(f"{scenario_id(row):<32} {format_ms(old['predict'])} {format_ms(row['predict'])} {change:>+7.0%}{flag}",
+              file=sys.stderr)
+        if change > tolerance:
+            regressions.append(scenario_id(row))
+    return regressions
+
+
+#Identifies the code being measured: the git commit of the backend, if it is a git checkout.
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end backend benchmark")
+    parser.add_argument("--mode", choices=("client", "server", "both"), default="both")
+    parser.add_argument("--paths", default="ct,text", help="Comma-separated subset of ct,text")
+    parser.add_argument("--requests", type=int, default=20, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed requests before each scenario")
+    parser.add_argument("--concurrency", default="1,4", help="Comma-separated concurrency levels")
+    parser.add_argument("--num-samples", type=int, help="LIME samples per CT explanation (server default if unset)")
+    parser.add_argument("--cwd", default=BACKEND_DIR, help="Folder containing the model files")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the server to be ready")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p50 slowdown before --compare fails")
+    args = parser.parse_args()
+    args.paths = [path for path in args.paths.split(",") if path in PATHS]
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    args.cwd = os.path.abspath(args.cwd)
+    args.output = args.output and os.path.abspath(args.output)     # The client mode changes directory
+    args.compare = args.compare and os.path.abspath(args.compare)
+    os.environ.pop("MEDREAD_CACHE_DIR", None)   # Results must never come from an earlier run's disk cache
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {"requests": args.requests, "warmup": args.warmup, "num_samples": args.num_samples,
+                     "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith("MEDREAD_")}},
+        "model_load_s": {},
+        "scenarios": [],
+    }
+    seeds = itertools.count()
+    # The server runs first: once the client mode has imported the backend, this process holds TensorFlow
+    for mode in ("server", "client"):
+        if args.mode not in (mode, "both"):
+            continue
+        target = ServerTarget(args.cwd, args.port, args.timeout) if mode == "server" else ClientTarget(args.cwd)
+        try:
+            results["model_load_s"][mode] = target.load_s
+            results["scenarios"] += run_mode(target, args, seeds)
+        finally:
+            target.close()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) slower than the baseline by more than {args.tolerance:.0%}",
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Benchmark: CT explanation latency and fidelity per segmentation option.
+#
+# For each option (algorithm x segmentation scale) the CNN is explained with CTExplainer on a set of
+# synthetic CT slices and the report shows:
+#   * segmentation and total explanation time (cold, i.e. segment cache miss), and the time of a
+#     repeat explanation of the same image (segment cache hit);
+#   * the number of superpixels;
+#   * agreement of the top-10 positive regions with the full-resolution quickshift baseline, as the
+#     IoU of the highlighted pixel masks (the segments themselves differ between options).
+# The same sampling seed is used for every option.
+#
+# Usage (from medread_backend/, next to the model files):
+#     python benchmarks/bench_lime_segmentation.py --images 5 --num-samples 1000
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_ocr_routing import make_ct_image  # noqa: E402
+from cnn_runtime import load_ct_predict_fn  # noqa: E402
+from lime_engine import CTExplainer  # noqa: E402
+from segmentation import Segmenter  # noqa: E402
+from uploads import DecodedUpload  # noqa: E402
+
+OPTIONS = [
+    ("quickshift", 1.0),
+    ("quickshift", 0.5),
+    ("slic", 1.0),
+    ("slic", 0.5),
+    ("grid", 1.0),
+]
+
+
+#IoU of two boolean masks (1.0 when both are empty).
+def iou(a, b):
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+#Synthetic CT slices decoded exactly like uploads, as (256, 256, 3) float32 tensors.
+def make_images(count):
+    images = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for seed in range(count):
+            path = os.path.join(workdir, f"ct{seed}.png")
+            make_ct_image(path, seed=seed)
+            with open(path, "rb") as f:
+                images.append(DecodedUpload.from_bytes(f.read()).ct_tensor())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIME segmentation latency/fidelity benchmark")
+    parser.add_argument("--model", default="lung_cancer_detection_model.h5")
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--num-samples", type=int, default=1000)
+    parser.add_argument("--num-features", type=int, default=10)
+    args = parser.parse_args()
+
+    predict_fn = load_ct_predict_fn(args.model)
+    images = make_images(args.images)
+    predict_fn(images[0][None])                 # Trace/allocate before timing
+
+    baseline_masks = None
+    print(f"{'option':<16} {'segments':>8} {'seg ms':>8} {'cold ms':>9} {'cached ms':>10} {'top-10 IoU':>11}")
+    for method, scale in OPTIONS:
+        segmenter = Segmenter(method, scale)
+        explainer = CTExplainer(predict_fn, seed=0, segmenter=segmenter)
+        seg_ms, cold_ms, cached_ms, counts, masks = [], [], [], [], []
+        for img in images:
+            start = time.perf_counter()
+            segments = segmenter(img)
+            seg_ms.append((time.perf_counter() - start) * 1000)
+            segmenter._cache.clear()
+
+            start = time.perf_counter()
+            explanation = explainer.explain(img, num_samples=args.num_samples, num_features=args.num_features)
+            cold_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            explainer.explain(img, num_samples=args.num_samples, num_features=args.num_features)
+            cached_ms.append((time.perf_counter() - start) * 1000)
+
+            counts.append(int(segments.max()) + 1)
+            masks.append(explanation.image_and_mask(args.num_features)[1].astype(bool))
+
+        if baseline_masks is None:
+            baseline_masks = masks
+        overlap = statistics.mean(iou(a, b) for a, b in zip(masks, baseline_masks))
+        print(f"{segmenter.describe():<16} {statistics.mean(counts):>8.0f} {statistics.median(seg_ms):>8.1f} "
+              f"{statistics.median(cold_ms):>9.1f} {statistics.median(cached_ms):>10.1f} {overlap:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# Benchmark: OCR latency and quality of scanned report pages, before and after the OCR engine.
+#
+# Synthetic A4 report pages are rendered locally (no dataset needed) at --dpi, slightly rotated
+# (--skew) and with scanner noise, then read by:
+#   * baseline - pytesseract.image_to_string on the raw page, the original OCR stage;
+#   * engine   - ocr_engine.read_page in this process: preprocessing (downscale to MEDREAD_OCR_DPI,
+#                binarization, deskew), regions read one after the other, word confidences;
+#   * pool     - ocr.OCRPool.read_page: the same regions read concurrently by --workers warm workers.
+# With --pages N, an N-page report is also read page by page (baseline) and through
+# OCRPool.extract_pages. For every variant it reports p50 latency, word recall against the rendered
+# text and, where available, the mean word confidence. Preprocessing and tiling times are printed
+# separately since they run without Tesseract.
+#
+# Usage (from medread_backend/):
+#     python benchmarks/bench_ocr.py --dpi 300 --skew 1.5 --workers 4 --pages 4
+
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_engine  # noqa: E402
+from ocr import OCRPool  # noqa: E402
+
+REPORT_LINES = [
+    "RADIOLOGY REPORT - CHEST CT WITH CONTRAST",
+    "Findings: A 14 mm spiculated nodule is seen in the right upper lobe.",
+    "There is no mediastinal or hilar lymphadenopathy. No pleural effusion.",
+    "The airways are patent. Mild centrilobular emphysema in both upper lobes.",
+    "Impression: Suspicious for primary lung malignancy.",
+    "Recommend PET-CT and tissue sampling. Comparison with prior imaging advised.",
+]
+
+
+#Renders a white A4 page of report text at `dpi`, rotated by `skew` degrees, with Gaussian noise.
+def make_report_page(dpi=300, skew=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    page = np.full((height, width), 255, dtype=np.uint8)
+    scale, step = dpi / 300.0, int(60 * dpi / 300.0)
+    lines = []
+    for i in range(int((height - 2 * step) / step)):
+        line = REPORT_LINES[(i + seed) % len(REPORT_LINES)]
+        cv2.putText(page, line, (int(120 * scale), step * (i + 2)), cv2.FONT_HERSHEY_SIMPLEX, 1.1 * scale, 0,
+                    max(1, int(2 * scale)), cv2.LINE_AA)
+        lines.append(line)
+    if skew:
+        page = ocr_engine._rotate(page, skew, cv2.INTER_LINEAR)
+    page = np.clip(page.astype(np.float32) + rng.normal(0, 18, page.shape), 0, 255).astype(np.uint8)
+    return page, " ".join(lines)
+
+
+#Fraction of the rendered words that come back, in order.
+def word_recall(expected, text):
+    expected_words, words = expected.split(), text.split()
+    matcher = difflib.SequenceMatcher(a=expected_words, b=words, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / max(1, len(expected_words))
+
+
+def baseline(page):
+    import pytesseract
+    return pytesseract.image_to_string(page).strip()
+
+
+def time_calls(fn, repeats):
+    timings, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR engine benchmark")
+    parser.add_argument("--dpi", type=int, default=300, help="Resolution the pages are rendered at")
+    parser.add_argument("--skew", type=float, default=1.5, help="Page rotation in degrees")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pages", type=int, default=0, help="Also read an N-page report")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    page, expected = make_report_page(args.dpi, args.skew)
+    (processed, dpi), preprocess_s = time_calls(lambda: ocr_engine.preprocess_page(page), args.repeats)
+    regions, split_s = time_calls(lambda: ocr_engine.split_regions(processed), args.repeats)
+    print(f"page {page.shape[1]}x{page.shape[0]} at {args.dpi} dpi, skew {args.skew} deg "
+          f"(estimated {-ocr_engine.estimate_skew(ocr_engine.binarize(page)):.1f}); "
+          f"preprocess {preprocess_s * 1000:.0f} ms -> {processed.shape[1]}x{processed.shape[0]} at {dpi} dpi, "
+          f"{len(regions)} regions in {split_s * 1000:.0f} ms; engine {ocr_engine.engine().describe()}")
+
+    pool = OCRPool(args.workers)
+    pool.warm_up()
+    variants = [
+        ("baseline", lambda: baseline(page)),
+        ("engine", lambda: ocr_engine.read_page(page)),
+        ("pool", lambda: pool.read_page(page)),
+    ]
+    if args.pages:
+        pages = [make_report_page(args.dpi, args.skew, seed=i) for i in range(args.pages)]
+        expected_pages = " ".join(text for _, text in pages)
+        variants += [
+            (f"{args.pages} pages, baseline", lambda: "\n\n".join(baseline(p) for p, _ in pages)),
+            (f"{args.pages} pages, pool", lambda: ocr_engine.merge_results(pool.extract_pages(p for p, _ in pages))),
+        ]
+
+    print(f"{'variant':<22} {'p50 s':>8} {'words':>7} {'recall':>7} {'mean conf':>10} {'low-conf runs':>14}")
+    try:
+        for name, fn in variants:
+            result, seconds = time_calls(fn, args.repeats)
+            reference = expected_pages if "pages" in name else expected
+            if isinstance(result, str):
+                print(f"{name:<22} {seconds:>8.2f} {len(result.split()):>7} {word_recall(reference, result):>7.3f} "
+                      f"{'-':>10} {'-':>14}")
+            else:
+                summary = result.summary()
+                print(f"{name:<22} {seconds:>8.2f} {summary['words']:>7} {word_recall(reference, result.text):>7.3f} "
+                      f"{summary['mean_confidence'] or 0:>10.1f} {len(summary['low_confidence_runs']):>14}")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Benchmark: per-request OCR latency before and after the single-pass OCR stage.
+#
+# "before" reproduces the original /predict behaviour: detect_ct_or_text decodes the file and runs
+# a full Tesseract pass just to decide text vs CT, then extract_text decodes it again and runs
+# Tesseract a second time. "after" uses ocr.route_and_extract, which decodes once, skips OCR for
+# images the statistics check recognises as CT, and runs Tesseract at most once.
+#
+# Synthetic CT-like and text-report images are generated locally, so no dataset is needed.
+#
+# Usage (from medread_backend/):
+#     python benchmarks/bench_ocr_routing.py --repeats 10
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import pytesseract
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ocr import load_grayscale, route_and_extract  # noqa: E402
+
+
+#Draws a dark CT-like slice: black background, grey body ellipse and two darker lung fields.
+def make_ct_image(path, size=512, seed=0):
+    rng = np.random.default_rng(seed)
+    img = np.zeros((size, size), dtype=np.uint8)
+    centre = (size // 2, size // 2)
+    cv2.ellipse(img, centre, (int(size * 0.42), int(size * 0.32)), 0, 0, 360, 150, -1)
+    cv2.ellipse(img, (int(size * 0.35), size // 2), (int(size * 0.1), int(size * 0.2)), 0, 0, 360, 40, -1)
+    cv2.ellipse(img, (int(size * 0.65), size // 2), (int(size * 0.1), int(size * 0.2)), 0, 0, 360, 40, -1)
+    noise = rng.normal(0, 12, img.shape)
+    img = np.clip(img.astype(np.float32) + noise * (img > 0), 0, 255).astype(np.uint8)
+    cv2.imwrite(path, img)
+
+
+REPORT_LINES = [
+    "RADIOLOGY REPORT - CHEST CT",
+    "Findings: A 14 mm spiculated nodule is seen in the right upper lobe.",
+    "No mediastinal lymphadenopathy. No pleural effusion.",
+    "Impression: Suspicious for primary lung malignancy.",
+    "Recommend PET-CT and tissue sampling.",
+]
+
+
+#Renders a white page with a few lines of radiology-report text.
+def make_text_image(path, width=1240, height=1754, lines=REPORT_LINES):
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for i, line in enumerate(lines):
+        cv2.putText(img, line, (60, 120 + i * 60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+    cv2.imwrite(path, img)
+
+
+#The original two-pass implementation, kept here as the baseline.
+def before(img_path):
+    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    image_type = "text" if pytesseract.image_to_string(img).strip() else "ct"
+    extracted_text = None
+    if image_type == "text":
+        img = cv2.imread(img_path)
+        extracted_text = pytesseract.image_to_string(img).strip()
+    return image_type, extracted_text
+
+
+def after(img_path):
+    return route_and_extract(load_grayscale(img_path))
+
+
+def time_calls(fn, img_path, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(img_path)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR routing latency benchmark")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        samples = {
+            "ct": os.path.join(workdir, "ct.png"),
+            "text": os.path.join(workdir, "text.png"),
+        }
+        make_ct_image(samples["ct"])
+        make_text_image(samples["text"])
+
+        print(f"{'input':<6} {'variant':<8} {'route':<6} {'p50 ms':>10} {'mean ms':>10}")
+        for name, path in samples.items():
+            baseline_ms = None
+            for label, fn in (("before", before), ("after", after)):
+                (route, _), timings = time_calls(fn, path, args.repeats)
+                p50 = statistics.median(timings)
+                print(f"{name:<6} {label:<8} {route:<6} {p50:>10.1f} {statistics.mean(timings):>10.1f}")
+                if baseline_ms is None:
+                    baseline_ms = p50
+                else:
+                    print(f"{name:<6} speedup  {baseline_ms / max(p50, 1e-6):>24.1f}x")
+
+
+if __name__ == "__main__":
+    main()
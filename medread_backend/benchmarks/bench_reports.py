@@ -0,0 +1,121 @@
+# Benchmark: PDF report throughput (reports/sec).
+#
+# "before" reproduces the original generate_pdf: a fresh getSampleStyleSheet() for the report and
+# another one for every heading, the LIME image written to and re-read from a temp file, and images
+# ASCII85-encoded (reportlab's default). "sync" is reports.render_response_pdf on one thread (styles
+# built once, image from bytes, binary image streams), and "pool" renders the same reports through
+# ReportRenderer's process pool.
+# Half of the reports are CT reports with a 256x256 LIME image, half are text reports.
+#
+# Usage (from medread_backend/):
+#     python benchmarks/bench_reports.py --reports 200 --workers 4
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reports import ReportRenderer, encode_lime_image, render_response_pdf  # noqa: E402
+
+REPORT_TEXT = ("Findings: A 2.1 cm spiculated nodule is seen in the right upper lobe with associated "
+               "mediastinal lymphadenopathy. Impression: Findings are suspicious for primary lung malignancy. ") * 4
+
+
+#Builds `count` prediction responses (alternating CT and text) and one LIME image.
+def make_reports(count):
+    rng = np.random.default_rng(0)
+    lime_image = encode_lime_image(rng.random((256, 256, 3)))
+    explanation = [(word, float(weight)) for word, weight in zip(
+        ["nodule", "spiculated", "malignancy", "lymphadenopathy", "lobe", "mass", "suspicious", "upper", "cm", "primary"],
+        rng.normal(size=10))]
+    reports = []
+    for i in range(count):
+        if i % 2 == 0:
+            reports.append(({"type": "CT scan", "predicted_class": "Malignant", "probability": 0.93}, lime_image))
+        else:
+            reports.append(({"type": "Text report", "predicted_class": "Malignant", "extracted_text": REPORT_TEXT,
+                             "lime_explanation": explanation}, None))
+    return reports
+
+
+#The original implementation, kept here only as the baseline.
+def render_before(response, lime_image, workdir):
+    from reportlab import rl_config
+    use_a85, rl_config.useA85 = rl_config.useA85, 1
+    try:
+        return _render_before(response, lime_image, workdir)
+    finally:
+        rl_config.useA85 = use_a85
+
+
+def _render_before(response, lime_image, workdir):
+    from io import BytesIO
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer
+
+    def bold_title_style():
+        bold_style = getSampleStyleSheet()["Heading2"]
+        bold_style.fontName = "Helvetica-Bold"
+        return bold_style
+
+    output = BytesIO()
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = getSampleStyleSheet()
+    elements = [Paragraph("<b>Lung Cancer Detection Report</b>", styles["Title"]), Spacer(1, 12),
+                Paragraph(f"Type: {response['type']}", bold_title_style()), Spacer(1, 6),
+                Paragraph(f"Predicted Class: {response['predicted_class']}", styles["Normal"]), Spacer(1, 12)]
+    if response["type"] == "CT scan":
+        lime_path = os.path.join(workdir, "lime_explanation.jpg")
+        with open(lime_path, "wb") as f:
+            f.write(lime_image)
+        elements += [Paragraph(f"Prediction Probability: {response['probability']:.4f}", styles["Normal"]), Spacer(1, 6),
+                     Paragraph("LIME Explanation (CT Scan):", bold_title_style()), Spacer(1, 6),
+                     Image(lime_path, width=200, height=200)]
+    else:
+        elements += [Paragraph("Extracted Text:", bold_title_style()), Spacer(1, 6),
+                     Paragraph(response["extracted_text"], styles["Normal"]), Spacer(1, 12),
+                     Paragraph("LIME Explanation:", bold_title_style()), Spacer(1, 6)]
+        for word, weight in response["lime_explanation"]:
+            elements += [Paragraph(f"{word}: {weight:.4f}", styles["Normal"]), Spacer(1, 6)]
+    doc.build(elements)
+    return output.getvalue()
+
+
+def throughput(fn, reports):
+    start = time.perf_counter()
+    fn(reports)
+    return len(reports) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF report throughput benchmark")
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    reports = make_reports(args.reports)
+    renderer = ReportRenderer("pool", workers=args.workers)
+    # Start the pool and warm every worker before timing
+    list(renderer.pool().map(render_response_pdf, *zip(*make_reports(args.workers * 2))))
+    render_response_pdf(*reports[0])
+
+    with tempfile.TemporaryDirectory() as workdir:
+        variants = [
+            ("before", lambda batch: [render_before(r, img, workdir) for r, img in batch]),
+            ("sync", lambda batch: [render_response_pdf(r, img) for r, img in batch]),
+            (f"pool x{args.workers}", lambda batch: [f.result() for f in [renderer.submit(r, img) for r, img in batch]]),
+        ]
+        print(f"{'variant':<10} {'reports/s':>10}")
+        for name, fn in variants:
+            print(f"{name:<10} {throughput(fn, reports):>10.1f}")
+    renderer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# Benchmark: text classifier serving formats (MEDREAD_TEXT_RUNTIME=sklearn vs compact).
+#
+# For each format a fresh process loads the classifier and vectorizer and reports:
+#   * load time            - load_text_model() wall time;
+#   * RSS after loading    - growth of the resident set, and how much of it is private (anonymous)
+#                            memory; memory-mapped pages are file-backed and shared between workers;
+#   * latency              - median TF-IDF + predict_proba time per call at each --batch-sizes.
+# The compact export is created first (in a temporary folder) if --artifact does not exist yet.
+#
+# Usage (from medread_backend/, next to the model files):
+#     python benchmarks/bench_text_model.py --texts reports.txt
+# --texts is a file with one report per line; without it the bench uses a few synthetic reports.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_ocr_routing import REPORT_LINES  # noqa: E402
+
+TEXT_MODEL_PATH = "lung_cancer_classifier.pkl"
+VECTORIZER_PATH = "tfidf_vectorizer.pkl"
+
+
+#Resident and private (anonymous) memory of this process in bytes, from /proc (Linux only).
+def memory_bytes():
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("VmRSS", "RssAnon"):
+                values[key] = int(rest.split()[0]) * 1024
+    return values.get("VmRSS", 0), values.get("RssAnon", 0)
+
+
+#Runs in the child process: loads one format and times it.
+def measure(args):
+    import numpy as np
+    import scipy.sparse  # noqa: F401  (imported up front so it is not counted as model memory)
+    import sklearn.ensemble  # noqa: F401
+    from compact_text_model import load_text_model
+
+    with open(args.texts_file) as f:
+        texts = json.load(f)
+    rss_before, anon_before = memory_bytes()
+    t0 = time.perf_counter()
+    classifier, vectorizer = load_text_model(args.model, args.vectorizer, runtime=args.runtime, artifact=args.artifact)
+    load_seconds = time.perf_counter() - t0
+
+    latency = {}
+    for batch_size in args.batch_sizes:
+        batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+        classifier.predict_proba(vectorizer.transform(batch))           # Warm-up (page faults, memos)
+        timings = []
+        for _ in range(args.repeats):
+            t0 = time.perf_counter()
+            classifier.predict_proba(vectorizer.transform(batch))
+            timings.append(time.perf_counter() - t0)
+        latency[str(batch_size)] = statistics.median(timings) * 1000.0
+    rss_after, anon_after = memory_bytes()
+    print(json.dumps({"runtime": args.runtime, "load_s": load_seconds,
+                      "rss_mb": (rss_after - rss_before) / 1e6, "private_mb": (anon_after - anon_before) / 1e6,
+                      "latency_ms": latency, "classes": np.asarray(classifier.classes_).tolist()}))
+
+
+def run_format(args, runtime, artifact, texts_file):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--runtime", runtime, "--artifact", artifact,
+               "--texts-file", texts_file, "--model", args.model, "--vectorizer", args.vectorizer,
+               "--repeats", str(args.repeats), "--batch-sizes", *map(str, args.batch_sizes)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=os.getcwd()).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text model serving format benchmark")
+    parser.add_argument("--model", default=TEXT_MODEL_PATH)
+    parser.add_argument("--vectorizer", default=VECTORIZER_PATH)
+    parser.add_argument("--artifact", default="text_model_compact", help="Compact export (created if missing)")
+    parser.add_argument("--texts", help="Reports to classify, one per line")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--runtime", help=argparse.SUPPRESS)
+    parser.add_argument("--texts-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args)
+        return
+
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+    else:
+        texts = [" ".join(REPORT_LINES[1:]), " ".join(REPORT_LINES[2:4]), REPORT_LINES[1]]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        artifact = args.artifact
+        if not os.path.exists(os.path.join(artifact, "model.json")):
+            import joblib
+            from compact_text_model import export_compact
+            artifact = os.path.join(workdir, "text_model_compact")
+            export_compact(joblib.load(args.model), joblib.load(args.vectorizer), artifact)
+        texts_file = os.path.join(workdir, "texts.json")
+        with open(texts_file, "w") as f:
+            json.dump(texts, f)
+        results = [run_format(args, runtime, os.path.abspath(artifact), texts_file) for runtime in ("sklearn", "compact")]
+
+    if results[0]["classes"] != results[1]["classes"]:
+        raise SystemExit("The two formats report different classes")
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    columns = [f"batch {size} ms" for size in args.batch_sizes]
+    print(f"{'runtime':<10} {'load ms':>9} {'rss MB':>8} {'private MB':>11} " + " ".join(f"{c:>13}" for c in columns))
+    for result in results:
+        print(f"{result['runtime']:<10} {result['load_s'] * 1000:>9.1f} {result['rss_mb']:>8.1f} {result['private_mb']:>11.1f} "
+              + " ".join(f"{result['latency_ms'][str(size)]:>13.2f}" for size in args.batch_sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Startup profile: where the time goes when the backend module is imported.
+#
+# Runs `python -X importtime -c "import app"` in a fresh interpreter (models are not loaded at import)
+# and groups the cumulative time of the module's direct imports by top-level package, so heavy
+# dependencies that are pulled in eagerly stand out.
+#
+# Usage (from medread_backend/):
+#     python benchmarks/startup_profile.py --module app --top 15
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "import time:      self [us] |  cumulative | imported package"
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+#Imports `module` in a fresh interpreter with -X importtime; returns [(depth, name, cumulative_us)].
+def profile_import(module):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append(((len(match.group(3)) - 1) // 2, match.group(4), int(match.group(2))))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time breakdown of the backend")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    rows = profile_import(args.module)
+    # importtime lists children before their parent: the module's direct imports are the rows one
+    # level deeper than it, between the previous top-level row and the module's own row
+    end = max(i for i, (depth, name, _) in enumerate(rows) if depth == 0 and name == args.module)
+    by_package = defaultdict(int)
+    for depth, name, cumulative in reversed(rows[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            by_package[name.split(".")[0]] += cumulative
+    total = rows[end][2]
+
+    print(f"import {args.module}: {total / 1e6:.2f}s")
+    print(f"{'package':<24} {'seconds':>8} {'share':>7}")
+    for name, cumulative in sorted(by_package.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{name:<24} {cumulative / 1e6:>8.2f} {cumulative / max(total, 1):>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
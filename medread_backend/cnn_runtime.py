@@ -0,0 +1,129 @@
+# Inference runtimes for the CT scan CNN.
+#
+# The backend can serve the CNN from:
+#   * "keras"  - the original lung_cancer_detection_model.h5, wrapped in a compiled tf.function;
+#   * "frozen" - a frozen GraphDef (.pb) produced by models/cnn/export_model.py;
+#   * "tflite" - a TFLite float16 or int8 dynamic-range artifact produced by the same tool.
+# Pick one with MEDREAD_CT_RUNTIME and point MEDREAD_CT_ARTIFACT at the exported file (with "keras",
+# MEDREAD_CT_ARTIFACT optionally selects another .h5, e.g. lung_cancer_detection_model_lightweight.h5).
+# Every runtime is exposed as the same predict_fn: a (batch, H, W, 3) float32 array in, (batch, 3) out,
+# which is what the micro-batcher and the LIME engine consume. H x W is uploads.CT_INPUT_SIZE
+# (MEDREAD_CT_INPUT_SIZE): 256 for the reference model, 128 for the lightweight one.
+
+import json                                 # For the export metadata sidecar
+import os                                   # For reading configuration from the environment
+import threading                            # For per-thread TFLite interpreters
+
+import numpy as np                          # For array conversion
+
+from uploads import CT_INPUT_SIZE           # The size uploads are resized to for the CNN
+
+# TensorFlow is imported when a runtime is built, not when this module is imported: it dominates
+# the backend's startup time and forked workers must not initialise it before the fork.
+
+CT_RUNTIME = os.environ.get("MEDREAD_CT_RUNTIME", "keras")
+CT_ARTIFACT = os.environ.get("MEDREAD_CT_ARTIFACT")
+
+RUNTIMES = ("keras", "frozen", "tflite")
+
+# Runtimes whose artifact can be loaded before a fork and shared copy-on-write: loading a TFLite model
+# only reads the flatbuffer, interpreters are created lazily in whichever process uses them
+FORK_SAFE_RUNTIMES = ("tflite",)
+
+# Output order of the CNN's softmax (see categories in models/cnn/cnn_model.py)
+CT_CLASS_LABELS = ['Benign', 'Malignant', 'Normal']
+
+
+#Wraps a Keras model in a compiled inference function with a fixed input signature.
+def compile_predict_fn(model):
+    import tensorflow as tf
+    input_shape = model.input_shape[1:]
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=(None,) + tuple(input_shape), dtype=tf.float32)])
+    def predict_fn(batch):
+        return model(batch, training=False)
+
+    return lambda batch: predict_fn(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+#Reads the metadata written next to an exported artifact (input/output tensor names, format, ...).
+def read_metadata(artifact_path):
+    with open(artifact_path + ".json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+#Loads a frozen GraphDef and returns a predict_fn that runs the pruned, constant-folded graph.
+def load_frozen_predict_fn(artifact_path):
+    import tensorflow as tf
+    meta = read_metadata(artifact_path)
+    graph_def = tf.compat.v1.GraphDef()
+    with open(artifact_path, "rb") as f:
+        graph_def.ParseFromString(f.read())
+
+    def _import():
+        tf.compat.v1.import_graph_def(graph_def, name="")
+
+    wrapped = tf.compat.v1.wrap_function(_import, [])
+    graph_fn = wrapped.prune(
+        feeds=wrapped.graph.get_tensor_by_name(meta["input"]),
+        fetches=wrapped.graph.get_tensor_by_name(meta["output"]),
+    )
+    return lambda batch: graph_fn(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+class TFLitePredictor:
+    """predict_fn over a TFLite artifact; each thread gets its own interpreter (they are not thread-safe)."""
+
+    def __init__(self, artifact_path, num_threads=None):
+        with open(artifact_path, "rb") as f:
+            self.model_content = f.read()
+        self.num_threads = num_threads
+        self._local = threading.local()
+
+    def _interpreter(self, batch_size):
+        import tensorflow as tf
+        state = self._local
+        if getattr(state, "interpreter", None) is None:
+            state.interpreter = tf.lite.Interpreter(model_content=self.model_content, num_threads=self.num_threads)
+            state.batch_size = None
+        interpreter = state.interpreter
+        if state.batch_size != batch_size:
+            input_detail = interpreter.get_input_details()[0]
+            interpreter.resize_tensor_input(input_detail["index"], [batch_size] + list(input_detail["shape"][1:]))
+            interpreter.allocate_tensors()
+            state.batch_size = batch_size
+        return interpreter
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        interpreter = self._interpreter(len(batch))
+        interpreter.set_tensor(interpreter.get_input_details()[0]["index"], batch)
+        interpreter.invoke()
+        return interpreter.get_tensor(interpreter.get_output_details()[0]["index"]).copy()
+
+
+#Checks that the model's input size is the one uploads are resized to.
+def check_input_size(input_shape, artifact_path, expected=CT_INPUT_SIZE):
+    if tuple(input_shape[:2]) != tuple(expected):
+        raise ValueError(f"{artifact_path} expects {input_shape[0]}x{input_shape[1]} inputs but uploads are resized to "
+                         f"{expected[0]}x{expected[1]}; set MEDREAD_CT_INPUT_SIZE={input_shape[0]}")
+
+
+#Returns a predict_fn for the configured runtime. For "keras" the .h5 at artifact_path (or keras_path
+#when it is not set) is loaded; the other runtimes read the exported artifact and never import the
+#Keras model. num_threads sets the TFLite interpreter threads (the other runtimes follow TensorFlow's
+#thread settings). Raises ValueError if the model's input size is not uploads.CT_INPUT_SIZE.
+def load_ct_predict_fn(keras_path, runtime=CT_RUNTIME, artifact_path=CT_ARTIFACT, num_threads=None):
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown CT runtime {runtime!r}, expected one of {RUNTIMES}")
+    if runtime == "keras":
+        from tensorflow.keras.models import load_model
+        model = load_model(artifact_path or keras_path)
+        check_input_size(model.input_shape[1:], artifact_path or keras_path)
+        return compile_predict_fn(model)
+    if not artifact_path:
+        raise ValueError(f"MEDREAD_CT_ARTIFACT must point to an exported model when MEDREAD_CT_RUNTIME={runtime}")
+    check_input_size(read_metadata(artifact_path)["input_shape"], artifact_path)
+    if runtime == "frozen":
+        return load_frozen_predict_fn(artifact_path)
+    return TFLitePredictor(artifact_path, num_threads=num_threads)
@@ -0,0 +1,354 @@
+# Compact serving format for the TF-IDF vectorizer and RandomForest text classifier.
+#
+# The sklearn pickles are slow to load (a hundred estimator objects plus a vocabulary dict), every
+# worker unpickles a private copy, and predict_proba makes one Python-level call per tree.
+# export_compact() compiles both models into a directory of flat .npy arrays plus a JSON header:
+#   * forest     - one node table for all trees (split feature, threshold, both children, class
+#                  probabilities) and the root node of each tree;
+#   * vectorizer - the vocabulary as one UTF-8 blob with offsets, an open-addressing hash table
+#                  (crc32, linear probing) from term to column, and the idf weights.
+# load_compact() memory-maps every array, so loading takes milliseconds and all workers on a host share
+# the same pages through the page cache instead of each holding a copy.
+#
+# CompactForest walks every tree at once with numpy, one tree level per step, and accumulates the
+# trees' probabilities in the same order as sklearn, so predictions match it exactly (see
+# models/nlp/export_text_model.py --check). CompactVectorizer reproduces TfidfVectorizer.transform for
+# word analyzers (lowercase, token pattern, stop words, n-grams, binary/sublinear tf, idf, norm).
+# Both keep the method names the backend uses on the sklearn objects, so MEDREAD_TEXT_RUNTIME=compact
+# swaps them in without other changes.
+
+import json                                 # For the format header
+import math                                 # For the l2 norm (summed sequentially, like sklearn)
+import os                                   # For paths and configuration
+import re                                   # For the vectorizer's token pattern
+import zlib                                 # For the crc32 term hash
+from collections import Counter             # For term counts
+
+import numpy as np                          # For the node tables and vectorised traversal
+import scipy.sparse as sp                   # TF-IDF rows are returned as CSR, like sklearn
+
+TEXT_RUNTIME = os.environ.get("MEDREAD_TEXT_RUNTIME", "sklearn")
+TEXT_ARTIFACT = os.environ.get("MEDREAD_TEXT_ARTIFACT", "text_model_compact")
+
+TEXT_RUNTIMES = ("sklearn", "compact")
+FORMAT_VERSION = 1
+HEADER_FILE = "model.json"
+
+# Rows per traversal chunk; bounds the dense (rows x features) buffer
+PREDICT_CHUNK_ROWS = 256
+# Terms (in or out of the vocabulary) remembered by CompactVectorizer.lookup before the memo is reset
+LOOKUP_MEMO_SIZE = 100_000
+
+
+class CompactForest:
+    """Array-backed RandomForestClassifier.predict / predict_proba / decision_path."""
+
+    def __init__(self, feature, threshold, children, value, roots, classes, n_features):
+        self.feature = feature              # (nodes,) split feature, -1 for leaves
+        self.threshold = threshold          # (nodes,) float64, split goes left when x <= threshold
+        self.children = children            # (nodes, 2) absolute index of the left and the right child
+        self.left, self.right = children[:, 0], children[:, 1]
+        self.value = value                  # (nodes, classes) normalised class probabilities
+        self.roots = roots                  # (trees,) root node of every tree
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = n_features
+        self.n_trees = len(roots)
+
+    # Dense float32 rows, as sklearn's trees see them
+    def _dense(self, X):
+        if sp.issparse(X):
+            return X.toarray().astype(np.float32, copy=False)
+        return np.asarray(X, dtype=np.float32)
+
+    # Steps every (row, tree) pair one level down per iteration, dropping pairs once they reach a leaf, so
+    # the work follows the actual path lengths rather than the deepest tree. Pairs are numbered row-major
+    # (row * n_trees + tree); after every step yields the pairs that moved and the nodes they moved to,
+    # and the leaf each pair ends in is written to `leaves` if given. The tables are read with 1-D take(),
+    # which is noticeably cheaper than fancy indexing per step, and both children of a node sit next to
+    # each other so the next node is a single lookup.
+    def _walk(self, X, leaves=None):
+        n_rows, n_features = X.shape
+        X = X.ravel()
+        children = self.children.ravel()
+        pairs = np.arange(n_rows * self.n_trees)
+        current = np.tile(np.asarray(self.roots, dtype=np.int64), n_rows)
+        row_start = (pairs // self.n_trees) * n_features
+        while len(pairs):
+            feature = self.feature.take(current)
+            internal = feature >= 0
+            if not internal.all():
+                if leaves is not None:
+                    leaves[pairs[~internal]] = current[~internal]
+                pairs, current, row_start, feature = (pairs[internal], current[internal], row_start[internal],
+                                                      feature[internal])
+                if not len(pairs):
+                    return
+            go_right = X.take(row_start + feature) > self.threshold.take(current)
+            current = children.take(2 * current + go_right)
+            yield pairs, current
+
+    # Leaf node reached in every tree, (rows, trees)
+    def apply(self, X):
+        X = self._dense(X)
+        leaves = np.empty(len(X) * self.n_trees, dtype=np.int64)
+        for _ in self._walk(X, leaves):
+            pass
+        return leaves.reshape(len(X), self.n_trees)
+
+    def predict_proba(self, X):
+        outputs = []
+        for start in range(0, X.shape[0], PREDICT_CHUNK_ROWS):
+            leaves = self.apply(X[start:start + PREDICT_CHUNK_ROWS])
+            # Summed over the first axis tree by tree, in sklearn's order, then divided once
+            outputs.append(self.value[leaves.T].sum(axis=0) / self.n_trees)
+        if not outputs:
+            return np.zeros((0, len(self.classes_)))
+        return np.concatenate(outputs)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+    # Same result as sklearn's forest.decision_path: a (rows, nodes) indicator of the visited nodes, and
+    # the offset of every tree's nodes
+    def decision_path(self, X):
+        X = self._dense(X)
+        n_rows = len(X)
+        visited_rows = [np.repeat(np.arange(n_rows), self.n_trees)]
+        visited_nodes = [np.tile(np.asarray(self.roots, dtype=np.int64), n_rows)]
+        for pairs, current in self._walk(X):
+            visited_rows.append(pairs // self.n_trees)
+            visited_nodes.append(current)
+        rows, nodes = np.concatenate(visited_rows), np.concatenate(visited_nodes)
+        indicator = sp.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, nodes)), shape=(n_rows, len(self.feature)))
+        indicator.sort_indices()
+        return indicator, np.append(self.roots, len(self.feature))
+
+
+class CompactVectorizer:
+    """Array-backed TfidfVectorizer.transform for word analyzers."""
+
+    def __init__(self, terms_blob, term_offsets, hash_slots, idf, settings):
+        self.terms_blob = terms_blob        # uint8, every term's UTF-8 bytes back to back, in column order
+        self.term_offsets = term_offsets    # (terms + 1,) start of every term in the blob
+        self.hash_slots = hash_slots        # (power of two,) column of the term hashed there, -1 if empty
+        self.idf = idf                      # (terms,) idf weights, or None without use_idf
+        self.lowercase = settings["lowercase"]
+        self.token_pattern = re.compile(settings["token_pattern"])
+        self.stop_words = frozenset(settings["stop_words"] or ())
+        self.ngram_range = tuple(settings["ngram_range"])
+        self.binary = settings["binary"]
+        self.sublinear_tf = settings["sublinear_tf"]
+        self.norm = settings["norm"]
+        self._mask = len(hash_slots) - 1
+        self._feature_names = None
+        self._columns = {}                  # Memo of recent lookups; reports reuse a small working vocabulary
+
+    # Column of a term, or -1 when it is not in the vocabulary
+    def lookup(self, term):
+        column = self._columns.get(term)
+        if column is None:
+            if len(self._columns) >= LOOKUP_MEMO_SIZE:
+                self._columns.clear()
+            column = self._columns[term] = self._probe(term.encode("utf-8"))
+        return column
+
+    def _probe(self, encoded):
+        slot = zlib.crc32(encoded) & self._mask
+        while True:
+            column = int(self.hash_slots[slot])
+            if column < 0:
+                return -1
+            start, end = self.term_offsets[column], self.term_offsets[column + 1]
+            if end - start == len(encoded) and self.terms_blob[start:end].tobytes() == encoded:
+                return column
+            slot = (slot + 1) & self._mask
+
+    # The word analyzer of TfidfVectorizer: preprocess, tokenize, drop stop words, build n-grams
+    def analyze(self, text):
+        if self.lowercase:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        if self.stop_words:
+            tokens = [token for token in tokens if token not in self.stop_words]
+        low, high = self.ngram_range
+        if high == 1:
+            return tokens
+        ngrams = list(tokens) if low == 1 else []
+        for n in range(max(low, 2), min(high, len(tokens)) + 1):
+            ngrams.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return ngrams
+
+    def transform(self, texts):
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = {}
+            for term, count in Counter(self.analyze(text)).items():
+                column = self.lookup(term)
+                if column >= 0:
+                    counts[column] = count
+            columns = sorted(counts)
+            values = np.array([1.0 if self.binary else counts[c] for c in columns], dtype=np.float64)
+            if self.sublinear_tf:
+                values = np.log(values) + 1
+            if self.idf is not None:
+                values *= self.idf[columns]
+            if self.norm == "l2":
+                norm = math.sqrt(sum(v * v for v in values.tolist()))
+                if norm > 0:
+                    values /= norm
+            elif self.norm == "l1":
+                norm = sum(abs(v) for v in values.tolist())
+                if norm > 0:
+                    values /= norm
+            indices.extend(columns)
+            data.append(values)
+            indptr.append(len(indices))
+        data = np.concatenate(data) if data else np.zeros(0)
+        return sp.csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+                             shape=(len(indptr) - 1, len(self.term_offsets) - 1))
+
+    def get_feature_names_out(self):
+        if self._feature_names is None:
+            blob = self.terms_blob.tobytes()
+            offsets = self.term_offsets.tolist()
+            self._feature_names = np.asarray([blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+                                              for i in range(len(offsets) - 1)], dtype=object)
+        return self._feature_names
+
+
+#Checks that the vectorizer only uses settings CompactVectorizer reproduces exactly.
+def _vectorizer_settings(vectorizer):
+    params = vectorizer.get_params()
+    unsupported = [name for name, default in (("analyzer", "word"), ("preprocessor", None), ("tokenizer", None),
+                                              ("strip_accents", None), ("input", "content"))
+                   if params.get(name) != default]
+    if np.dtype(params["dtype"]) != np.float64:
+        unsupported.append("dtype")
+    if unsupported:
+        raise ValueError(f"Compact export does not support these TfidfVectorizer settings: {unsupported}")
+    stop_words = vectorizer.get_stop_words()
+    return {
+        "lowercase": bool(params["lowercase"]),
+        "token_pattern": params["token_pattern"],
+        "stop_words": sorted(stop_words) if stop_words else None,
+        "ngram_range": list(params["ngram_range"]),
+        "binary": bool(params["binary"]),
+        "sublinear_tf": bool(params.get("sublinear_tf", False)),
+        "norm": params.get("norm"),
+    }
+
+
+#Open-addressing table (load factor <= 0.5) from crc32(term) to column.
+def _hash_table(encoded_terms):
+    size = 1
+    while size < 2 * max(1, len(encoded_terms)):
+        size *= 2
+    slots = np.full(size, -1, dtype=np.int32)
+    for column, encoded in enumerate(encoded_terms):
+        slot = zlib.crc32(encoded) & (size - 1)
+        while slots[slot] >= 0:
+            slot = (slot + 1) & (size - 1)
+        slots[slot] = column
+    return slots
+
+
+#Flattens a fitted sklearn forest into one node table; children are absolute node indices. Also used by
+#text_explainer.TreeContributionExplainer, so both formats are explained from the same tables.
+def forest_tables(forest):
+    if not hasattr(forest, "estimators_") or getattr(forest, "n_outputs_", 1) != 1:
+        raise ValueError("Compact export needs a fitted single-output tree ensemble classifier")
+    feature, threshold, children, value, roots = [], [], [], [], []
+    offset, max_depth = 0, 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left < 0
+        probabilities = tree.value[:, 0, :].astype(np.float64)
+        normaliser = probabilities.sum(axis=1, keepdims=True)
+        normaliser[normaliser == 0.0] = 1.0
+        feature.append(np.where(is_leaf, -1, tree.feature).astype(np.int32))
+        threshold.append(tree.threshold.astype(np.float64))
+        children.append(np.stack([np.where(is_leaf, -1, tree.children_left + offset),
+                                  np.where(is_leaf, -1, tree.children_right + offset)], axis=1).astype(np.int32))
+        value.append(probabilities / normaliser)
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, int(tree.max_depth))
+    return {
+        "forest_feature": np.concatenate(feature),
+        "forest_threshold": np.concatenate(threshold),
+        "forest_children": np.concatenate(children),
+        "forest_value": np.concatenate(value),
+        "forest_roots": np.asarray(roots, dtype=np.int32),
+    }, max_depth
+
+
+#Writes the forest and vectorizer into `directory` in the compact format.
+def export_compact(forest, vectorizer, directory):
+    tables, max_depth = forest_tables(forest)
+    settings = _vectorizer_settings(vectorizer)
+
+    terms = vectorizer.get_feature_names_out()
+    encoded_terms = [str(term).encode("utf-8") for term in terms]
+    offsets = np.zeros(len(encoded_terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(encoded) for encoded in encoded_terms])
+    tables["vocab_blob"] = np.frombuffer(b"".join(encoded_terms), dtype=np.uint8)
+    tables["vocab_offsets"] = offsets
+    tables["vocab_slots"] = _hash_table(encoded_terms)
+    use_idf = bool(vectorizer.get_params().get("use_idf", True))
+    if use_idf:
+        tables["vocab_idf"] = np.asarray(vectorizer.idf_, dtype=np.float64)
+
+    os.makedirs(directory, exist_ok=True)
+    for name, array in tables.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+    header = {
+        "format_version": FORMAT_VERSION,
+        "classes": np.asarray(forest.classes_).tolist(),
+        "n_trees": len(tables["forest_roots"]),
+        "n_nodes": len(tables["forest_feature"]),
+        "max_depth": max_depth,
+        "n_features": len(encoded_terms),
+        "use_idf": use_idf,
+        "vectorizer": settings,
+        "arrays": sorted(tables),
+    }
+    with open(os.path.join(directory, HEADER_FILE), "w") as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+#Loads (forest, vectorizer) from an exported directory; every array is memory-mapped read-only.
+def load_compact(directory):
+    with open(os.path.join(directory, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compact text model version {header['format_version']} in {directory}")
+    # Plain ndarray views of the maps: np.memmap's subclass hooks would run on every fancy-indexing step
+    arrays = {name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r"))
+              for name in header["arrays"]}
+
+    forest = CompactForest(arrays["forest_feature"], arrays["forest_threshold"], arrays["forest_children"],
+                           arrays["forest_value"], arrays["forest_roots"],
+                           header["classes"], header["n_features"])
+    vectorizer = CompactVectorizer(arrays["vocab_blob"], arrays["vocab_offsets"], arrays["vocab_slots"],
+                                   arrays.get("vocab_idf"), header["vectorizer"])
+    return forest, vectorizer
+
+
+#Files the configured runtime loads, for the result cache fingerprint.
+def text_model_files(classifier_path, vectorizer_path, runtime=TEXT_RUNTIME, artifact=TEXT_ARTIFACT):
+    if runtime != "compact":
+        return [classifier_path, vectorizer_path]
+    with open(os.path.join(artifact, HEADER_FILE)) as f:
+        header = json.load(f)
+    return [os.path.join(artifact, HEADER_FILE)] + [os.path.join(artifact, f"{name}.npy") for name in header["arrays"]]
+
+
+#Returns (classifier, vectorizer) for the configured runtime: the sklearn pickles, or the compact export.
+def load_text_model(classifier_path, vectorizer_path, runtime=TEXT_RUNTIME, artifact=TEXT_ARTIFACT):
+    if runtime not in TEXT_RUNTIMES:
+        raise ValueError(f"Unknown text runtime {runtime!r}, expected one of {TEXT_RUNTIMES}")
+    if runtime == "compact":
+        return load_compact(artifact)
+    import joblib
+    return joblib.load(classifier_path), joblib.load(vectorizer_path)
@@ -0,0 +1,204 @@
+# Multi-page documents and CT slice stacks for /predict.
+#
+# One upload can hold several images: a multi-page TIFF (a scanned report, or CT slices exported as a
+# stack), a PDF report, or a zip archive of slice images. Document opens any of them and decodes the
+# pages one at a time straight from the upload bytes, so large studies never sit in memory as a whole:
+#   * report pages are OCR'd in parallel (ocr.OCRPool) and their text is joined in page order before
+#     TF-IDF classification, so a report is classified once, as a whole;
+#   * CT slices are resized to the CNN input and scored in chunks of MEDREAD_STUDY_CNN_BATCH (a single
+#     forward pass for studies up to that size), and the per-slice probabilities are combined into a
+#     study-level prediction (MEDREAD_STUDY_AGGREGATION: "mean" of the slices, or "max" per class).
+# PDF pages are rasterised with pypdfium2, an optional dependency (pip install pypdfium2) that is only
+# imported when a PDF arrives.
+
+import os                                   # For reading configuration from the environment
+import re                                   # For natural ordering of slice file names
+import zipfile                              # For zip archives of slices
+from io import BytesIO                      # For reading uploads from memory
+
+import cv2                                  # For colour conversion
+import numpy as np                          # For slice batches and probabilities
+
+import metrics                              # For study forward-pass timings
+from batch_predict import is_image_name     # Same image file names as /predict/batch archives
+from uploads import (MAX_IMAGE_PIXELS, DecodedUpload, UploadError, check_archive_sizes, image_dimensions,
+                     sniff_format)
+
+MAX_PAGES = int(os.environ.get("MEDREAD_MAX_PAGES", 500))
+PDF_RENDER_DPI = int(os.environ.get("MEDREAD_PDF_DPI", 200))
+STUDY_CNN_BATCH = int(os.environ.get("MEDREAD_STUDY_CNN_BATCH", 32))
+STUDY_AGGREGATION = os.environ.get("MEDREAD_STUDY_AGGREGATION", "mean")
+
+AGGREGATIONS = ("mean", "max")
+
+
+#Sort key that puts slice2.png before slice10.png.
+def natural_key(name):
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r"(\d+)", name)]
+
+
+#Checks one page against the pixel limit before it is decoded.
+def check_page_size(width, height, index):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadError(f"Page {index + 1} is {width}x{height}, above the {MAX_IMAGE_PIXELS} pixel limit",
+                          status_code=413)
+
+
+#Converts a decoded frame of any bit depth (e.g. 16-bit CT slices) into a BGR uint8 image. Frames that
+#are not 8-bit are scaled from their own min/max to 0-255.
+def to_bgr(array):
+    if array.dtype != np.uint8:
+        array = array.astype(np.float32)
+        low, high = float(array.min()), float(array.max())
+        array = ((array - low) * (255.0 / (high - low)) if high > low else np.zeros_like(array)).astype(np.uint8)
+    if array.ndim == 2:
+        return cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+    return cv2.cvtColor(array[..., :3], cv2.COLOR_RGB2BGR)
+
+
+def _tiff_frame_count(data):
+    from PIL import Image
+    with Image.open(BytesIO(data)) as image:
+        return getattr(image, "n_frames", 1)
+
+
+#True for uploads that are handled as documents: PDFs, zip archives and TIFFs with several frames.
+#Single images (including single-frame TIFFs) keep the one-image path.
+def is_document(data, upload_format=None):
+    upload_format = upload_format or sniff_format(data)
+    if upload_format in ("pdf", "zip"):
+        return True
+    if upload_format == "tiff":
+        try:
+            return _tiff_frame_count(data) > 1
+        except Exception:
+            return False                    # Let the single-image decoder report the problem
+    return False
+
+
+class Document:
+    """A multi-page upload whose pages are decoded lazily, one at a time, in page order."""
+
+    def __init__(self, data, upload_format=None):
+        self.data = data
+        self.format = upload_format or sniff_format(data)
+        if self.format not in ("tiff", "pdf", "zip"):
+            raise UploadError(f"Not a multi-page document: {self.format}", status_code=415)
+
+    # Yields a DecodedUpload per page; each page is decoded only when it is reached
+    def pages(self):
+        for index, bgr in enumerate(getattr(self, f"_{self.format}_pages")()):
+            if index >= MAX_PAGES:
+                raise UploadError(f"Document has more than {MAX_PAGES} pages", status_code=413)
+            yield DecodedUpload(bgr)
+
+    def first_page(self):
+        for page in self.pages():
+            return page
+        raise UploadError("Document has no pages")
+
+    def _tiff_pages(self):
+        from PIL import Image
+        with Image.open(BytesIO(self.data)) as image:
+            for index in range(getattr(image, "n_frames", 1)):
+                image.seek(index)
+                check_page_size(*image.size, index)
+                frame = image if image.mode in ("L", "RGB", "RGBA", "I;16", "I;16B", "I", "F") else image.convert("RGB")
+                yield to_bgr(np.asarray(frame))
+
+    def _pdf_pages(self):
+        try:
+            import pypdfium2 as pdfium
+        except ImportError:
+            raise UploadError("PDF uploads need the optional pypdfium2 package", status_code=415) from None
+        scale = PDF_RENDER_DPI / 72.0
+        document = pdfium.PdfDocument(self.data)
+        try:
+            for index in range(len(document)):
+                page = document[index]
+                try:
+                    width, height = page.get_size()
+                    check_page_size(int(width * scale), int(height * scale), index)
+                    rgb = np.asarray(page.render(scale=scale).to_pil().convert("RGB"))
+                finally:
+                    page.close()
+                yield to_bgr(rgb)
+        finally:
+            document.close()
+
+    # Entry sizes are checked before anything is decompressed, and every slice's dimensions before it is
+    # decoded
+    def _zip_pages(self):
+        with zipfile.ZipFile(BytesIO(self.data)) as archive:
+            infos = sorted((info for info in archive.infolist()
+                            if not info.is_dir() and is_image_name(info.filename)),
+                           key=lambda info: natural_key(info.filename))
+            check_archive_sizes(infos)
+            for index, info in enumerate(infos):
+                try:
+                    data = archive.read(info)
+                except zipfile.BadZipFile as e:
+                    raise UploadError(f"{info.filename} in the archive is corrupt: {e}") from None
+                dimensions = image_dimensions(data, sniff_format(data))
+                if dimensions is None:
+                    raise UploadError(f"Could not read the dimensions of {info.filename} in the archive",
+                                      status_code=415)
+                check_page_size(*dimensions, index)
+                bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if bgr is None:
+                    raise UploadError(f"{info.filename} in the archive is not a readable image")
+                yield bgr
+
+
+class StudyPrediction:
+    """Per-slice and aggregated CNN output for a stack of CT slices."""
+
+    def __init__(self, slice_probabilities, probabilities, key_slice, key_tensor, aggregation):
+        self.slice_probabilities = slice_probabilities      # (slices, classes)
+        self.probabilities = probabilities                  # (classes,) study-level
+        self.key_slice = key_slice                          # Slice most confident in the study's class
+        self.key_tensor = key_tensor                        # Its CNN input, e.g. for LIME
+        self.aggregation = aggregation
+
+
+#Scores every slice (DecodedUpload pages, possibly a lazy iterator) with predict_fn, `batch_size` slices
+#per forward pass, and aggregates them. Only one chunk of slices, plus the best slice so far for each
+#class, is held in memory.
+def score_study(slices, predict_fn, batch_size=STUDY_CNN_BATCH, aggregation=STUDY_AGGREGATION):
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown study aggregation {aggregation!r}, expected one of {AGGREGATIONS}")
+    outputs, chunk = [], []
+    best = {}                               # class -> (probability, slice index, uint8 pixels)
+
+    def flush():
+        batch = np.stack(chunk).astype(np.float32)
+        batch /= 255.0
+        with metrics.timer("cnn_forward", model="study"):
+            probabilities = np.asarray(predict_fn(batch))
+        first = sum(len(output) for output in outputs)
+        for row, (probability_row, pixels) in enumerate(zip(probabilities, chunk)):
+            for label, probability in enumerate(probability_row):
+                if label not in best or probability > best[label][0]:
+                    best[label] = (float(probability), first + row, pixels)
+        outputs.append(probabilities)
+        chunk.clear()
+
+    for page in slices:
+        chunk.append(page.ct_pixels())
+        if len(chunk) >= batch_size:
+            flush()
+    if chunk:
+        flush()
+    if not outputs:
+        raise UploadError("Study has no slices")
+
+    slice_probabilities = np.concatenate(outputs)
+    if aggregation == "mean":
+        probabilities = slice_probabilities.mean(axis=0)
+    else:
+        probabilities = slice_probabilities.max(axis=0)
+        probabilities = probabilities / probabilities.sum()
+    _, key_slice, pixels = best[int(np.argmax(probabilities))]
+    key_tensor = pixels.astype(np.float32)
+    key_tensor /= 255.0
+    return StudyPrediction(slice_probabilities, probabilities, key_slice, key_tensor, aggregation)
@@ -0,0 +1,45 @@
+# Gunicorn settings for serving the backend in production:
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The app is preloaded in the master so the sklearn models (and a TFLite CNN) are loaded once and
+# shared copy-on-write by the forked workers. TensorFlow must not run before the fork, so each
+# worker caps its TF threads and builds the CNN runtime after the fork, in a background thread
+# started from post_fork (the worker answers /healthz meanwhile and /readyz once warm). By default the cores are split
+# evenly between the workers; override with MEDREAD_TF_INTRA_OP_THREADS / MEDREAD_TF_INTER_OP_THREADS,
+# MEDREAD_OCR_WORKERS for the page OCR pool and MEDREAD_BATCH_WORKERS for the /predict/batch process pool
+# of each worker.
+#
+# With more than one worker, MEDREAD_SHARED_STATE is turned on: reports and async job status are kept in
+# MEDREAD_REPORT_DIR, so any worker answers /download_report/<id> and /jobs/<id> and no sticky routing
+# is needed. Running workers on several hosts needs MEDREAD_REPORT_DIR on storage they all share.
+
+import multiprocessing
+import os
+import tempfile
+
+os.environ["MEDREAD_FORKING_SERVER"] = "1"
+
+bind = os.environ.get("MEDREAD_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("MEDREAD_WORKERS", 2))
+threads = int(os.environ.get("MEDREAD_WORKER_THREADS", 4))   # Request threads per worker (feeds the micro-batcher)
+timeout = int(os.environ.get("MEDREAD_WORKER_TIMEOUT", 120))  # LIME explanations can take a while
+preload_app = True
+
+os.environ.setdefault("MEDREAD_TF_INTRA_OP_THREADS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("MEDREAD_TF_INTER_OP_THREADS", "1")
+os.environ.setdefault("MEDREAD_OCR_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("MEDREAD_BATCH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+os.environ.setdefault("MEDREAD_SHARED_STATE", "1" if workers > 1 else "0")
+# Each worker publishes its metrics here and /metrics sums them (see metrics.py)
+os.environ.setdefault("MEDREAD_METRICS_DIR", os.path.join(tempfile.gettempdir(), "medread_metrics"))
+
+
+# Drops the previous run's published metrics before any worker starts
+def on_starting(server):
+    import metrics
+    metrics.clear_published(os.environ["MEDREAD_METRICS_DIR"])
+
+
+def post_fork(server, worker):
+    import app as backend
+    backend.start_background_init()
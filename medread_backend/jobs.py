@@ -0,0 +1,171 @@
+# In-process job queue for asynchronous /predict requests.
+#
+# POST /predict?async=1 submits the upload here and returns a job ID straight away; a small pool of
+# worker threads runs prediction, explanation and PDF generation, and GET /jobs/<id> reports the
+# current stage and, once finished, the result. The queue is bounded: when it is full submit()
+# raises QueueFull and the route answers 429 so clients back off instead of piling up work.
+#
+# Jobs run in this process (no external broker), which keeps local runs and tests simple. Worker
+# threads share the already-loaded models; TensorFlow and Tesseract release the GIL while they work.
+# With several server workers (report_store shared mode), every status change is also written to
+# `state_dir` as job-<id>.json, so GET /jobs/<id> can be answered by any worker, not only the one
+# running the job.
+
+import json                                 # For the shared job status files
+import logging                              # For job failure logging
+import os                                   # For reading configuration from the environment
+import queue                                # For the bounded work queue
+import re                                   # To validate job IDs before touching the filesystem
+import threading                            # For worker threads and the job table lock
+import time                                 # For timestamps and expiry
+import uuid                                 # For job IDs
+
+import metrics                              # For job counters
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("MEDREAD_JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.environ.get("MEDREAD_JOB_QUEUE_SIZE", 16))
+JOB_TTL_SECONDS = int(os.environ.get("MEDREAD_JOB_TTL", 3600))
+
+JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has no room for another job."""
+
+
+class InProcessJobQueue:
+    """Bounded queue of prediction jobs served by local worker threads."""
+
+    def __init__(self, run_fn, workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, ttl_seconds=JOB_TTL_SECONDS,
+                 state_dir=None):
+        # run_fn(*args, progress=callback) must return a (response_dict, status_code) pair
+        self.run_fn = run_fn
+        self.ttl_seconds = ttl_seconds
+        self.state_dir = state_dir
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Jobs are numbered in queue order; a queued job's position is its number minus the number of
+        # the last job a worker took off the queue
+        self._enqueued = 0
+        self._dequeued = 0
+        self._workers = [
+            threading.Thread(target=self._work, name=f"predict-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    # Queues a job and returns its ID; raises QueueFull when the queue is at capacity
+    def submit(self, *args):
+        self._expire()
+        job_id = uuid.uuid4().hex
+        job = {"job_id": job_id, "state": "queued", "stage": None, "created": time.time(),
+               "finished": None, "result": None, "status_code": None}
+        with self._lock:
+            try:
+                self._queue.put_nowait((job_id, self._enqueued + 1, args))
+            except queue.Full:
+                metrics.increment("jobs_total", state="rejected")
+                raise QueueFull("Prediction queue is full, retry later") from None
+            self._enqueued += 1
+            job["sequence"] = self._enqueued
+            self._jobs[job_id] = job
+            self._publish(job)
+        metrics.increment("jobs_total", state="queued")
+        return job_id
+
+    # Returns a JSON-serialisable view of the job, or None if the ID is unknown or expired. Jobs of other
+    # server workers are read from their status files in `state_dir`.
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return self._view(job)
+        return self._read_published(job_id)
+
+    # Called with the lock held
+    def _view(self, job):
+        view = {key: job[key] for key in ("job_id", "state", "stage", "created", "finished")}
+        if job["state"] == "queued":
+            # 1 for the job that is next in line
+            view["queue_position"] = job["sequence"] - self._dequeued
+        if job["state"] in ("done", "failed"):
+            view["result"] = job["result"]
+            view["status_code"] = job["status_code"]
+        return view
+
+    def _state_path(self, job_id):
+        return os.path.join(self.state_dir, f"job-{job_id}.json")
+
+    # Writes the job's current view to its status file; called with the lock held
+    def _publish(self, job):
+        if self.state_dir is None:
+            return
+        path = self._state_path(job["job_id"])
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._view(job), f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Could not publish the status of job {job['job_id']}: {e}")
+
+    def _read_published(self, job_id):
+        if self.state_dir is None or not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._state_path(job_id), encoding="utf-8") as f:
+                view = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if view["finished"] is not None and view["finished"] < time.time() - self.ttl_seconds:
+            return None
+        return view
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._publish(job)
+
+    def _work(self):
+        while True:
+            job_id, sequence, args = self._queue.get()
+            with self._lock:
+                self._dequeued = max(self._dequeued, sequence)
+                # Every job still queued has moved up
+                for job in self._jobs.values():
+                    if job["state"] == "queued" and job["job_id"] != job_id:
+                        self._publish(job)
+            self._update(job_id, state="running", stage="started")
+            try:
+                result, status_code = self.run_fn(*args, progress=lambda stage: self._update(job_id, stage=stage))
+                state = "done" if status_code < 400 else "failed"
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                result, status_code, state = {"status": "error", "message": str(e)}, 500, "failed"
+            self._update(job_id, state=state, stage="finished", result=result,
+                         status_code=status_code, finished=time.time())
+            metrics.increment("jobs_total", state=state)
+            self._queue.task_done()
+
+    # Forgets finished jobs older than the TTL so the job table does not grow without bound
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished"] is not None and job["finished"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+                if self.state_dir is not None:
+                    try:
+                        os.remove(self._state_path(job_id))
+                    except OSError:
+                        pass
@@ -0,0 +1,144 @@
+# LIME explanation engine for CT scans.
+#
+# Replaces LimeImageExplainer().explain_instance(..., num_samples=1000) in /predict with an
+# implementation tuned for the CNN:
+#   * perturbed images are built in NumPy by broadcasting a (batch, segments) on/off matrix through
+#     the segment map, one batch at a time, instead of copying the image once per sample;
+#   * batches go through the runtime's predict_fn (a compiled tf.function, frozen graph or TFLite
+#     interpreter, see cnn_runtime.py), so there is no per-call Keras predict() overhead;
+#   * the weighted ridge surrogate is refitted after every batch and sampling stops as soon as the
+#     feature weights stop moving.
+# The surrogate (cosine-distance kernel, width 0.25, ridge alpha=1) matches LIME's defaults, so the
+# highlighted regions agree with the previous output. Superpixels come from the segmentation stage
+# in segmentation.py (quickshift by default, optionally SLIC/grid, reduced resolution, cached).
+
+import os                                   # For reading configuration from the environment
+
+import numpy as np                          # For vectorized perturbations and the ridge solve
+
+# skimage (boundary rendering) is imported on first use to keep it out of startup
+
+from segmentation import Segmenter         # Superpixel stage with its cache
+
+# Default quality/latency knobs; /predict may override num_samples and num_features per request
+LIME_NUM_SAMPLES = int(os.environ.get("MEDREAD_LIME_NUM_SAMPLES", 1000))
+LIME_NUM_FEATURES = int(os.environ.get("MEDREAD_LIME_NUM_FEATURES", 10))
+LIME_BATCH_SIZE = int(os.environ.get("MEDREAD_LIME_BATCH_SIZE", 128))
+LIME_MAX_SAMPLES = int(os.environ.get("MEDREAD_LIME_MAX_SAMPLES", 5000))
+
+# Early stopping: stop once the relative change of the surrogate weights stays below the tolerance
+# for `patience` consecutive batches (never before min_samples).
+LIME_MIN_SAMPLES = int(os.environ.get("MEDREAD_LIME_MIN_SAMPLES", 256))
+LIME_TOLERANCE = float(os.environ.get("MEDREAD_LIME_TOLERANCE", 0.02))
+LIME_PATIENCE = int(os.environ.get("MEDREAD_LIME_PATIENCE", 2))
+
+KERNEL_WIDTH = 0.25
+RIDGE_ALPHA = 1.0
+
+
+#Builds a batch of perturbed images in one broadcast: every disabled segment is replaced by hide_color.
+def perturb_batch(img, segments, z, hide_color=0.0):
+    keep = z[:, segments]                                   # (batch, H, W) via fancy indexing
+    return np.where(keep[..., None], img[None, ...], np.float32(hide_color)).astype(np.float32, copy=False)
+
+
+#Solves LIME's weighted ridge regression in closed form and returns the per-segment weights.
+def fit_surrogate(z, targets, sample_weights, alpha=RIDGE_ALPHA):
+    normalized = sample_weights / sample_weights.sum()
+    xc = z - normalized @ z
+    yc = targets - normalized @ targets
+    xw = xc * sample_weights[:, None]
+    gram = xc.T @ xw + alpha * np.eye(z.shape[1])
+    return np.linalg.solve(gram, xw.T @ yc)
+
+
+#LIME's exponential kernel over the cosine distance between each sample and the unperturbed image.
+def kernel_weights(z):
+    ones = np.ones(z.shape[1])
+    norms = np.linalg.norm(z, axis=1) * np.linalg.norm(ones)
+    cosine = np.divide(z @ ones, norms, out=np.zeros(len(z)), where=norms > 0)
+    distances = 1.0 - cosine
+    return np.sqrt(np.exp(-(distances ** 2) / KERNEL_WIDTH ** 2))
+
+
+class CTExplainer:
+    """LIME-style explainer for the CT scan CNN with batched, compiled inference."""
+
+    # predict_fn takes a (batch, H, W, 3) float32 array and returns class probabilities;
+    # segmenter maps an image to a label map (default: the configured, cached Segmenter)
+    def __init__(self, predict_fn, batch_size=LIME_BATCH_SIZE, tolerance=LIME_TOLERANCE,
+                 patience=LIME_PATIENCE, min_samples=LIME_MIN_SAMPLES, seed=None, segmenter=None):
+        self.predict_fn = predict_fn
+        self.segmenter = segmenter or Segmenter()
+        self.batch_size = batch_size
+        self.tolerance = tolerance
+        self.patience = patience
+        self.min_samples = min_samples
+        self.seed = seed
+
+    def explain(self, img, num_samples=LIME_NUM_SAMPLES, num_features=LIME_NUM_FEATURES,
+                hide_color=0.0, segments=None):
+        img = np.asarray(img, dtype=np.float32)
+        num_samples = max(1, min(int(num_samples), LIME_MAX_SAMPLES))
+        if segments is None:
+            segments = self.segmenter(img)
+        n_segments = int(segments.max()) + 1
+        rng = np.random.default_rng(self.seed)
+
+        # First sample is always the untouched image, exactly like LIME
+        z = rng.integers(0, 2, size=(num_samples, n_segments)).astype(bool)
+        z[0, :] = True
+
+        predictions = np.empty((0,), dtype=np.float32)
+        label = None
+        weights = None
+        stable_batches = 0
+        used = 0
+
+        for start in range(0, num_samples, self.batch_size):
+            z_batch = z[start:start + self.batch_size]
+            probs = self.predict_fn(perturb_batch(img, segments, z_batch, hide_color))
+            if label is None:
+                label = int(np.argmax(probs[0]))
+            predictions = np.concatenate([predictions, probs[:, label]])
+            used = start + len(z_batch)
+
+            zf = z[:used].astype(np.float64)
+            new_weights = fit_surrogate(zf, predictions.astype(np.float64), kernel_weights(zf))
+            if weights is not None and used >= self.min_samples:
+                change = np.linalg.norm(new_weights - weights) / max(np.linalg.norm(new_weights), 1e-12)
+                stable_batches = stable_batches + 1 if change < self.tolerance else 0
+            weights = new_weights
+            if stable_batches >= self.patience:
+                break
+
+        return CTExplanation(img, segments, label, weights, used, num_features)
+
+
+class CTExplanation:
+    """Result of CTExplainer.explain: the top label, per-segment weights and the rendered mask."""
+
+    def __init__(self, img, segments, label, weights, num_samples_used, num_features):
+        self.img = img
+        self.segments = segments
+        self.label = label
+        self.weights = weights
+        self.num_samples_used = num_samples_used
+        self.num_features = num_features
+
+    # Segment ids with the largest positive weights, most important first
+    def top_segments(self, num_features=None):
+        num_features = num_features or self.num_features
+        order = np.argsort(self.weights)[::-1][:num_features]
+        return [int(s) for s in order if self.weights[s] > 0]
+
+    # Equivalent of LIME's get_image_and_mask(label, positive_only=True, hide_rest=False)
+    def image_and_mask(self, num_features=None):
+        mask = np.isin(self.segments, self.top_segments(num_features)).astype(np.int64)
+        return self.img, mask
+
+    # Image with the boundaries of the important regions drawn on top, ready for plt.imsave
+    def render(self, num_features=None):
+        from skimage.segmentation import mark_boundaries
+        temp, mask = self.image_and_mask(num_features)
+        return mark_boundaries(temp, mask)
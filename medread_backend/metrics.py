@@ -0,0 +1,240 @@
+# In-process metrics registry for the backend.
+#
+# Counters and histograms are keyed by name plus a set of labels and are safe to update from any
+# request thread. The /metrics route in app.py exports everything recorded here, in the Prometheus
+# text format or (?format=json) as a JSON snapshot.
+#
+# Pipeline stages are timed with `with metrics.timer("stage"):`, which records the elapsed time in the
+# stage_duration_seconds histogram under a `stage` label.
+#
+# The registry is per process. Under a pre-forking server several workers answer /metrics, so with
+# MEDREAD_METRICS_DIR set (gunicorn.conf.py does, and clears it when the server starts) every worker
+# publishes its metrics and gauges to its own file there every MEDREAD_METRICS_PUBLISH_INTERVAL
+# seconds, and a scrape answers with the sum over all the files: the answering worker's current values
+# plus the others' latest. Files of workers that have exited are kept, so counters never go down
+# across worker restarts; only their gauges are dropped.
+
+import json                                 # For the published per-process snapshots
+import logging                              # For publisher failures
+import os                                   # For the metrics directory and process IDs
+import threading                            # To guard the registry across request threads
+import time                                 # For stage timers
+import uuid                                 # For unique per-process file names
+from collections import defaultdict         # For zero-initialised counters
+from contextlib import contextmanager       # For the timer context manager
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.environ.get("MEDREAD_METRICS_DIR")
+METRICS_PUBLISH_INTERVAL = float(os.environ.get("MEDREAD_METRICS_PUBLISH_INTERVAL", 2))
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_process_files = {}                         # pid -> this process's file name in METRICS_DIR
+
+# Default histogram buckets (upper bounds); callers pass their own for other units
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+LATENCY_SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+#Adds `value` to the counter identified by name and labels.
+def increment(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] += value
+
+
+#Returns the current value of a counter (0 if it was never incremented).
+def counter_value(name, **labels):
+    with _lock:
+        return _counters.get((name, tuple(sorted(labels.items()))), 0.0)
+
+
+#Records one observation in a histogram with the given bucket upper bounds.
+def observe(name, value, buckets=BATCH_SIZE_BUCKETS, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": tuple(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _histograms[key] = histogram
+        for i, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][i] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+#Returns a JSON-serialisable copy of every metric. Histogram bucket counts are cumulative.
+def snapshot():
+    with _lock:
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(_counters.items())
+        ]
+        histograms = []
+        for (name, labels), histogram in sorted(_histograms.items()):
+            cumulative, running = {}, 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                running += count
+                cumulative[str(bound)] = running
+            cumulative["+Inf"] = histogram["count"]
+            histograms.append({"name": name, "labels": dict(labels), "buckets": cumulative,
+                               "sum": histogram["sum"], "count": histogram["count"]})
+    return {"counters": counters, "histograms": histograms}
+
+
+#Writes this process's snapshot and `gauges` to its own file in `directory`. The file name is unique
+#per process (pids are reused), so a new worker never overwrites the counters of one that exited.
+def publish(directory=METRICS_DIR, gauges=None):
+    name = _process_files.setdefault(os.getpid(), f"metrics-{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+    path = os.path.join(directory, name)
+    data = dict(snapshot(), gauges=dict(gauges or {}), pid=os.getpid())
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass                                # Exists, owned by someone else
+    return True
+
+
+#Sums snapshots by name and labels: counters, histogram buckets, sums and counts, and gauges.
+def merge(snapshots):
+    counters, histograms, gauges = {}, {}, {}
+    for data in snapshots:
+        for counter in data["counters"]:
+            key = (counter["name"], _labels_key(counter["labels"]))
+            counters[key] = counters.get(key, 0.0) + counter["value"]
+        for histogram in data["histograms"]:
+            key = (histogram["name"], _labels_key(histogram["labels"]))
+            merged = histograms.setdefault(key, {"buckets": {}, "sum": 0.0, "count": 0})
+            for bound, count in histogram["buckets"].items():
+                merged["buckets"][bound] = merged["buckets"].get(bound, 0) + count
+            merged["sum"] += histogram["sum"]
+            merged["count"] += histogram["count"]
+        for name, value in data.get("gauges", {}).items():
+            gauges[name] = gauges.get(name, 0) + value
+    return {
+        "counters": [{"name": name, "labels": dict(labels), "value": value}
+                     for (name, labels), value in sorted(counters.items())],
+        "histograms": [dict(histogram, name=name, labels=dict(labels))
+                       for (name, labels), histogram in sorted(histograms.items())],
+        "gauges": gauges,
+        "processes": len(snapshots),
+    }
+
+
+#Metrics of every process publishing to `directory`: this one's current values (published first) plus
+#the latest snapshot of each of the others. Gauges only count for processes that are still running.
+def aggregate(directory=METRICS_DIR, gauges=None):
+    publish(directory, gauges)
+    snapshots = []
+    for name in os.listdir(directory):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if data["pid"] != os.getpid() and not _is_alive(data["pid"]):
+            data["gauges"] = {}
+        snapshots.append(data)
+    return merge(snapshots)
+
+
+#Publishes this process's metrics every `interval` seconds from a daemon thread; `gauges_fn()` returns
+#the gauges to include. Does nothing without a metrics directory.
+def start_publisher(gauges_fn=None, directory=METRICS_DIR, interval=METRICS_PUBLISH_INTERVAL):
+    if not directory:
+        return None
+    os.makedirs(directory, exist_ok=True)
+
+    def run():
+        while True:
+            try:
+                publish(directory, gauges_fn() if gauges_fn else None)
+            except Exception as e:
+                logger.warning(f"Could not publish metrics to {directory}: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="metrics-publisher", daemon=True)
+    thread.start()
+    return thread
+
+
+#Removes every published snapshot from `directory`; called once when the server starts.
+def clear_published(directory=METRICS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.startswith("metrics-"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+#Times the enclosed block and records it in stage_duration_seconds{stage=..., **labels}, also when
+#the block raises.
+@contextmanager
+def timer(stage, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_duration_seconds", time.perf_counter() - start, buckets=LATENCY_SECONDS_BUCKETS,
+                stage=stage, **labels)
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+#Renders every metric in the Prometheus text exposition format: `data` is a snapshot (this process's by
+#default, or aggregate()'s) and `gauges` maps extra gauge names to values sampled at scrape time (e.g.
+#cache sizes), by default those of `data`.
+def prometheus_text(gauges=None, data=None):
+    data = data or snapshot()
+    gauges = data.get("gauges") if gauges is None else gauges
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for counter in data["counters"]:
+        declare(counter["name"], "counter")
+        lines.append(f"{counter['name']}{_format_labels(counter['labels'])} {_format_value(counter['value'])}")
+    for histogram in data["histograms"]:
+        name, labels = histogram["name"], histogram["labels"]
+        declare(name, "histogram")
+        for bound, count in histogram["buckets"].items():
+            lines.append(f"{name}_bucket{_format_labels(dict(labels, le=bound))} {count}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    for name, value in sorted((gauges or {}).items()):
+        declare(name, "gauge")
+        lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,195 @@
+# OCR stage for the /predict pipeline.
+#
+# The upload is decoded once, a cheap image-statistics check routes obvious CT scans
+# away from Tesseract, and anything that still needs OCR is read exactly once. The
+# recognised text (an ocr_engine.OCRResult, with per-word confidences) is handed back to the
+# caller so the text path never re-runs OCR.
+#
+# Pages are preprocessed and tiled by ocr_engine. OCRPool keeps MEDREAD_OCR_WORKERS worker processes
+# (one per core, or this worker's share of the cores under a pre-forking server) and reads the regions
+# of one large page concurrently, or several pages of a multi-page report at once, returning results in
+# page order. What the warm workers save depends on the Tesseract binding (ocr_engine.resolve_engine):
+#   * tesserocr (optional, pip install tesserocr) - each worker initialises the Tesseract API and loads
+#     its language data once, when it starts, and reuses them for every region;
+#   * pytesseract (the default) - every region still starts its own tesseract process, which loads the
+#     language data again; the pool only adds parallelism.
+
+import multiprocessing                      # For the spawn context of the page OCR pool
+import os                                   # For reading configuration from the environment
+import threading                            # To start the pool once across request threads
+from collections import deque               # For the ordered window of pages in flight
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2                                  # For image decoding and resizing (OpenCV)
+import numpy as np                          # For pixel statistics
+
+import logging                              # For the OCR binding notice
+import metrics                              # For routing/OCR stage timings
+import ocr_engine                           # Preprocessing, tiling and Tesseract engines
+from serving import worker_core_share       # Per-worker core budget under a pre-forking server
+# pytesseract (which pulls in pandas) is imported on first OCR call to keep it out of startup
+
+logger = logging.getLogger(__name__)
+
+# Longest side used when computing routing statistics; keeps the check well under 1 ms
+ROUTING_MAX_SIDE = 256
+
+# A CT scan is mostly black background with a band of mid-grey tissue and almost no
+# paper-white pixels. Scanned reports are the opposite: mostly white paper.
+CT_MAX_BRIGHT_FRACTION = 0.20
+CT_MIN_DARK_FRACTION = 0.25
+CT_MIN_MIDTONE_FRACTION = 0.15
+
+BRIGHT_LEVEL = 200
+DARK_LEVEL = 50
+
+OCR_WORKERS = int(os.environ.get("MEDREAD_OCR_WORKERS", worker_core_share()))
+
+
+#Reads an image file from disk once as grayscale; every later stage works from this array.
+def load_grayscale(img_path):
+    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError("Uploaded file is not a readable image")
+    return img
+
+
+#Computes the pixel statistics used for routing on a downsampled copy of the image.
+def image_statistics(gray):
+    height, width = gray.shape[:2]
+    scale = ROUTING_MAX_SIDE / float(max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+
+    total = float(gray.size)
+    bright = np.count_nonzero(gray > BRIGHT_LEVEL) / total
+    dark = np.count_nonzero(gray < DARK_LEVEL) / total
+    return {"bright": bright, "dark": dark, "midtone": 1.0 - bright - dark}
+
+
+#Cheap pre-OCR classifier: returns "ct" for images that clearly look like a CT scan, otherwise None
+#(meaning OCR has to decide).
+def classify_by_statistics(gray):
+    stats = image_statistics(gray)
+    if (stats["bright"] < CT_MAX_BRIGHT_FRACTION
+            and stats["dark"] > CT_MIN_DARK_FRACTION
+            and stats["midtone"] > CT_MIN_MIDTONE_FRACTION):
+        return "ct"
+    return None
+
+
+#Reads the decoded image once (preprocessing, regions one after the other) and returns an OCRResult.
+def run_ocr(gray):
+    return ocr_engine.read_page(gray)
+
+
+#Routes an image to the CT or text path and returns (image_type, ocr_result).
+#CT scans recognised by the statistics check never reach Tesseract; for everything else the
+#OCR output both decides the route (any text means "text") and is returned for reuse.
+#`read` is the OCR function, e.g. OCRPool.read_page to read the regions of the page concurrently.
+def route_and_extract(gray, read=run_ocr):
+    with metrics.timer("routing"):
+        route = classify_by_statistics(gray)
+    if route == "ct":
+        return "ct", None
+
+    with metrics.timer("ocr"):
+        result = read(gray)
+    return ("text", result) if result.text else ("ct", None)
+
+
+#Worker initializer: creates the worker's Tesseract engine up front (with tesserocr this loads the
+#language data; with pytesseract there is nothing to load), and keeps Tesseract single-threaded since
+#the pool already uses every core.
+def start_worker():
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    ocr_engine.engine()
+
+
+#Worker: OCR of one page. Failures are re-raised as RuntimeError because some pytesseract exceptions
+#cannot be unpickled and would otherwise break the pool.
+def ocr_page(gray):
+    try:
+        return run_ocr(gray)
+    except Exception as e:
+        raise RuntimeError(f"OCR failed: {e}") from None
+
+
+#Worker: OCR of one preprocessed region, failures re-raised as for ocr_page.
+def ocr_region(region, dpi):
+    try:
+        return ocr_engine.read_region(region, dpi)
+    except Exception as e:
+        raise RuntimeError(f"OCR failed: {e}") from None
+
+
+class OCRPool:
+    """Persistent OCR worker processes: the regions of a large page, or the pages of a document, are read
+    in parallel, a bounded window at a time."""
+
+    def __init__(self, workers=OCR_WORKERS):
+        self.workers = max(1, workers)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    # The pool is started on first use; "spawn" keeps TensorFlow and the models out of the workers
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=start_worker)
+            return self._pool
+
+    # Starts the workers and their engines now rather than on the first report
+    def warm_up(self):
+        if ocr_engine.resolve_engine() == "pytesseract":
+            logger.info("OCR uses pytesseract: one tesseract process per page region; "
+                        "pip install tesserocr to load Tesseract once per OCR worker")
+        if self.workers > 1:
+            pool = self.pool()
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    # Reads one page: it is preprocessed and tiled here, and its regions are read in parallel by the
+    # workers. A page that is a single region (or a pool of one worker) is read in this process.
+    def read_page(self, gray):
+        with metrics.timer("ocr_preprocess"):
+            page, dpi = ocr_engine.preprocess_page(gray)
+            regions = ocr_engine.split_regions(page)
+        if self.workers == 1 or len(regions) < 2:
+            results = [ocr_engine.read_region(region, dpi) for _, region in regions]
+        else:
+            pool = self.pool()
+            futures = [pool.submit(ocr_region, region, dpi) for _, region in regions]
+            try:
+                results = [future.result() for future in futures]
+            finally:
+                for future in futures:      # Only pending when a region failed
+                    future.cancel()
+        return ocr_engine.merge_results(results, [top for top, _ in regions])
+
+    # Returns the OCRResult of every page (grayscale arrays, possibly a lazy iterator) in page order.
+    # Only about two pages per worker are decoded and in flight at once. With one worker pages are
+    # read in this process.
+    def extract_pages(self, pages):
+        if self.workers == 1:
+            return [run_ocr(gray) for gray in pages]
+        pool, pending, results = self.pool(), deque(), []
+        try:
+            for gray in pages:
+                pending.append(pool.submit(ocr_page, gray))
+                if len(pending) >= self.workers * 2:
+                    results.append(pending.popleft().result())
+            while pending:
+                results.append(pending.popleft().result())
+        finally:
+            for future in pending:          # Only left over when a page failed
+                future.cancel()
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
@@ -0,0 +1,324 @@
+# OCR engine for scanned reports: page preprocessing, region tiling and word-level Tesseract output.
+#
+# ocr.py decides whether an upload needs OCR at all; this module does the reading:
+#   * preprocess_page: grayscale, DPI-aware downscale to MEDREAD_OCR_DPI (300 by default; the source
+#     resolution is estimated from the page size assuming an A4/Letter page, so a 600 dpi scan is
+#     halved and a 200 dpi PDF render is left alone), binarization (MEDREAD_OCR_BINARIZE=otsu, adaptive
+#     or none) and deskew (projection-profile search up to MEDREAD_OCR_MAX_SKEW degrees on a small copy);
+#   * split_regions: pages taller than MEDREAD_OCR_TILE_MIN_HEIGHT pixels are cut into horizontal bands
+#     at blank rows between text lines, so no line is split and the bands can be read concurrently
+#     (see ocr.OCRPool);
+#   * TesseractEngine: one engine per thread. With the optional tesserocr package (pip install
+#     tesserocr) it holds a long-lived handle: the C API is initialised once with the language data and
+#     reused for every region. Otherwise pytesseract starts the tesseract binary, which loads the language
+#     data again, for every region (MEDREAD_OCR_ENGINE=auto, tesserocr or pytesseract). MEDREAD_OCR_LANG (e.g. "eng+fra"), MEDREAD_OCR_PSM (page segmentation
+#     mode, 3 = automatic) and MEDREAD_TESSDATA_PREFIX select the language data and layout analysis;
+#   * OCRResult: the text plus a confidence per word, from the same Tesseract pass. Consecutive words
+#     below MEDREAD_OCR_LOW_CONFIDENCE are reported as low-confidence runs so they can be flagged.
+
+import os                                   # For reading configuration from the environment
+import threading                            # For per-thread Tesseract handles
+
+import cv2                                  # For resizing, thresholding and rotation (OpenCV)
+import numpy as np                          # For row profiles
+# tesserocr / pytesseract are imported when the first engine is created
+
+OCR_LANG = os.environ.get("MEDREAD_OCR_LANG", "eng")
+OCR_PSM = int(os.environ.get("MEDREAD_OCR_PSM", 3))
+OCR_ENGINE = os.environ.get("MEDREAD_OCR_ENGINE", "auto")
+TESSDATA_PREFIX = os.environ.get("MEDREAD_TESSDATA_PREFIX")
+
+OCR_DPI = int(os.environ.get("MEDREAD_OCR_DPI", 300))
+OCR_BINARIZE = os.environ.get("MEDREAD_OCR_BINARIZE", "otsu")
+OCR_MAX_SKEW = float(os.environ.get("MEDREAD_OCR_MAX_SKEW", 5.0))
+TILE_MIN_HEIGHT = int(os.environ.get("MEDREAD_OCR_TILE_MIN_HEIGHT", 800))
+LOW_CONFIDENCE = float(os.environ.get("MEDREAD_OCR_LOW_CONFIDENCE", 60))
+
+ENGINES = ("auto", "tesserocr", "pytesseract")
+BINARIZATIONS = ("otsu", "adaptive", "none")
+
+# Long side of an A4 page in inches (Letter is 11); used to estimate the resolution of a scan
+PAGE_LONG_SIDE_INCHES = 11.69
+# Skew is estimated on a copy no larger than this, which keeps it to a few milliseconds
+SKEW_MAX_SIDE = 640
+# White border added around every region; Tesseract misses glyphs touching the image edge
+REGION_PADDING = 10
+
+
+class OCRWord:
+    """One recognised word: text, Tesseract confidence (0-100), bounding box on the page and line number."""
+
+    def __init__(self, text, confidence, left, top, width, height, line):
+        self.text = text
+        self.confidence = confidence
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+        self.line = line
+
+
+class OCRResult:
+    """Text of a page (or of several pages) and its words with their confidences."""
+
+    def __init__(self, text, words):
+        self.text = text
+        self.words = words
+
+    @property
+    def mean_confidence(self):
+        return float(np.mean([word.confidence for word in self.words])) if self.words else None
+
+    # Runs of consecutive words on one line whose confidence is below `threshold`
+    def low_confidence_runs(self, threshold=LOW_CONFIDENCE):
+        runs, current = [], []
+        for index, word in enumerate(self.words):
+            if word.confidence < threshold and (not current or self.words[current[-1]].line == word.line):
+                current.append(index)
+                continue
+            if current:
+                runs.append(current)
+            current = [index] if word.confidence < threshold else []
+        if current:
+            runs.append(current)
+        return [{"text": " ".join(self.words[i].text for i in run),
+                 "confidence": min(self.words[i].confidence for i in run),
+                 "first_word": run[0], "words": len(run)} for run in runs]
+
+    # Compact form for API responses
+    def summary(self, threshold=LOW_CONFIDENCE):
+        mean = self.mean_confidence
+        return {"words": len(self.words), "mean_confidence": None if mean is None else round(mean, 1),
+                "low_confidence_threshold": threshold, "low_confidence_runs": self.low_confidence_runs(threshold)}
+
+
+#Joins the results of the regions of a page (top to bottom) or of the pages of a document. `offsets`
+#are the vertical positions of the regions on the page, so word boxes stay in page coordinates.
+def merge_results(results, offsets=None):
+    text, words, line_base = [], [], 0
+    for index, result in enumerate(results):
+        offset = offsets[index] if offsets else 0
+        if result.text:
+            text.append(result.text)
+        for word in result.words:
+            words.append(OCRWord(word.text, word.confidence, word.left, word.top + offset, word.width, word.height,
+                                 word.line + line_base))
+        line_base += max((word.line for word in result.words), default=-1) + 1
+    return OCRResult("\n\n".join(text), words)
+
+
+#Resolution of a page scan, estimated from its long side as if it were an A4 page.
+def estimate_dpi(image):
+    return max(image.shape[:2]) / PAGE_LONG_SIDE_INCHES
+
+
+#Binarizes a grayscale page to black text on white.
+def binarize(gray, method=OCR_BINARIZE, dpi=OCR_DPI):
+    if method not in BINARIZATIONS:
+        raise ValueError(f"Unknown binarization {method!r}, expected one of {BINARIZATIONS}")
+    if method == "none":
+        return gray
+    if method == "adaptive":
+        block = int(dpi / 10) | 1           # About a tenth of an inch, odd
+        binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, block, 15)
+    else:
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Light text on a dark background: invert so the page is mostly white
+    if np.count_nonzero(binary) < binary.size // 2:
+        binary = cv2.bitwise_not(binary)
+    return binary
+
+
+#Rotates about the centre; corners outside the original are filled with `border` (white by default).
+def _rotate(image, angle, interpolation=cv2.INTER_NEAREST, border=255):
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2.0, height / 2.0), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), flags=interpolation, borderValue=border)
+
+
+def _profile_score(ink, angle):
+    rows = _rotate(ink, angle, cv2.INTER_LINEAR, border=0).sum(axis=1, dtype=np.float64)
+    return float(np.var(rows))
+
+
+#Skew angle (degrees) of the text lines of a black-on-white page: the rotation that makes the row
+#profile of the ink peakiest, searched in 1 degree steps and refined in 0.2 degree steps.
+def estimate_skew(binary, max_skew=OCR_MAX_SKEW):
+    if max_skew <= 0:
+        return 0.0
+    scale = SKEW_MAX_SIDE / float(max(binary.shape[:2]))
+    small = binary
+    if scale < 1.0:
+        small = cv2.resize(binary, (max(1, int(binary.shape[1] * scale)), max(1, int(binary.shape[0] * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ink = 255 - small
+    if not ink.any():
+        return 0.0
+    coarse = np.arange(-max_skew, max_skew + 1e-6, 1.0)
+    best = max(coarse, key=lambda angle: _profile_score(ink, angle))
+    fine = np.arange(best - 0.8, best + 0.8 + 1e-6, 0.2)
+    return float(max(fine, key=lambda angle: _profile_score(ink, angle)))
+
+
+#Prepares a page for Tesseract and returns (image, dpi): grayscale, downscaled to `target_dpi` when the
+#page resolution (given, or estimated from its size) is above it, binarized and deskewed. Pages are
+#never upscaled.
+def preprocess_page(image, dpi=None, target_dpi=OCR_DPI, method=OCR_BINARIZE, max_skew=OCR_MAX_SKEW):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    dpi = dpi or estimate_dpi(gray)
+    if dpi > target_dpi * 1.05:             # Not for the few pixels an estimate can be off by
+        scale = target_dpi / dpi
+        gray = cv2.resize(gray, (max(1, int(gray.shape[1] * scale)), max(1, int(gray.shape[0] * scale))),
+                          interpolation=cv2.INTER_AREA)
+        dpi = target_dpi
+    binary = binarize(gray, method, dpi)
+    ink_map = binary if method != "none" else binarize(gray, "otsu", dpi)
+    angle = estimate_skew(ink_map, max_skew)
+    if abs(angle) >= 0.2:
+        binary = _rotate(binary, angle, cv2.INTER_NEAREST if method != "none" else cv2.INTER_LINEAR)
+    return binary, int(round(dpi))
+
+
+#Cuts a preprocessed page into horizontal bands at blank rows between text lines. Returns
+#[(top, region), ...] from top to bottom; each region is padded with a white border and `top` is
+#the page row of the region's first (padding) row. Pages shorter than 2 * min_height stay whole;
+#blank margins are dropped and a blank page gives no regions.
+def split_regions(page, min_height=TILE_MIN_HEIGHT, max_regions=None):
+    ink = np.count_nonzero(page < 128, axis=1)
+    blank = ink <= max(2, page.shape[1] // 500)
+    text_rows = np.flatnonzero(~blank)
+    if len(text_rows) == 0:
+        return []
+    start, stop = int(text_rows[0]), int(text_rows[-1]) + 1
+    count = max(1, (stop - start) // max(1, min_height))
+    if max_regions:
+        count = min(count, max_regions)
+
+    cuts, blank_rows = [start], np.flatnonzero(blank[start:stop]) + start
+    band = (stop - start) / count
+    for k in range(1, count):
+        target = start + k * band
+        candidates = blank_rows[(blank_rows > cuts[-1] + band / 2) & (np.abs(blank_rows - target) <= band / 2)]
+        if len(candidates):
+            cuts.append(int(candidates[np.argmin(np.abs(candidates - target))]))
+    cuts.append(stop)
+
+    regions = []
+    for top, bottom in zip(cuts[:-1], cuts[1:]):
+        region = cv2.copyMakeBorder(page[top:bottom], REGION_PADDING, REGION_PADDING, REGION_PADDING,
+                                    REGION_PADDING, cv2.BORDER_CONSTANT, value=255)
+        regions.append((top - REGION_PADDING, region))
+    return regions
+
+
+#Picks the Tesseract binding: tesserocr when installed (or required), else pytesseract.
+def resolve_engine(engine=OCR_ENGINE):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown OCR engine {engine!r}, expected one of {ENGINES}")
+    if engine != "auto":
+        return engine
+    try:
+        import tesserocr  # noqa: F401
+        return "tesserocr"
+    except ImportError:
+        return "pytesseract"
+
+
+class TesseractEngine:
+    """Reads preprocessed regions with Tesseract. With tesserocr the API handle (and its language data)
+    is created once and reused; it is not thread-safe, so use one engine per thread (see engine())."""
+
+    def __init__(self, lang=OCR_LANG, psm=OCR_PSM, engine=OCR_ENGINE, tessdata=TESSDATA_PREFIX):
+        self.lang = lang
+        self.psm = psm
+        self.tessdata = tessdata
+        self.engine = resolve_engine(engine)
+        self._api = None
+        if self.engine == "tesserocr":
+            from tesserocr import PyTessBaseAPI
+            options = {"path": tessdata} if tessdata else {}
+            self._api = PyTessBaseAPI(lang=lang, psm=psm, **options)
+
+    def describe(self):
+        return f"{self.engine}|{self.lang}|psm{self.psm}"
+
+    # Text and words of one region (uint8 grayscale or binary, dark text on white)
+    def read(self, region, dpi=OCR_DPI):
+        region = np.ascontiguousarray(region)
+        if self._api is not None:
+            return self._read_tesserocr(region, dpi)
+        return self._read_pytesseract(region, dpi)
+
+    def _read_tesserocr(self, region, dpi):
+        from tesserocr import RIL, iterate_level
+        api = self._api
+        height, width = region.shape[:2]
+        api.SetImageBytes(region.tobytes(), width, height, 1, width)
+        api.SetSourceResolution(int(dpi))
+        api.Recognize()
+        words, line = [], -1
+        for item in iterate_level(api.GetIterator(), RIL.WORD):
+            if item.IsAtBeginningOf(RIL.TEXTLINE):
+                line += 1
+            text = item.GetUTF8Text(RIL.WORD)
+            confidence = item.Confidence(RIL.WORD)
+            if not text or not text.strip() or confidence < 0:
+                continue
+            left, top, right, bottom = item.BoundingBox(RIL.WORD)
+            words.append(OCRWord(text.strip(), float(confidence), left, top, right - left, bottom - top, max(line, 0)))
+        return OCRResult(api.GetUTF8Text().strip(), words)
+
+    def _read_pytesseract(self, region, dpi):
+        import pytesseract                  # For Optical Character Recognition (OCR)
+        config = f"--psm {self.psm} --dpi {int(dpi)}"
+        if self.tessdata:
+            config += f' --tessdata-dir "{self.tessdata}"'
+        data = pytesseract.image_to_data(region, lang=self.lang, config=config, output_type=pytesseract.Output.DICT)
+
+        # One pass gives both: words with confidences, and the text laid out like image_to_string
+        # (words joined by spaces, lines by newlines, paragraphs by a blank line)
+        words, parts, previous, line = [], [], None, -1
+        for i, text in enumerate(data["text"]):
+            confidence = float(data["conf"][i])
+            if int(data["level"][i]) != 5 or not text.strip() or confidence < 0:
+                continue
+            key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+            if key != previous:
+                line += 1
+                if previous is not None:
+                    parts.append("\n\n" if key[:2] != previous[:2] else "\n")
+                previous = key
+            elif parts:
+                parts.append(" ")
+            parts.append(text.strip())
+            words.append(OCRWord(text.strip(), confidence, int(data["left"][i]), int(data["top"][i]),
+                                 int(data["width"][i]), int(data["height"][i]), line))
+        return OCRResult("".join(parts), words)
+
+
+_local = threading.local()
+
+
+#The calling thread's engine, created on first use with the configured language, PSM and binding.
+def engine():
+    if getattr(_local, "engine", None) is None:
+        _local.engine = TesseractEngine()
+    return _local.engine
+
+
+#Describes the OCR configuration, for cache keys: results change whenever any of it does.
+def describe_ocr():
+    return f"{resolve_engine()}|{OCR_LANG}|psm{OCR_PSM}|{OCR_BINARIZE}@{OCR_DPI}|skew{OCR_MAX_SKEW:g}"
+
+
+#Reads one preprocessed region with this thread's engine.
+def read_region(region, dpi=OCR_DPI):
+    return engine().read(region, dpi)
+
+
+#Preprocesses a page, splits it into regions and reads them one after the other in this thread.
+def read_page(image, dpi=None):
+    page, dpi = preprocess_page(image, dpi)
+    regions = split_regions(page)
+    results = [read_region(region, dpi) for _, region in regions]
+    return merge_results(results, [top for top, _ in regions])
@@ -0,0 +1,86 @@
+# Opt-in request profiling for finding where a slow /predict spends its time.
+#
+# With MEDREAD_PROFILE_SAMPLE_RATE above 0 (e.g. 0.01 for one request in a hundred) a sampled request
+# runs under a profiler and its trace is written to MEDREAD_PROFILE_DIR:
+#   * "cprofile" (default) - a .prof file from the standard library profiler, for pstats or snakeviz;
+#   * "pyinstrument"       - an .html call tree (pip install pyinstrument).
+# Only one request is profiled at a time, and profilers only see the calling thread: the batched CNN
+# forward pass runs on the micro-batcher thread and appears as time spent waiting for it.
+
+import logging                              # For reporting where traces are written
+import os                                   # For reading configuration from the environment
+import random                               # For request sampling
+import threading                            # To profile one request at a time
+import time                                 # For trace file names
+from contextlib import contextmanager       # For the profile context manager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SAMPLE_RATE = float(os.environ.get("MEDREAD_PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("MEDREAD_PROFILE_DIR", "profiles")
+PROFILER = os.environ.get("MEDREAD_PROFILER", "cprofile")
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class RequestProfiler:
+    """Profiles a random sample of requests and writes one trace file per sampled request."""
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, directory=PROFILE_DIR, profiler=PROFILER):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}, expected one of {PROFILERS}")
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.profiler = profiler
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    # Profiles the enclosed block if this request is sampled (and no other request is being profiled)
+    @contextmanager
+    def profile(self, name):
+        if not self.enabled or random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            yield
+            return
+        try:
+            if self.profiler == "pyinstrument":
+                with self._pyinstrument(name):
+                    yield
+            else:
+                with self._cprofile(name):
+                    yield
+        finally:
+            self._active.release()
+
+    def _path(self, name, extension):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.getrandbits(32):08x}.{extension}")
+
+    @contextmanager
+    def _cprofile(self, name):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = self._path(name, "prof")
+            profiler.dump_stats(path)
+            logger.info(f"Request profile written to {path}")
+
+    @contextmanager
+    def _pyinstrument(self, name):
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = self._path(name, "html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info(f"Request profile written to {path}")
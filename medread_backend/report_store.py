@@ -0,0 +1,221 @@
+# Per-request storage for generated PDF reports.
+#
+# Every /predict call gets its own report ID, and /download_report/<id> serves exactly that report,
+# so concurrent users never see each other's files. Small reports stay in memory as bytes and never
+# touch disk; larger ones are spilled to MEDREAD_REPORT_DIR. A background sweeper deletes reports
+# once they are older than the TTL.
+#
+# A report may also be stored while it is still being rendered (a Future from the render pool, or a
+# lazy report rendered on first download, see reports.ReportRenderer). A Future's bytes are stored as
+# soon as it finishes; get() waits for / triggers the rendering otherwise.
+#
+# Shared mode (MEDREAD_SHARED_STATE=1, set by gunicorn.conf.py when it runs several workers) lets any
+# worker serve any ID without sticky routing: every report is written to MEDREAD_REPORT_DIR, which must
+# then be shared by all workers (the default temporary directory is, on one host). A report still
+# being rendered is marked by an <id>.pending file, and a worker that does not hold the render waits
+# for the PDF to appear; a failed render leaves <id>.failed. Lazy reports cannot be rendered by another
+# worker, so the app renders them in the pool instead in this mode. The async job queue publishes its
+# job status files (job-<id>.json) to the same directory, and the sweeper expires them too.
+
+import logging                              # For sweeper logging
+import os                                   # For the on-disk spill directory
+import re                                   # To validate report IDs before touching the filesystem
+import tempfile                             # For the default spill directory
+import threading                            # For the lock and the sweeper thread
+import time                                 # For TTL bookkeeping
+import uuid                                 # For report IDs
+
+logger = logging.getLogger(__name__)
+
+REPORT_TTL_SECONDS = int(os.environ.get("MEDREAD_REPORT_TTL", 3600))
+REPORT_MEMORY_MAX_BYTES = int(os.environ.get("MEDREAD_REPORT_MEMORY_MAX_BYTES", 1024 * 1024))
+REPORT_DIR = os.environ.get("MEDREAD_REPORT_DIR", os.path.join(tempfile.gettempdir(), "medread_reports"))
+REPORT_SWEEP_INTERVAL = int(os.environ.get("MEDREAD_REPORT_SWEEP_INTERVAL", 60))
+REPORT_RENDER_TIMEOUT = float(os.environ.get("MEDREAD_REPORT_RENDER_TIMEOUT", 60))
+SHARED_STATE = os.environ.get("MEDREAD_SHARED_STATE", "0") in ("1", "true", "yes")
+
+# How often a worker checks the shared directory for a report another worker is rendering
+REPORT_POLL_SECONDS = 0.1
+
+REPORT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+#Returns a fresh, unguessable report ID.
+def new_report_id():
+    return uuid.uuid4().hex
+
+
+#True if the string looks like an ID produced by new_report_id.
+def is_valid_report_id(report_id):
+    return bool(REPORT_ID_PATTERN.match(report_id or ""))
+
+
+class ReportStore:
+    """Report bytes keyed by request ID, kept in memory when small and on disk otherwise."""
+
+    def __init__(self, directory=REPORT_DIR, ttl_seconds=REPORT_TTL_SECONDS,
+                 memory_max_bytes=REPORT_MEMORY_MAX_BYTES, sweep_interval=REPORT_SWEEP_INTERVAL, shared=SHARED_STATE):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.shared = shared
+        # Shared mode keeps nothing in memory: any worker must be able to serve the report
+        self.memory_max_bytes = 0 if shared else memory_max_bytes
+        self.sweep_interval = sweep_interval
+        self._memory = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, report_id, suffix=".pdf"):
+        return os.path.join(self.directory, report_id + suffix)
+
+    # Stores the PDF for a report ID: its bytes, or a pending report with a result() method (and, for a
+    # Future, add_done_callback, through which the bytes are stored as soon as they are ready)
+    def put(self, report_id, data):
+        if not is_valid_report_id(report_id):
+            raise ValueError(f"Invalid report id: {report_id!r}")
+        if not isinstance(data, bytes):
+            with self._lock:
+                self._pending[report_id] = (time.time(), data)
+            if self.shared:
+                open(self._path(report_id, ".pending"), "wb").close()
+            if hasattr(data, "add_done_callback"):
+                data.add_done_callback(lambda future: self._finish(report_id, future))
+            return
+        if len(data) <= self.memory_max_bytes:
+            with self._lock:
+                self._memory[report_id] = (time.time(), data)
+            return
+        tmp_path = f"{self._path(report_id)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(report_id))
+
+    # Returns ("bytes", data) or ("path", file_path) for a live report, or None if unknown or expired
+    def get(self, report_id):
+        if not is_valid_report_id(report_id):
+            return None
+        now = time.time()
+        with self._lock:
+            pending = self._pending.get(report_id)
+        if pending is not None:
+            return self._resolve(report_id, *pending)
+
+        with self._lock:
+            entry = self._memory.get(report_id)
+        if entry is not None:
+            created, data = entry
+            if now - created <= self.ttl_seconds:
+                return "bytes", data
+            self.delete(report_id)
+            return None
+
+        if self.shared:
+            self._wait_for_other_worker(report_id)
+        path = self._path(report_id)
+        try:
+            if now - os.path.getmtime(path) <= self.ttl_seconds:
+                return "path", path
+        except OSError:
+            return None
+        self.delete(report_id)
+        return None
+
+    # Done callback of a pending Future: stores its bytes in place of the pending entry. A failed render
+    # stays pending, so get() raises its error here, and is marked failed for the other workers.
+    def _finish(self, report_id, future):
+        if future.cancelled() or future.exception() is not None:
+            if self.shared:
+                try:
+                    os.replace(self._path(report_id, ".pending"), self._path(report_id, ".failed"))
+                except OSError:
+                    pass
+            return
+        try:
+            self.put(report_id, future.result())
+        except OSError as e:
+            logger.error(f"Could not store report {report_id}: {e}")
+            return
+        with self._lock:
+            self._pending.pop(report_id, None)
+        if self.shared:
+            self._remove(self._path(report_id, ".pending"))
+
+    # Shared mode: waits while another worker is still rendering the report
+    def _wait_for_other_worker(self, report_id):
+        deadline = time.time() + REPORT_RENDER_TIMEOUT
+        while os.path.exists(self._path(report_id, ".pending")) and not os.path.exists(self._path(report_id)):
+            if time.time() > deadline:
+                raise TimeoutError(f"Report {report_id} is still being rendered")
+            time.sleep(REPORT_POLL_SECONDS)
+        if os.path.exists(self._path(report_id, ".failed")):
+            raise RuntimeError(f"Report {report_id} could not be rendered")
+
+    # Waits for (or runs) a pending report's rendering and stores the bytes in its place
+    def _resolve(self, report_id, created, pending):
+        if time.time() - created > self.ttl_seconds:
+            self.delete(report_id)
+            return None
+        data = pending.result(timeout=REPORT_RENDER_TIMEOUT)
+        # Bytes first, then drop the pending entry, so a concurrent get() always finds one of them
+        self.put(report_id, data)
+        with self._lock:
+            self._pending.pop(report_id, None)
+        if self.shared:
+            self._remove(self._path(report_id, ".pending"))
+        return self.get(report_id)
+
+    def delete(self, report_id):
+        with self._lock:
+            self._memory.pop(report_id, None)
+            self._pending.pop(report_id, None)
+        for suffix in (".pdf", ".pending", ".failed"):
+            self._remove(self._path(report_id, suffix))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Removes every report older than the TTL; returns how many were deleted
+    def sweep(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [rid for rid, (created, _) in self._memory.items() if created < cutoff]
+            for report_id in expired:
+                del self._memory[report_id]
+            expired_pending = [rid for rid, (created, _) in self._pending.items() if created < cutoff]
+            for report_id in expired_pending:
+                del self._pending[report_id]
+            expired += expired_pending
+        removed = len(expired)
+
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"Report sweeper removed {removed} expired report(s)")
+        return removed
+
+    # Starts the background TTL sweeper (idempotent)
+    def start_sweeper(self):
+        if self._sweeper is not None:
+            return
+        self._sweeper = threading.Thread(target=self._sweep_forever, name="report-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Report sweeper failed: {e}")
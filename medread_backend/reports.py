@@ -0,0 +1,198 @@
+# PDF report rendering for /predict, /predict/batch and the batch CLI.
+#
+# Reports are built with reportlab into a path or an in-memory buffer; the LIME image is embedded
+# from bytes, so nothing has to touch disk. reportlab and matplotlib are imported on first use to
+# keep them out of the backend's startup time.
+#
+# The paragraph styles are built once per process and never mutated. ReportRenderer decides where
+# the rendering happens (MEDREAD_REPORT_RENDER):
+#   * "sync"  - on the calling thread, as part of the request;
+#   * "pool"  - in a pool of worker processes; the request returns straight away and the download
+#               waits for the PDF if it is not finished yet (reportlab is pure Python, so processes
+#               rather than threads are what makes batch rendering scale with cores);
+#   * "lazy"  - only when /download_report asks for it, so reports nobody downloads cost nothing.
+# Render times are recorded as the pdf_build stage (see metrics.py); in "pool" mode that is measured
+# from submission, so it includes time spent waiting for a free worker.
+
+import multiprocessing                      # For the spawn context of the render pool
+import os                                   # For reading configuration from the environment
+import threading                            # For the lazy report and pool locks
+import time                                 # For timing pooled renders
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache             # For building the styles once
+from io import BytesIO                      # For rendering reports and images in memory
+from xml.sax.saxutils import escape         # Paragraph text is markup; OCR output may contain <, & ...
+
+import metrics                              # For the pdf_build stage timings
+
+REPORT_RENDER_MODE = os.environ.get("MEDREAD_REPORT_RENDER", "pool")
+REPORT_RENDER_WORKERS = int(os.environ.get("MEDREAD_REPORT_WORKERS", 2))
+
+RENDER_MODES = ("sync", "pool", "lazy")
+
+
+#Process-wide reportlab settings, applied once. Images are embedded as binary streams instead of
+#ASCII85 text: without reportlab's C accelerator the ASCII85 encoding of the LIME JPEG is most of a
+#CT report's render time, and the binary stream is smaller too.
+@lru_cache(maxsize=None)
+def _configure_reportlab():
+    from reportlab import rl_config
+    rl_config.useA85 = 0
+
+#The report's paragraph styles, built once per process. The bold heading is a new style derived from
+#Heading2 rather than Heading2 modified in place.
+@lru_cache(maxsize=None)
+def report_styles():
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    sample = getSampleStyleSheet()
+    return {
+        "title": sample["Title"],
+        "heading": ParagraphStyle("MedReadHeading", parent=sample["Heading2"], fontName="Helvetica-Bold"),
+        "normal": sample["Normal"],
+    }
+
+# Custom function for adding bold and space in titles
+def bold_title_style():
+    return report_styles()["heading"]
+
+#Builds the PDF report. `output` may be a file path or an in-memory file object (BytesIO); `lime_image`
+#may be JPEG bytes, a path or a file object; `notes` are extra lines shown under the prediction.
+def generate_pdf(output, report_type, predicted_class, probability=None, extracted_text=None, lime_explanation=None, img_path=None, lime_image=None, notes=None):
+    from reportlab.lib.pagesizes import letter                 # For setting PDF page size
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Image, Spacer  # For PDF report generation
+
+    _configure_reportlab()
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    styles = report_styles()
+    elements = []
+
+    elements.append(Paragraph("<b>Lung Cancer Detection Report</b>", styles["title"]))
+    elements.append(Spacer(1, 12))
+    elements.append(Paragraph(f"Type: {escape(str(report_type))}", styles["heading"]))
+    elements.append(Spacer(1, 6))
+    elements.append(Paragraph(f"Predicted Class: {escape(str(predicted_class))}", styles["normal"]))
+    elements.append(Spacer(1, 12))
+    for note in notes or []:
+        elements.append(Paragraph(escape(note), styles["normal"]))
+        elements.append(Spacer(1, 6))
+
+    if report_type == "CT scan":
+        elements.append(Paragraph(f"Prediction Probability: {probability:.4f}", styles["normal"]))
+        elements.append(Spacer(1, 6))
+        if lime_image:
+            if isinstance(lime_image, bytes):
+                lime_image = BytesIO(lime_image)
+            elements.append(Paragraph("LIME Explanation (CT Scan):", styles["heading"]))
+            elements.append(Spacer(1, 6))
+            elements.append(Image(lime_image, width=200, height=200))
+    else:
+        elements.append(Paragraph("Extracted Text:", styles["heading"]))
+        elements.append(Spacer(1, 6))
+        elements.append(Paragraph(escape(extracted_text or ""), styles["normal"]))
+        elements.append(Spacer(1, 12))
+
+        elements.append(Paragraph("LIME Explanation:", styles["heading"]))
+        elements.append(Spacer(1, 6))
+        for word, weight in lime_explanation or []:
+            elements.append(Paragraph(f"{escape(str(word))}: {weight:.4f}", styles["normal"]))
+            elements.append(Spacer(1, 6))
+
+    doc.build(elements)
+    return output
+
+#Renders the PDF report in memory and returns its bytes.
+def render_pdf_bytes(report_type, predicted_class, **kwargs):
+    buffer = BytesIO()
+    generate_pdf(buffer, report_type, predicted_class, **kwargs)
+    return buffer.getvalue()
+
+#Extra report lines: the slices of a CT study or the pages of a report, and how reliable the OCR was
+#(passages Tesseract read with low confidence should be checked against the original).
+def response_notes(response):
+    notes = []
+    if "slices" in response:
+        notes.append(f"Slices analysed: {response['slices']} ({response['aggregation']} of slice predictions)")
+        notes.append(f"Key slice: {response['key_slice'] + 1}")
+    if "pages" in response:
+        notes.append(f"Pages: {response['pages']}")
+    ocr = response.get("ocr")
+    if ocr and ocr["words"]:
+        notes.append(f"OCR mean confidence: {ocr['mean_confidence']:.0f}/100 over {ocr['words']} words")
+        runs = ocr["low_confidence_runs"]
+        if runs:
+            shown = "; ".join(f'"{run["text"]}"' for run in runs[:10])
+            notes.append(f"Low-confidence text ({len(runs)} passages): {shown}" + (" ..." if len(runs) > 10 else ""))
+    return notes
+
+#Renders the report for a prediction response (the JSON returned by /predict or a batch result line).
+def render_response_pdf(response, lime_image=None):
+    if response["type"] == "CT scan":
+        return render_pdf_bytes("CT scan", response["predicted_class"], probability=response["probability"],
+                                lime_image=lime_image, notes=response_notes(response))
+    return render_pdf_bytes("Text report", response["predicted_class"], extracted_text=response.get("extracted_text"),
+                            lime_explanation=response.get("lime_explanation") or [], notes=response_notes(response))
+
+#Encodes the LIME explanation image as JPEG bytes without writing it to disk.
+def encode_lime_image(explanation_image):
+    from matplotlib.image import imsave    # Same encoder as pyplot.imsave, without loading pyplot
+    buffer = BytesIO()
+    imsave(buffer, explanation_image, format="jpg")
+    return buffer.getvalue()
+
+
+class LazyReport:
+    """A report rendered on the first result() call; same interface as a Future."""
+
+    def __init__(self, response, lime_image=None):
+        self.response = response
+        self.lime_image = lime_image
+        self._data = None
+        self._lock = threading.Lock()
+
+    def result(self, timeout=None):
+        with self._lock:
+            if self._data is None:
+                with metrics.timer("pdf_build", mode="lazy"):
+                    self._data = render_response_pdf(self.response, self.lime_image)
+            return self._data
+
+
+class ReportRenderer:
+    """Renders reports synchronously, in a process pool, or lazily on download (see module comment)."""
+
+    def __init__(self, mode=REPORT_RENDER_MODE, workers=REPORT_RENDER_WORKERS):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown report render mode {mode!r}, expected one of {RENDER_MODES}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    # The pool is started on first use; "spawn" keeps TensorFlow and the models out of the workers
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    # Returns the PDF bytes ("sync") or an object whose result() returns them ("pool", "lazy")
+    def submit(self, response, lime_image=None):
+        response = dict(response)
+        if self.mode == "sync":
+            with metrics.timer("pdf_build", mode="sync"):
+                return render_response_pdf(response, lime_image)
+        if self.mode == "lazy":
+            return LazyReport(response, lime_image)
+        started = time.perf_counter()
+        future = self.pool().submit(render_response_pdf, response, lime_image)
+        future.add_done_callback(lambda _: metrics.observe(
+            "stage_duration_seconds", time.perf_counter() - started, buckets=metrics.LATENCY_SECONDS_BUCKETS,
+            stage="pdf_build", mode="pool"))
+        return future
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
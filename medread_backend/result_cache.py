@@ -0,0 +1,205 @@
+# Content-addressed cache for /predict results.
+#
+# Entries are keyed by a SHA-256 of the uploaded bytes, the model/vectorizer fingerprint and any
+# per-request options that change the output (e.g. LIME sample counts). Each entry holds the JSON
+# response, the rendered LIME image and the PDF report, so a repeat upload skips OCR, inference,
+# LIME and PDF generation entirely.
+#
+# The memory tier is an LRU bounded by total payload size. An optional disk tier (enabled by
+# setting MEDREAD_CACHE_DIR) keeps entries across restarts and is pruned oldest-first. Its size is kept
+# as a running total of the bytes written; the directory is only walked at startup and when the total
+# goes over the limit, which also resynchronises it with files written by other processes.
+
+import hashlib                              # For content addressing
+import json                                 # For storing the JSON response on disk
+import logging                              # For hit/miss logging
+import os                                   # For the on-disk tier
+import threading                            # To guard the LRU across request threads
+from collections import OrderedDict         # For LRU ordering
+
+import metrics                              # For cache hit/miss counters
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAX_BYTES = int(os.environ.get("MEDREAD_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_DIR = os.environ.get("MEDREAD_CACHE_DIR")
+CACHE_DISK_MAX_BYTES = int(os.environ.get("MEDREAD_CACHE_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+
+# Pruning frees the disk tier down to this fraction of its limit, so a full tier is walked once per
+# few hundred megabytes written rather than on every write
+DISK_PRUNE_TARGET = 0.9
+
+# Artifact name -> file suffix used by the disk tier
+ARTIFACTS = {"pdf": ".pdf", "lime_image": ".lime.jpg"}
+
+
+#Builds a version fingerprint from the model files' names, sizes and modification times, so that
+#replacing any model or vectorizer invalidates every cached result without hashing large files.
+def model_fingerprint(paths, extra=""):
+    digest = hashlib.sha256(extra.encode("utf-8"))
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+#Returns the cache key for an upload: hash of the bytes, the model fingerprint and the options.
+def cache_key(data, fingerprint, **options):
+    digest = hashlib.sha256(data)
+    digest.update(fingerprint.encode("utf-8"))
+    digest.update(json.dumps(options, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _entry_size(entry):
+    size = len(json.dumps(entry["response"]))
+    for name in ARTIFACTS:
+        if entry.get(name):
+            size += len(entry[name])
+    return size
+
+
+class ResultCache:
+    """Size-bounded LRU of prediction results with an optional persistent disk tier."""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, disk_dir=CACHE_DIR, disk_max_bytes=CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_bytes = self._scan_disk()[1]
+
+    # Returns the cached entry ({"response": ..., "pdf": ..., "lime_image": ...}) or None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        tier = "memory"
+        if entry is None and self.disk_dir:
+            entry = self._read_disk(key)
+            if entry is not None:
+                tier = "disk"
+                self._put_memory(key, entry)
+
+        if entry is None:
+            metrics.increment("cache_requests_total", result="miss")
+            logger.info(f"Result cache miss {key[:12]}")
+            return None
+        metrics.increment("cache_requests_total", result="hit", tier=tier)
+        logger.info(f"Result cache hit {key[:12]} ({tier})")
+        return entry
+
+    def put(self, key, response, pdf=None, lime_image=None):
+        entry = {"response": response, "pdf": pdf, "lime_image": lime_image}
+        self._put_memory(key, entry)
+        if self.disk_dir:
+            try:
+                self._write_disk(key, entry)
+            except OSError as e:
+                logger.warning(f"Could not write cache entry {key[:12]} to disk: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _put_memory(self, key, entry):
+        size = _entry_size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old["size"]
+            self._entries[key] = dict(entry, size=size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["size"]
+                metrics.increment("cache_evictions_total", tier="memory")
+
+    def _disk_path(self, key, suffix):
+        return os.path.join(self.disk_dir, key[:2], key + suffix)
+
+    def _read_disk(self, key):
+        response_path = self._disk_path(key, ".json")
+        try:
+            with open(response_path, "r", encoding="utf-8") as f:
+                entry = {"response": json.load(f)}
+            for name, suffix in ARTIFACTS.items():
+                path = self._disk_path(key, suffix)
+                entry[name] = None
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        entry[name] = f.read()
+            os.utime(response_path)
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, entry):
+        os.makedirs(os.path.dirname(self._disk_path(key, ".json")), exist_ok=True)
+        # Artifacts first, response last: the .json file marks the entry as complete
+        written = 0
+        for name, suffix in ARTIFACTS.items():
+            if entry.get(name):
+                written += self._atomic_write(self._disk_path(key, suffix), entry[name])
+        written += self._atomic_write(self._disk_path(key, ".json"), json.dumps(entry["response"]).encode("utf-8"))
+        with self._disk_lock:
+            self._disk_bytes += written
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk()
+
+    # Returns the change in bytes on disk (the file may replace an older version of itself)
+    @staticmethod
+    def _atomic_write(path, data):
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = 0
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data) - previous
+
+    # Walks the disk tier; returns {key: (bytes, last use)} and the total size
+    def _scan_disk(self):
+        entries = {}
+        total = 0
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                total += stat.st_size
+                key = name.split(".", 1)[0]
+                size, mtime = entries.get(key, (0, 0))
+                mtime = stat.st_mtime if name.endswith(".json") else mtime
+                entries[key] = (size + stat.st_size, mtime)
+        return entries, total
+
+    # Deletes the least recently used entries until the disk tier is back under DISK_PRUNE_TARGET of its
+    # size limit; called with _disk_lock held
+    def _prune_disk(self):
+        entries, total = self._scan_disk()
+        target = self.disk_max_bytes * DISK_PRUNE_TARGET if total > self.disk_max_bytes else self.disk_max_bytes
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= target:
+                break
+            for suffix in (".json",) + tuple(ARTIFACTS.values()):
+                try:
+                    os.remove(self._disk_path(key, suffix))
+                except OSError:
+                    pass
+            metrics.increment("cache_evictions_total", tier="disk")
+            total -= size
+        self._disk_bytes = total
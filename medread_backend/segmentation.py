@@ -0,0 +1,118 @@
+# Superpixel segmentation stage for the CT LIME engine.
+#
+# LIME perturbs an image by switching superpixels on and off, so every explanation starts with a
+# segmentation. Quickshift on the full 256x256 image (LIME's default, kept as ours) takes most of a
+# second; this stage adds:
+#   * faster algorithms: "slic" (k-means superpixels) and "grid" (fixed square cells, no image work);
+#   * reduced-resolution segmentation: segment a downscaled copy (MEDREAD_LIME_SEGMENT_SCALE, e.g. 0.5)
+#     and upsample the label map back with nearest neighbour; the CNN still sees full-size images;
+#   * an LRU cache keyed by a hash of the pixels, so re-explaining the same scan (other num_samples,
+#     other num_features, async retries) skips segmentation entirely.
+# benchmarks/bench_lime_segmentation.py reports the latency of each option and how far its top
+# regions move away from the full-resolution quickshift explanation.
+
+import hashlib                              # For the pixel hash used as cache key
+import os                                   # For reading configuration from the environment
+import threading                            # To guard the cache across request threads
+from collections import OrderedDict         # For LRU ordering
+
+import cv2                                  # For downscaling images and upscaling label maps
+import numpy as np                          # For label maps
+
+import metrics                              # For cache hit/miss counters and segmentation timings
+
+SEGMENTATION_METHOD = os.environ.get("MEDREAD_LIME_SEGMENTATION", "quickshift")
+SEGMENT_SCALE = float(os.environ.get("MEDREAD_LIME_SEGMENT_SCALE", 1.0))
+SEGMENT_CACHE_SIZE = int(os.environ.get("MEDREAD_LIME_SEGMENT_CACHE_SIZE", 256))
+
+SLIC_N_SEGMENTS = int(os.environ.get("MEDREAD_LIME_SLIC_SEGMENTS", 100))
+GRID_CELL_SIZE = int(os.environ.get("MEDREAD_LIME_GRID_CELL", 32))
+
+
+# Every segmenter takes the (possibly downscaled) image and the scale it was reduced by, and sizes
+# its superpixels so the segment count stays about the same at any scale.
+
+#LIME's default quickshift settings (kernel size shrunk with the image).
+def quickshift_segments(img, scale=1.0):
+    from skimage.segmentation import quickshift
+    return quickshift(img.astype(np.float64), kernel_size=max(1.0, 4 * scale), max_dist=200, ratio=0.2)
+
+
+#SLIC superpixels, about n_segments of them.
+def slic_segments(img, scale=1.0, n_segments=SLIC_N_SEGMENTS):
+    from skimage.segmentation import slic
+    return slic(img, n_segments=n_segments, compactness=10, start_label=0)
+
+
+#Fixed square cells of cell_size pixels at full resolution (edge cells may be smaller).
+def grid_segments(img, scale=1.0, cell_size=GRID_CELL_SIZE):
+    cell_size = max(1, round(cell_size * scale))
+    height, width = img.shape[:2]
+    rows = np.arange(height) // cell_size
+    cols = np.arange(width) // cell_size
+    return rows[:, None] * (cols.max() + 1) + cols[None, :]
+
+
+SEGMENTERS = {
+    "quickshift": quickshift_segments,
+    "slic": slic_segments,
+    "grid": grid_segments,
+}
+
+
+#Segments img with `method`, optionally on a copy downscaled by `scale`, and returns a label map at the
+#original resolution with contiguous ids 0..n-1.
+def segment(img, method=SEGMENTATION_METHOD, scale=SEGMENT_SCALE):
+    if method not in SEGMENTERS:
+        raise ValueError(f"Unknown segmentation method {method!r}, expected one of {tuple(SEGMENTERS)}")
+    height, width = img.shape[:2]
+    if scale < 1.0:
+        small = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        labels = SEGMENTERS[method](small, scale).astype(np.int32)
+        labels = cv2.resize(labels, (width, height), interpolation=cv2.INTER_NEAREST)
+    else:
+        labels = SEGMENTERS[method](img)
+    _, contiguous = np.unique(labels, return_inverse=True)
+    return contiguous.reshape(height, width)
+
+
+class Segmenter:
+    """Callable segmentation stage: one method and scale, with an LRU cache keyed by image hash."""
+
+    def __init__(self, method=SEGMENTATION_METHOD, scale=SEGMENT_SCALE, cache_size=SEGMENT_CACHE_SIZE):
+        if method not in SEGMENTERS:
+            raise ValueError(f"Unknown segmentation method {method!r}, expected one of {tuple(SEGMENTERS)}")
+        self.method = method
+        self.scale = scale
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Identifies the configuration, e.g. for result cache fingerprints
+    def describe(self):
+        return f"{self.method}@{self.scale:g}"
+
+    def _key(self, img):
+        digest = hashlib.sha1(np.ascontiguousarray(img).tobytes())
+        digest.update(repr((img.shape, img.dtype.str)).encode())
+        return digest.hexdigest()
+
+    def __call__(self, img):
+        key = self._key(img)
+        with self._lock:
+            segments = self._cache.get(key)
+            if segments is not None:
+                self._cache.move_to_end(key)
+        metrics.increment("segment_cache_requests_total", result="hit" if segments is not None else "miss")
+        if segments is not None:
+            return segments
+
+        with metrics.timer("segmentation", method=self.method):
+            segments = segment(img, self.method, self.scale)
+        segments.flags.writeable = False       # Shared between explanations
+        with self._lock:
+            self._cache[key] = segments
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return segments
@@ -0,0 +1,69 @@
+# Process-level serving support: TensorFlow thread budgets, model warm-up state and health checks.
+#
+# Under a pre-forking server (see gunicorn.conf.py) several worker processes share one machine. Left
+# alone, every worker's TensorFlow sizes its thread pools to all cores and the workers oversubscribe
+# the CPU; MEDREAD_TF_INTRA_OP_THREADS / MEDREAD_TF_INTER_OP_THREADS cap them per worker (0 keeps
+# TensorFlow's default). The caps only take effect before TensorFlow runs its first op, which is why
+# they are applied in each worker right after the fork, before any model is built. The process pools a
+# worker starts (batch decoding, page OCR) default to the same per-worker share of the cores.
+#
+# Readiness tracks whether this process has finished loading and warming up its models, so
+# /readyz can keep traffic away from a worker until its first real request will be fast.
+
+import logging                              # For configuration warnings
+import os                                   # For reading configuration from the environment
+import threading                            # For the readiness event
+import time                                 # For startup timing
+
+logger = logging.getLogger(__name__)
+
+TF_INTRA_OP_THREADS = int(os.environ.get("MEDREAD_TF_INTRA_OP_THREADS", 0))
+TF_INTER_OP_THREADS = int(os.environ.get("MEDREAD_TF_INTER_OP_THREADS", 0))
+
+
+#Cores this process should size its worker pools to: all of them, or under a pre-forking server
+#(MEDREAD_FORKING_SERVER, set by gunicorn.conf.py) an even share for each of the MEDREAD_WORKERS workers.
+def worker_core_share():
+    cores = os.cpu_count() or 1
+    if os.environ.get("MEDREAD_FORKING_SERVER"):
+        return max(1, cores // max(1, int(os.environ.get("MEDREAD_WORKERS", 2))))
+    return cores
+
+
+#Caps TensorFlow's thread pools for this process. Must run before the first TensorFlow op.
+def configure_tf_threads(intra_op=TF_INTRA_OP_THREADS, inter_op=TF_INTER_OP_THREADS):
+    import tensorflow as tf
+    try:
+        if intra_op:
+            tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+        if inter_op:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    except RuntimeError as e:
+        logger.warning(f"TensorFlow thread settings ignored (runtime already initialised): {e}")
+
+
+class Readiness:
+    """Ready/failed state of this process's models, reported by the health endpoints."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._ready = threading.Event()
+        self.error = None
+        self.details = {}
+
+    def mark_ready(self, **details):
+        self.details = dict(details, ready_after_seconds=round(time.time() - self.started, 3))
+        self._ready.set()
+
+    def mark_failed(self, error):
+        self.error = str(error)
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def status(self):
+        state = "ready" if self.is_ready() else ("failed" if self.error else "starting")
+        status = {"status": state, "pid": os.getpid(), "uptime_seconds": round(time.time() - self.started, 3)}
+        if self.error:
+            status["error"] = self.error
+        return dict(status, **self.details)
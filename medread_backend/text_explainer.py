@@ -0,0 +1,77 @@
+# Exact word attributions for the TF-IDF + RandomForest text classifier.
+#
+# LIME estimates word importance by classifying hundreds of perturbed copies of the report. For a
+# tree ensemble the attribution can be read off the trees directly (tree-path contributions,
+# Saabas-style): whenever a decision path moves from a node to its child, the change in class
+# probability is credited to the feature the node split on. Averaged over the forest, the
+# contributions plus the root bias add up exactly to predict_proba.
+#
+# Every node's probability change and parent split feature are precomputed once, so explaining a
+# report is a single decision_path call plus one bincount. The compact serving format stores the same
+# node tables, so both formats give the same attributions.
+
+import numpy as np                          # For the precomputed node tables and the bincount
+
+from compact_text_model import CompactForest, forest_tables
+
+
+class TreeContributionExplainer:
+    """Per-word contributions for a fitted forest (sklearn or compact_text_model.CompactForest) over a
+    fitted TF-IDF vectorizer."""
+
+    def __init__(self, forest, vectorizer):
+        if isinstance(forest, CompactForest):
+            tables = {"forest_feature": forest.feature, "forest_children": forest.children,
+                      "forest_value": forest.value, "forest_roots": forest.roots}
+        elif hasattr(forest, "estimators_"):
+            tables, _ = forest_tables(forest)
+        else:
+            raise TypeError("TreeContributionExplainer needs a fitted tree ensemble")
+        self.forest = forest
+        self.vectorizer = vectorizer
+        self.classes = list(forest.classes_)
+        self.feature_names = np.asarray(vectorizer.get_feature_names_out())
+
+        # Node tables over all trees, in the same order as forest.decision_path's columns
+        values = np.asarray(tables["forest_value"])
+        split_feature = np.asarray(tables["forest_feature"])
+        children = np.asarray(tables["forest_children"])
+        roots = np.asarray(tables["forest_roots"])
+        self.n_trees = len(roots)
+
+        parent = np.full(len(values), -1, dtype=np.int64)
+        internal = np.flatnonzero(split_feature >= 0)
+        parent[children[internal, 0]] = internal
+        parent[children[internal, 1]] = internal
+
+        has_parent = parent >= 0
+        self.node_delta = np.zeros_like(values)
+        self.node_delta[has_parent] = values[has_parent] - values[parent[has_parent]]
+        self.node_feature = np.full(len(values), -1, dtype=np.int64)
+        self.node_feature[has_parent] = split_feature[parent[has_parent]]
+        self.bias = values[roots].mean(axis=0)
+
+    # Returns per-feature contributions (n_features x n_classes) for one TF-IDF row
+    def contributions(self, x):
+        indicator, _ = self.forest.decision_path(x)
+        nodes = indicator.indices
+        nodes = nodes[self.node_feature[nodes] >= 0]
+        n_features = len(self.feature_names)
+        result = np.empty((n_features, len(self.classes)))
+        for c in range(len(self.classes)):
+            result[:, c] = np.bincount(self.node_feature[nodes], weights=self.node_delta[nodes, c],
+                                       minlength=n_features)
+        return result / self.n_trees
+
+    # Same shape as LIME's exp.as_list(): [(word, weight), ...] sorted by |weight|, for the words
+    # that occur in the report. `label` defaults to the predicted class.
+    def explain(self, text, num_features=10, label=None):
+        x = self.vectorizer.transform([text])
+        contrib = self.contributions(x)
+        if label is None:
+            label = self.classes[int(np.argmax(self.bias + contrib.sum(axis=0)))]
+        column = contrib[:, self.classes.index(label)]
+
+        present = x.indices
+        order = present[np.argsort(-np.abs(column[present]), kind="stable")][:num_features]
+        return [(str(self.feature_names[i]), float(column[i])) for i in order]
@@ -0,0 +1,88 @@
+# Text normalisation shared by NLP training (models/nlp/nlp_model.py) and the backend.
+#
+# The classifier was trained on lower-cased, letters-only, stopword-free, lemmatised text, so the
+# backend has to apply exactly the same steps before TF-IDF; both sides import this module.
+#
+# The NLTK stopword set and WordNet lemmatizer are created once per process, lemmas are memoised
+# (medical vocabulary is small and very repetitive), and preprocess_batch handles whole corpora,
+# optionally spread over a multiprocessing pool.
+#
+# The NLTK data is installed ahead of time (python text_preprocessing.py, at install or image build
+# time; NLTK_DATA selects the directory). Serving never downloads it: if it is missing, the first use
+# raises an error saying how to install it, which fails the worker's warm-up and /readyz.
+
+import os                                   # For the default worker count
+import re                                   # For stripping non-letters
+from functools import lru_cache             # For the singletons and the lemma cache
+from multiprocessing import Pool            # For corpus-scale batches
+
+# nltk (stopword corpus, WordNet data) is imported by the singletons below, on first use
+
+NLTK_PACKAGES = ("stopwords", "wordnet", "omw-1.4")
+LEMMA_CACHE_SIZE = 200_000
+
+_NON_LETTERS = re.compile(r'[^a-zA-Z\s]')
+
+
+#Downloads the NLTK data into NLTK_DATA (or NLTK's default directory). Run at install or build time.
+def download_nltk_data(quiet=False):
+    import nltk
+    for package in NLTK_PACKAGES:
+        if not nltk.download(package, download_dir=os.environ.get("NLTK_DATA"), quiet=quiet):
+            raise RuntimeError(f"Could not download the NLTK package {package!r}")
+
+
+def _missing_nltk_data():
+    return RuntimeError(f"NLTK data for text preprocessing is not installed ({', '.join(NLTK_PACKAGES)}); "
+                        f"run `python text_preprocessing.py` at install or build time")
+
+
+#The English stopword set, built once per process.
+@lru_cache(maxsize=None)
+def stop_words():
+    from nltk.corpus import stopwords
+    try:
+        return frozenset(stopwords.words('english'))
+    except LookupError as e:
+        raise _missing_nltk_data() from e
+
+
+#The WordNet lemmatizer, created (and its corpus loaded) once per process.
+@lru_cache(maxsize=None)
+def lemmatizer():
+    from nltk.stem import WordNetLemmatizer
+    instance = WordNetLemmatizer()
+    try:
+        instance.lemmatize("warmup")
+    except LookupError as e:
+        raise _missing_nltk_data() from e
+    return instance
+
+
+#Memoised lemmatisation of a single token.
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def lemmatize(word):
+    return lemmatizer().lemmatize(word)
+
+
+#Normalises one document: lowercase, drop non-letters, remove stopwords, lemmatise.
+def preprocess_text(text):
+    text = _NON_LETTERS.sub('', text.lower())
+    stop = stop_words()
+    return ' '.join(lemmatize(word) for word in text.split() if word not in stop)
+
+
+#Normalises a list of documents. With n_jobs > 1 the work is spread over a process pool, each
+#worker keeping its own singletons and lemma cache; n_jobs=-1 uses every core.
+def preprocess_batch(texts, n_jobs=1, chunksize=256):
+    texts = list(texts)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1 or len(texts) < 2 * chunksize:
+        return [preprocess_text(text) for text in texts]
+    with Pool(processes=n_jobs) as pool:
+        return pool.map(preprocess_text, texts, chunksize=chunksize)
+
+
+if __name__ == "__main__":
+    download_nltk_data()
@@ -0,0 +1,192 @@
+# Upload validation and in-memory decoding for /predict and /predict/batch.
+#
+# Multi-page uploads (multi-page TIFFs, PDFs, zip archives of slices) pass the same validation and are
+# decoded page by page in documents.py.
+#
+# The request body is checked (size, format, declared dimensions) from its first bytes before any
+# pixel work happens, then decoded exactly once with cv2.imdecode over an np.frombuffer view of the
+# bytes; nothing is written to disk. Every pipeline input derives from that one decoded buffer:
+#   * the RGB image is a channel-reversed view of the decoded BGR array;
+#   * the OCR / routing input is the grayscale conversion, computed once on first use;
+#   * the CNN input is the CT_INPUT_SIZE float32 tensor, shared as-is by the micro-batcher and LIME.
+
+import os                                   # For reading configuration from the environment
+import struct                               # For reading image headers
+
+import cv2                                  # For decoding and resizing (OpenCV)
+import numpy as np                          # For the zero-copy byte view
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MEDREAD_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.environ.get("MEDREAD_MAX_IMAGE_PIXELS", 50_000_000))
+# Uncompressed size limits for zip archives (slice stacks for /predict, image sets for /predict/batch):
+# each entry is held to the single-upload limit, and all of an archive's entries to MEDREAD_MAX_ARCHIVE_BYTES
+MAX_ARCHIVE_BYTES = int(os.environ.get("MEDREAD_MAX_ARCHIVE_BYTES", 10 * MAX_UPLOAD_BYTES))
+# Request body limit for /predict/batch, which takes several files and archives at once
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("MEDREAD_MAX_BATCH_UPLOAD_BYTES", 10 * MAX_UPLOAD_BYTES))
+
+# Height and width the CNN expects: 256 for the reference model, 128 for the lightweight one
+# (see models/cnn/architectures.py); cnn_runtime checks it against the model it loads
+CT_INPUT_SIZE = (int(os.environ.get("MEDREAD_CT_INPUT_SIZE", 256)),) * 2
+
+# Magic numbers of the formats the pipeline accepts
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip"),
+)
+
+
+class UploadError(ValueError):
+    """Raised for uploads that are rejected before or during decoding; `status_code` is the HTTP status."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+#Identifies the upload format from its magic number; None for anything unsupported.
+def sniff_format(data):
+    for signature, image_format in _SIGNATURES:
+        if data[:len(signature)] == signature:
+            return image_format
+    return None
+
+
+# TIFF IFD tags holding the image size, and the struct codes of the SHORT (3) and LONG (4) field types
+_TIFF_WIDTH, _TIFF_LENGTH = 256, 257
+_TIFF_TYPES = {3: "H", 4: "I"}
+
+#Formats decoded as one image, whose declared size must be readable before decoding. PDFs and zip
+#archives are checked page by page in documents.py.
+_IMAGE_FORMATS = ("jpeg", "png", "bmp", "tiff")
+
+
+#Reads (width, height) from the first IFD of a TIFF without decoding; None if either tag is missing.
+def _tiff_dimensions(data):
+    order = "<" if data[:2] == b"II" else ">"
+    if len(data) < 8:
+        return None
+    offset = struct.unpack(order + "I", data[4:8])[0]
+    if offset + 2 > len(data):
+        return None
+    count = struct.unpack(order + "H", data[offset:offset + 2])[0]
+    size = {}
+    for entry in range(offset + 2, min(offset + 2 + 12 * count, len(data) - 11), 12):
+        tag, field_type = struct.unpack(order + "HH", data[entry:entry + 4])
+        if tag in (_TIFF_WIDTH, _TIFF_LENGTH) and field_type in _TIFF_TYPES:
+            code = _TIFF_TYPES[field_type]
+            size[tag] = struct.unpack(order + code, data[entry + 8:entry + 8 + struct.calcsize(code)])[0]
+    if _TIFF_WIDTH in size and _TIFF_LENGTH in size:
+        return size[_TIFF_WIDTH], size[_TIFF_LENGTH]
+    return None
+
+
+#Reads (width, height) from a PNG, JPEG, BMP or TIFF header without decoding; None if not found.
+def image_dimensions(data, image_format):
+    if image_format == "png" and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if image_format == "bmp" and len(data) >= 26:
+        width, height = struct.unpack("<ii", data[18:26])
+        return abs(width), abs(height)
+    if image_format == "jpeg":
+        # Walk the marker segments up to the first start-of-frame
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:              # Fill byte before the next marker
+                i += 1
+                continue
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            length = struct.unpack(">H", data[i + 2:i + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[i + 5:i + 9])
+                return width, height
+            i += 2 + length
+    if image_format == "tiff":
+        return _tiff_dimensions(data)
+    return None
+
+
+#Checks the zip entries that will be read against the archive limits, from the sizes declared in the
+#archive directory, so nothing is decompressed first (zipfile never inflates an entry past its declared
+#size: a header that understates it fails the CRC check). Raises UploadError (413).
+def check_archive_sizes(infos):
+    for info in infos:
+        if info.file_size > MAX_UPLOAD_BYTES:
+            raise UploadError(f"{info.filename} in the archive is {info.file_size} bytes uncompressed, "
+                              f"above the {MAX_UPLOAD_BYTES} byte limit", status_code=413)
+    total = sum(info.file_size for info in infos)
+    if total > MAX_ARCHIVE_BYTES:
+        raise UploadError(f"Archive is {total} bytes uncompressed, above the {MAX_ARCHIVE_BYTES} byte limit",
+                          status_code=413)
+
+
+#Checks size, format and declared dimensions; returns the format or raises UploadError. An image whose
+#dimensions cannot be read from its header is rejected rather than decoded unchecked.
+def validate_upload(data):
+    if not data:
+        raise UploadError("Empty upload")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise UploadError(f"Upload exceeds {MAX_UPLOAD_BYTES} bytes", status_code=413)
+    image_format = sniff_format(data)
+    if image_format is None:
+        raise UploadError("Unsupported file type: expected a JPEG, PNG, BMP or TIFF image, a PDF or a zip archive",
+                          status_code=415)
+    dimensions = image_dimensions(data, image_format)
+    if dimensions is None and image_format in _IMAGE_FORMATS:
+        raise UploadError(f"Could not read the dimensions of the {image_format.upper()} image", status_code=415)
+    if dimensions is not None and dimensions[0] * dimensions[1] > MAX_IMAGE_PIXELS:
+        raise UploadError(f"Image is {dimensions[0]}x{dimensions[1]}, above the {MAX_IMAGE_PIXELS} pixel limit",
+                          status_code=413)
+    return image_format
+
+
+#Resizes an RGB image to the CNN input size; INTER_NEAREST_EXACT matches Keras/PIL's nearest resize.
+def resize_for_ct(rgb, size=CT_INPUT_SIZE):
+    return cv2.resize(rgb, size, interpolation=cv2.INTER_NEAREST_EXACT)
+
+
+class DecodedUpload:
+    """One decoded image and the pipeline inputs derived from it."""
+
+    def __init__(self, bgr):
+        self.bgr = bgr
+        self._gray = None
+
+    # Decodes the upload bytes in place (np.frombuffer is a view, not a copy)
+    @classmethod
+    def from_bytes(cls, data):
+        bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise UploadError("Uploaded file is not a readable image")
+        return cls(bgr)
+
+    # RGB view of the decoded buffer (no pixel copy)
+    @property
+    def rgb(self):
+        return self.bgr[..., ::-1]
+
+    # Grayscale image for routing and OCR, converted once
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.bgr, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    # CT_INPUT_SIZE RGB uint8 pixels for the CNN
+    def ct_pixels(self):
+        return resize_for_ct(self.rgb)
+
+    # CNN / LIME input: CT_INPUT_SIZE x 3 float32 in [0, 1], no batch axis
+    def ct_tensor(self):
+        tensor = self.ct_pixels().astype(np.float32)
+        tensor /= 255.0
+        return tensor
@@ -0,0 +1,21 @@
+# Production entry point for the backend.
+#
+# Run with the bundled gunicorn settings (from medread_backend/):
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# Under gunicorn, importing this module preloads the fork-safe models (see app.preload_models) once
+# in the master, and the workers forked from it share those pages copy-on-write; each worker then
+# builds its own TensorFlow runtime in a background thread started by the post_fork hook. Under a
+# non-forking WSGI server the whole setup runs in that background thread. Either way the server
+# answers /healthz immediately and /readyz once the models are warm.
+
+import os                                   # For the forking-server flag set by gunicorn.conf.py
+
+import app as backend                       # The Flask application and its model setup
+
+if os.environ.get("MEDREAD_FORKING_SERVER"):
+    backend.preload_models()
+else:
+    backend.start_background_init()
+
+application = backend.app
@@ -61,23 +61,8 @@ const PredictionResult = () => {
         <button
           className="download-button"
           onClick={() => {
-            if (predictionResult.type === "CT scan") {
-              const queryParams = new URLSearchParams({
-                uploaded_image: uploadedImage,
-                type: predictionResult.type,
-                predicted_class: predictionResult.predicted_class,
-                probability: predictionResult.probability,
-              }).toString();
-              window.open(`http://localhost:5000/download_report?${queryParams}`, "_blank");
-            } else {
-              const queryParams = new URLSearchParams({
-                type: predictionResult.type,
-                predicted_class: predictionResult.predicted_class,
-                extracted_text: predictionResult.extracted_text,
-              }).toString();
-
-              window.open(`http://localhost:5000/download_report?${queryParams}`, "_blank");
-            }
+            // Each prediction has its own report; pdf_report is "/download_report/<report_id>"
+            window.open(`http://localhost:5000${predictionResult.pdf_report}`, "_blank");
           }}
         >
           Download Report
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""CNN architectures for the CT scan classifier.
+
+  * reference   - the network defined in cnn_model.py: seven 3x3 convolutions (128/64 filters) with
+                  average/max pooling at 256x256, then a 3000-1500-3 dense head. The 16x16x64 feature
+                  map flattened into Dense(3000) makes it about 54M parameters, 53.7M of them in the
+                  two hidden dense layers;
+  * lightweight - a strided 3x3 stem and depthwise-separable convolutions (32 to 256 filters, batch
+                  normalisation) at 128x128, then global average pooling straight into the softmax.
+                  About 0.14M parameters and a few percent of the reference's FLOPs, which LIME
+                  multiplies by its ~1000 perturbed samples per explanation.
+
+The output layer always computes in float32, so the softmax stays numerically stable when the rest
+of the model runs under the mixed_bfloat16 policy (see train.py); under the default float32 policy
+this changes nothing. The backend serves either one (MEDREAD_CT_ARTIFACT, MEDREAD_CT_INPUT_SIZE).
+"""
+
+from tensorflow.keras.layers import (Activation, AvgPool2D, BatchNormalization, Conv2D, Dense, Dropout, Flatten,
+                                     GlobalAveragePooling2D, MaxPooling2D, SeparableConv2D)
+from tensorflow.keras.models import Sequential
+
+NUM_CLASSES = 3
+
+
+def build_reference(input_shape, num_classes=NUM_CLASSES):
+    """The cnn_model.py architecture (uncompiled)."""
+    model = Sequential()
+    model.add(Conv2D(128, (3, 3), padding='same', input_shape=input_shape, activation='relu'))
+    model.add(AvgPool2D(2, 2))
+    model.add(Conv2D(128, (3, 3), activation='relu', padding='same'))
+    model.add(Conv2D(128, (3, 3), activation='relu', padding='same'))
+    model.add(MaxPooling2D(2, 2))
+    model.add(Conv2D(128, (3, 3), activation='relu', padding='same'))
+    model.add(Conv2D(128, (3, 3), activation='relu', padding='same'))
+    model.add(MaxPooling2D(2, 2))
+    model.add(Conv2D(64, (3, 3), activation='relu', padding='same'))
+    model.add(Conv2D(64, (3, 3), activation='relu', padding='same'))
+    model.add(MaxPooling2D(2, 2))
+    model.add(Flatten())
+    model.add(Dropout(0.2, seed=12))
+    model.add(Dense(3000, activation='relu'))
+    model.add(Dense(1500, activation='relu'))
+    model.add(Dense(num_classes, activation='softmax', dtype='float32'))
+    return model
+
+
+def build_lightweight(input_shape, num_classes=NUM_CLASSES):
+    """Depthwise-separable convolutions with a global-average-pooling head (uncompiled)."""
+    model = Sequential()
+    model.add(Conv2D(32, (3, 3), strides=2, padding='same', use_bias=False, input_shape=input_shape))
+    model.add(BatchNormalization())
+    model.add(Activation('relu'))
+    for filters, pool in ((64, True), (128, False), (128, True), (256, False), (256, True)):
+        model.add(SeparableConv2D(filters, (3, 3), padding='same', use_bias=False))
+        model.add(BatchNormalization())
+        model.add(Activation('relu'))
+        if pool:
+            model.add(MaxPooling2D(2, 2))
+    model.add(GlobalAveragePooling2D())
+    model.add(Dropout(0.2, seed=12))
+    model.add(Dense(num_classes, activation='softmax', dtype='float32'))
+    return model
+
+
+ARCHITECTURES = {
+    "reference": build_reference,
+    "lightweight": build_lightweight,
+}
+
+# Input height and width each architecture is trained and served at
+INPUT_SIZES = {
+    "reference": 256,
+    "lightweight": 128,
+}
+
+
+def build(architecture, input_shape=None, num_classes=NUM_CLASSES):
+    """Builds an architecture by name, at its default input size unless input_shape is given."""
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture {architecture!r}, expected one of {tuple(ARCHITECTURES)}")
+    if input_shape is None:
+        size = INPUT_SIZES[architecture]
+        input_shape = (size, size, 3)
+    return ARCHITECTURES[architecture](input_shape, num_classes)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""On-the-fly augmentation stage for the CT scan training pipeline.
+
+Replaces the materialised ImageDataGenerator arrays with a lazy tf.data stage: every training batch
+gets its own random affine transform (rotation, shift, shear, zoom) and horizontal flip, computed
+as one batched matrix op and applied with a single ImageProjectiveTransformV3 call. The stage runs
+inside the input pipeline with parallel map calls, so it uses CPU cores while the model trains and
+stores nothing. Randomness is stateless and derived from a seed, so runs are reproducible; each
+epoch still sees different transforms.
+
+The ranges default to the ImageDataGenerator settings previously used in cnn_model.py.
+"""
+
+import math
+
+import tensorflow as tf
+
+# Same ranges as the old ImageDataGenerator(rotation_range=15, width_shift_range=0.1,
+# height_shift_range=0.1, shear_range=0.1, zoom_range=0.1, horizontal_flip=True, fill_mode='nearest')
+ROTATION_RANGE = 15.0     # degrees
+SHIFT_RANGE = 0.1         # fraction of width / height
+SHEAR_RANGE = 0.1         # degrees, as in Keras
+ZOOM_RANGE = 0.1
+HORIZONTAL_FLIP = True
+
+
+def _matrices(n, rows):
+    """Stacks per-sample 3x3 matrices given as nested lists of [n] tensors."""
+    return tf.stack([tf.stack(row, axis=-1) for row in rows], axis=-2)
+
+
+def random_affine_transforms(n, height, width, seed, rotation_range=ROTATION_RANGE, shift_range=SHIFT_RANGE,
+                             shear_range=SHEAR_RANGE, zoom_range=ZOOM_RANGE, horizontal_flip=HORIZONTAL_FLIP):
+    """Returns [n, 8] projective transforms (output -> input pixel mapping) for a batch."""
+    seeds = tf.random.experimental.stateless_split(seed, num=7)
+
+    def uniform(i, low, high):
+        return tf.random.stateless_uniform([n], seeds[i], low, high)
+
+    theta = uniform(0, -rotation_range, rotation_range) * (math.pi / 180.0)
+    shear = uniform(1, -shear_range, shear_range) * (math.pi / 180.0)
+    tx = uniform(2, -shift_range, shift_range) * width
+    ty = uniform(3, -shift_range, shift_range) * height
+    zx = uniform(4, 1.0 - zoom_range, 1.0 + zoom_range)
+    zy = uniform(5, 1.0 - zoom_range, 1.0 + zoom_range)
+    flip = tf.where(uniform(6, 0.0, 1.0) < 0.5, -1.0, 1.0) if horizontal_flip else tf.ones([n])
+
+    zeros, ones = tf.zeros([n]), tf.ones([n])
+    cx, cy = (width - 1) / 2.0, (height - 1) / 2.0
+    to_centre = _matrices(n, [[ones, zeros, -cx * ones], [zeros, ones, -cy * ones], [zeros, zeros, ones]])
+    from_centre = _matrices(n, [[ones, zeros, cx + tx], [zeros, ones, cy + ty], [zeros, zeros, ones]])
+    rotate = _matrices(n, [[tf.cos(theta), -tf.sin(theta), zeros], [tf.sin(theta), tf.cos(theta), zeros], [zeros, zeros, ones]])
+    shear_m = _matrices(n, [[ones, -tf.sin(shear), zeros], [zeros, tf.cos(shear), zeros], [zeros, zeros, ones]])
+    scale = _matrices(n, [[zx * flip, zeros, zeros], [zeros, zy, zeros], [zeros, zeros, ones]])
+
+    matrix = from_centre @ rotate @ shear_m @ scale @ to_centre
+    matrix = matrix / matrix[:, 2:3, 2:3]
+    return tf.reshape(matrix, [n, 9])[:, :8]
+
+
+def augment_batch(images, labels, seed):
+    """Applies an independent random affine transform + flip to every image of a float32 batch."""
+    shape = tf.shape(images)
+    transforms = random_affine_transforms(shape[0], tf.cast(shape[1], tf.float32), tf.cast(shape[2], tf.float32), seed)
+    augmented = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation="BILINEAR",
+        fill_mode="NEAREST",
+    )
+    return augmented, labels
+
+
+def augment_dataset(dataset, seed=12, num_parallel_calls=tf.data.AUTOTUNE):
+    """Adds the augmentation stage to a batched (images, labels) dataset.
+
+    Each batch is paired with a seed from a reproducible random stream that is re-drawn every epoch,
+    and the transforms run on parallel map calls.
+    """
+    seeds = tf.data.Dataset.random(seed=seed, rerandomize_each_iteration=True).batch(2)
+    return tf.data.Dataset.zip((dataset, seeds)).map(
+        lambda batch, batch_seed: augment_batch(batch[0], batch[1], batch_seed),
+        num_parallel_calls=num_parallel_calls,
+        deterministic=True,
+    )
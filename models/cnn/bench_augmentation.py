@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Throughput of the training input pipeline with and without the lazy augmentation stage.
+
+Builds a synthetic uint8 tile cache (no dataset needed), then reports images/sec for:
+  * plain      - memmap gather + float32 normalisation (data_pipeline.make_dataset)
+  * augmented  - the same plus augmentation.augment_dataset
+  * model step - one forward/backward pass of the cnn_model.py architecture on a batch, for
+                 comparison: as long as "augmented" stays well above it, augmentation is not the
+                 bottleneck of CPU training.
+
+Usage:
+    python bench_augmentation.py --images 512 --batch-size 32
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from data_pipeline import make_dataset
+
+
+def images_per_second(dataset, n_batches, warmup_batches=2):
+    iterator = iter(dataset.repeat())
+    for _ in range(warmup_batches):
+        next(iterator)
+    seen = 0
+    start = time.perf_counter()
+    for _ in range(n_batches):
+        images, _ = next(iterator)
+        seen += int(images.shape[0])
+    elapsed = time.perf_counter() - start
+    return seen / elapsed if elapsed > 0 else float("inf")
+
+
+def reference_model(input_shape):
+    """The cnn_model.py architecture, for timing a training step."""
+    from architectures import build_reference
+
+    model = build_reference(input_shape)
+    model.compile(loss='sparse_categorical_crossentropy', optimizer='adam')
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Augmentation pipeline throughput")
+    parser.add_argument("--images", type=int, default=512)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--skip-model", action="store_true", help="Do not time the CNN training step")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "tiles.npy")
+        tiles = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8,
+                                          shape=(args.images, args.size, args.size, 3))
+        rng = np.random.default_rng(0)
+        for start in range(0, args.images, 64):
+            tiles[start:start + 64] = rng.integers(0, 256, size=tiles[start:start + 64].shape, dtype=np.uint8)
+        tiles.flush()
+        tiles = np.load(path, mmap_mode="r")
+        labels = rng.integers(0, 3, size=args.images).astype(np.int32)
+        indices = np.arange(args.images)
+
+        plain = make_dataset(tiles, labels, indices, batch_size=args.batch_size, shuffle=True)
+        augmented = make_dataset(tiles, labels, indices, batch_size=args.batch_size, shuffle=True, augment_seed=12)
+
+        n_batches = max(1, args.images // args.batch_size)
+        print(f"CPU cores: {os.cpu_count()}")
+        print(f"plain      {images_per_second(plain, n_batches):10.1f} images/sec")
+        print(f"augmented  {images_per_second(augmented, n_batches):10.1f} images/sec")
+
+        if not args.skip_model:
+            model = reference_model((args.size, args.size, 3))
+            x, y = next(iter(augmented))
+            model.train_on_batch(x, y)
+            steps = 3
+            start = time.perf_counter()
+            for _ in range(steps):
+                model.train_on_batch(x, y)
+            elapsed = time.perf_counter() - start
+            print(f"model step {steps * int(x.shape[0]) / elapsed:10.1f} images/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Epoch time and training throughput of the CNN under different CPU training configurations.
+
+Runs train.py on synthetic tiles (no dataset needed) once per configuration, each in a fresh process
+because thread pools and the precision policy are fixed when TensorFlow starts:
+  * float32-default - float32, TensorFlow's default thread pools, oneDNN off (the notebook setup
+                      on a TensorFlow build without oneDNN);
+  * float32-tuned   - float32, oneDNN on, intra-op threads = available cores, 2 inter-op threads;
+  * bf16-tuned      - the same with mixed_bfloat16 (only where the CPU supports bf16 natively).
+Reports the first epoch (includes graph tracing), the mean of the later epochs and their training
+samples/sec.
+
+Usage:
+    python bench_training.py --images 512 --size 128 --epochs 3
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+CNN_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, CNN_DIR)
+
+from train import bf16_supported  # noqa: E402
+
+CONFIGURATIONS = {
+    "float32-default": ["--precision", "float32", "--intra-op-threads", "0", "--inter-op-threads", "0", "--no-onednn"],
+    "float32-tuned": ["--precision", "float32"],
+    "bf16-tuned": ["--precision", "mixed_bfloat16"],
+}
+
+
+def run_configuration(args, name, workdir):
+    summary_path = os.path.join(workdir, f"{name}.json")
+    command = [sys.executable, os.path.join(CNN_DIR, "train.py"), "--synthetic-images", str(args.images),
+               "--size", str(args.size), "--epochs", str(args.epochs), "--batch-size", str(args.batch_size),
+               "--patience", str(args.epochs), "--checkpoint-dir", os.path.join(workdir, name),
+               "--output", os.path.join(workdir, f"{name}.h5"), "--summary-json", summary_path,
+               *CONFIGURATIONS[name]]
+    env = {key: value for key, value in os.environ.items() if key != "TF_ENABLE_ONEDNN_OPTS"}
+    subprocess.run(command, check=True, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(summary_path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CNN training configuration benchmark")
+    parser.add_argument("--images", type=int, default=512)
+    parser.add_argument("--size", type=int, default=128)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--configurations", nargs="+", choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    names = [name for name in args.configurations if name != "bf16-tuned" or bf16_supported()]
+    if len(names) < len(args.configurations):
+        print("No native bf16 support on this CPU, skipping bf16-tuned")
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            results[name] = run_configuration(args, name, workdir)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"CPU cores: {os.cpu_count()}, {args.images} images at {args.size}x{args.size}, batch {args.batch_size}")
+    print(f"{'configuration':<16} {'first epoch s':>14} {'later epochs s':>15} {'samples/sec':>12}")
+    for name, summary in results.items():
+        epochs = summary["epochs"]
+        later = epochs[1:] or epochs
+        print(f"{name:<16} {epochs[0]['epoch_seconds']:>14.1f} "
+              f"{sum(e['epoch_seconds'] for e in later) / len(later):>15.1f} {summary['steady_samples_per_second']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
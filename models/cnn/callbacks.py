@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Keras callbacks for CNN training: early stopping, checkpoints, crash-safe resume and throughput.
+
+cnn_model.py defined an EarlyStopping callback (twice) but never passed it to model.fit, and nothing
+was saved until training finished. training_callbacks() returns the set train.py and the notebook
+use:
+
+  * EarlyStopping     - stops after `patience` epochs without improvement of `monitor` and restores
+                        the best weights;
+  * ModelCheckpoint   - keeps the best weights so far in <checkpoint_dir>/best.weights.h5;
+  * BackupAndRestore  - saves model and optimizer state every epoch (or every N steps) in
+                        <checkpoint_dir>/backup; after an interruption, running the same fit again
+                        resumes from the last backup instead of from epoch 1. The backup is removed
+                        once training completes;
+  * EpochThroughput   - wall time and training samples/sec of every epoch, optionally appended to a
+                        JSON lines file.
+"""
+
+import json
+import os
+import time
+
+import tensorflow as tf
+
+
+class EpochThroughput(tf.keras.callbacks.Callback):
+    """Measures each epoch: total wall time, time in the training steps and training samples/sec."""
+
+    def __init__(self, samples_per_epoch, log_path=None):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.log_path = log_path
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_seconds = None
+
+    def on_test_begin(self, logs=None):
+        # Validation runs at the end of the epoch; the training steps are everything before it
+        if self._train_seconds is None and hasattr(self, "_started"):
+            self._train_seconds = time.perf_counter() - self._started
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._started
+        train_seconds = self._train_seconds or seconds
+        record = {
+            "epoch": epoch + 1,
+            "epoch_seconds": seconds,
+            "train_seconds": train_seconds,
+            "samples_per_second": self.samples_per_epoch / train_seconds,
+            **{key: float(value) for key, value in (logs or {}).items()},
+        }
+        self.epochs.append(record)
+        print(f"epoch {record['epoch']}: {seconds:.1f}s, {record['samples_per_second']:.1f} samples/sec")
+        if self.log_path:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+def training_callbacks(checkpoint_dir, samples_per_epoch, monitor="val_accuracy", patience=3,
+                       save_freq="epoch", log_path=None):
+    """The callbacks described above. save_freq is "epoch" or a number of training steps."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    throughput = EpochThroughput(samples_per_epoch, log_path)
+    return [
+        tf.keras.callbacks.BackupAndRestore(os.path.join(checkpoint_dir, "backup"), save_freq=save_freq),
+        tf.keras.callbacks.EarlyStopping(monitor=monitor, patience=patience, restore_best_weights=True),
+        tf.keras.callbacks.ModelCheckpoint(os.path.join(checkpoint_dir, "best.weights.h5"), monitor=monitor,
+                                           save_best_only=True, save_weights_only=True),
+        throughput,
+    ]
@@ -86,149 +86,67 @@ plt.show()
 img.shape
 
 dir = '/content/drive/MyDrive/Colab Notebooks/Data1/train'
-img_width = 256
-img_height = 256
-
 
+# CNN architecture (architectures.py): 'reference' is the original network at 256x256 with a
+# Dense(3000) -> Dense(1500) head; 'lightweight' uses depthwise-separable convolutions and a
+# global-average-pooling head at 128x128, for much faster serving and LIME explanations
+architecture = 'reference'
+img_width = img_height = 256 if architecture == 'reference' else 128
+model_file = 'lung_cancer_detection_model.h5' if architecture == 'reference' else 'lung_cancer_detection_model_lightweight.h5'
 
 # Second section of the path
 categories = ['Bengin cases', 'Malignant cases', 'Normal cases']
 
-# Now we get the images using complete path and store the images into img_data folder.
-img_data = []
-for cata in categories:
-    folder = os.path.join(dir, cata)
-    label = categories.index(cata)
-    for img in os.listdir(folder):
-        img_path = os.path.join(folder, img)
-
-        try:
-            # Attempt to read and resize the image
-            img_array = cv2.imread(img_path)
-            img_array = cv2.resize(img_array, (img_height, img_width))
-
-            # Check if the image array is not empty
-            if img_array is not None and not img_array.size == 0:
-                img_data.append([img_array, label])
-
-        except Exception as e:
-            continue
-
-
-random.shuffle(img_data)
+# Streaming loader (data_pipeline.py, upload it next to this notebook): images are decoded and resized
+# in parallel into a uint8 memory-mapped tile cache on Drive, so the full dataset is never held in RAM
+# as a float array. Later runs reuse the cache.
+import sys
+sys.path.append('/content/drive/MyDrive/Colab Notebooks')
+from data_pipeline import list_dataset, build_tile_cache, stratified_split, make_dataset
 
-x=[]
-y=[]
-for features,labels in img_data:
-    x.append(features)
-    y.append(labels)
+tile_cache_path = f'/content/drive/MyDrive/Colab Notebooks/Data1_tiles_{img_height}.npy'
+paths, labels = list_dataset(dir, categories)
+tiles, labels = build_tile_cache(paths, labels, tile_cache_path, size=(img_height, img_width))
+print("Tile cache:", tiles.shape, tiles.dtype)
 
-#Convert X and Y list into array
-X=np.array(x, dtype = float)
-Y=np.array(y, dtype = float)
+# Stratified 64/16/20 train/val/test split on indices (no pixel copies)
+train_idx, val_idx, test_idx = stratified_split(labels, test_size=0.2, val_size=0.2)
 
-print(X[19])
+# Normalisation to float32 [0, 1] happens batch by batch inside the prefetching tf.data pipeline.
+# Training batches also go through the lazy augmentation stage (augmentation.py): a seeded random
+# rotation/shift/shear/zoom/flip per image, computed on the fly, so no augmented copies are stored.
+batch_size = 32
+train_ds = make_dataset(tiles, labels, train_idx, batch_size=batch_size, shuffle=True, augment_seed=12)
+val_ds = make_dataset(tiles, labels, val_idx, batch_size=batch_size)
+test_ds = make_dataset(tiles, labels, test_idx, batch_size=batch_size)
+y_test = labels[test_idx]
 
-# normalization
-for i in range(len(X)):
-    X[i] = X[i]/255.0
-
-X.shape
-
-x, x_test, y, y_test = train_test_split(X, Y, test_size = 0.2)
-
-x_train, x_val, y_train, y_val = train_test_split(x, y, test_size = 0.2)
-
-model = Sequential()
-
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
-import numpy as np
+# Both architectures are defined in architectures.py (upload it next to this notebook)
+from architectures import build
 
-# Define the ImageDataGenerator for data augmentation
-datagen = ImageDataGenerator(
-    rotation_range=15,
-    width_shift_range=0.1,
-    height_shift_range=0.1,
-    shear_range=0.1,
-    zoom_range=0.1,
-    horizontal_flip=True,
-    fill_mode='nearest'
-)
-
-# Define the number of augmented images per original image
-augmented_images_per_original = 6
-
-# Initialize lists for augmented data
-augmented_x_train = []
-augmented_y_train = []
-
-# Generate augmented images in batches
-batch_size = 32  # Adjust based on your system's memory
-for start in range(0, len(x_train), batch_size):
-    end = min(start + batch_size, len(x_train))
-    batch_x = x_train[start:end]
-    batch_y = y_train[start:end]
-
-    # Repeat each image in the batch to generate multiple augmentations
-    repeated_batch_x = np.repeat(batch_x, augmented_images_per_original, axis=0)
-    repeated_batch_y = np.repeat(batch_y, augmented_images_per_original, axis=0)
-
-    # Generate augmented data
-    augmented_batch = datagen.flow(repeated_batch_x, batch_size=batch_size, shuffle=False)
-    for augmented_images in augmented_batch:
-        augmented_x_train.extend(augmented_images)
-        augmented_y_train.extend(repeated_batch_y[:len(augmented_images)])
-        if len(augmented_x_train) >= len(repeated_batch_x):
-            break
-
-# Convert augmented data lists to numpy arrays
-augmented_x_train = np.array(augmented_x_train)
-augmented_y_train = np.array(augmented_y_train)
-
-# Concatenate original and augmented data
-x_train_augmented = np.concatenate((x_train, augmented_x_train), axis=0)
-y_train_augmented = np.concatenate((y_train, augmented_y_train), axis=0)
-
-print(f"Augmented training data shape: {x_train_augmented.shape}")
-print(f"Augmented labels shape: {y_train_augmented.shape}")
-
-model.add(Conv2D(128, (3, 3), padding = 'same', input_shape = X.shape[1: ], activation = 'relu'))
-model.add(AvgPool2D(2,2))
-model.add(Conv2D(128, (3, 3), activation = 'relu', padding = 'same'))
-model.add(Conv2D(128, (3, 3), activation = 'relu', padding = 'same'))
-model.add(MaxPooling2D(2,2))
-model.add(Conv2D(128, (3, 3), activation = 'relu', padding = 'same'))
-model.add(Conv2D(128, (3, 3), activation = 'relu', padding = 'same'))
-
-model.add(MaxPooling2D(2,2))
-model.add(Conv2D(64, (3, 3), activation = 'relu', padding = 'same'))
-model.add(Conv2D(64, (3, 3), activation = 'relu', padding = 'same'))
-
-model.add(MaxPooling2D(2,2))
-model.add(Flatten())
-model.add(Dropout(0.2, seed = 12))
-model.add(Dense(3000, activation = 'relu'))
-model.add(Dense(1500, activation = 'relu'))
-model.add(Dense(3, activation = 'softmax'))
+model = build(architecture, tiles.shape[1:])
 
 model.compile(loss = 'sparse_categorical_crossentropy', optimizer = 'adam', metrics = ['accuracy'])
 
 model.summary()
 
-# Import EarlyStopping callback
-from tensorflow.keras.callbacks import EarlyStopping
+# Early stopping on val_accuracy (best weights restored), best-weights checkpoints and a backup every
+# epoch on Drive (callbacks.py): if the Colab runtime disconnects, re-running this cell resumes from
+# the last completed epoch. Per-epoch time and samples/sec are logged to epochs.jsonl.
+# For bf16 mixed precision and CPU thread tuning on a training machine, use train.py.
+from callbacks import training_callbacks
 
-# Define EarlyStopping callback
-early_stopping = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)
-early_stopping = EarlyStopping(monitor='val_accuracy', patience=3, restore_best_weights=True)
+checkpoint_dir = f'/content/drive/MyDrive/Colab Notebooks/cnn_checkpoints_{architecture}'
+callbacks = training_callbacks(checkpoint_dir, len(train_idx), monitor='val_accuracy', patience=3,
+                               log_path=os.path.join(checkpoint_dir, 'epochs.jsonl'))
 
-history = model.fit(x_train, y_train, validation_data = (x_val, y_val),epochs = 15)
+history = model.fit(train_ds, validation_data = val_ds, epochs = 15, callbacks = callbacks)
 
-model.save('/content/drive/MyDrive/Colab Notebooks/lung_cancer_detection_model.h5')
+model.save('/content/drive/MyDrive/Colab Notebooks/' + model_file)
 
-result = model.predict(x_test)
+result = model.predict(test_ds)
 
-test_loss, test_accuracy = model.evaluate(x_test, y_test)
+test_loss, test_accuracy = model.evaluate(test_ds)
 print("Test Loss:", test_loss)
 print("Test Accuracy:", test_accuracy)
 
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Side-by-side comparison of CNN models for serving: size, CPU latency and accuracy.
+
+For every model it reports:
+  * parameters and the on-disk size of the .h5;
+  * load time (tensorflow.keras.models.load_model);
+  * CPU latency at batch 1 (one /predict) and batch 64 (one LIME chunk), median of --repeats runs
+    through the backend's compiled predict_fn, and the implied time of a 1000-sample LIME
+    explanation;
+  * test accuracy on --holdout (a folder laid out like the training data), each model at its own
+    input size.
+
+Pass trained .h5 files, or --untrained to build every architecture in architectures.py with random
+weights (size and latency only, no dataset needed).
+
+Usage:
+    python compare_architectures.py lung_cancer_detection_model.h5 lung_cancer_detection_model_lightweight.h5 \
+        --holdout Data1/test
+    python compare_architectures.py --untrained
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "medread_backend"))
+
+from cnn_runtime import compile_predict_fn  # noqa: E402
+from export_model import load_holdout, run_batched  # noqa: E402
+
+LIME_SAMPLES = 1000
+
+
+def latency_ms(predict_fn, input_shape, batch_size, repeats):
+    """Median wall time of predict_fn on a random batch, after one warm-up call."""
+    batch = np.random.default_rng(0).random((batch_size,) + tuple(input_shape), dtype=np.float32)
+    predict_fn(batch)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        predict_fn(batch)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000.0
+
+
+def compare(path, holdout, holdout_limit, batch_sizes, repeats, name=None):
+    started = time.perf_counter()
+    model = load_model(path)
+    load_seconds = time.perf_counter() - started
+    input_shape = model.input_shape[1:]
+    predict_fn = compile_predict_fn(model)
+    result = {
+        "model": name or os.path.basename(path),
+        "input_shape": list(input_shape),
+        "parameters": int(model.count_params()),
+        "file_mb": os.path.getsize(path) / 1e6,
+        "load_s": load_seconds,
+        "latency_ms": {str(b): latency_ms(predict_fn, input_shape, b, repeats) for b in batch_sizes},
+    }
+    largest = max(batch_sizes)
+    result["lime_explanation_s"] = result["latency_ms"][str(largest)] / 1000.0 * LIME_SAMPLES / largest
+    if holdout:
+        x, y = load_holdout(holdout, holdout_limit, size=input_shape[:2])
+        probabilities, _ = run_batched(predict_fn, x, largest)
+        result["test_samples"] = int(len(y))
+        result["test_accuracy"] = float(np.mean(probabilities.argmax(1) == y))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CNN models for serving")
+    parser.add_argument("models", nargs="*", help=".h5 models to compare")
+    parser.add_argument("--untrained", action="store_true", help="Compare every architecture with random weights")
+    parser.add_argument("--holdout", help="Held-out image folder for test accuracy")
+    parser.add_argument("--holdout-limit", type=int, default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+    if not args.models and not args.untrained:
+        parser.error("give .h5 models or --untrained")
+
+    results = [compare(path, args.holdout, args.holdout_limit, args.batch_sizes, args.repeats)
+               for path in args.models]
+    if args.untrained:
+        from architectures import ARCHITECTURES, build
+        with tempfile.TemporaryDirectory() as workdir:
+            for name in ARCHITECTURES:
+                path = os.path.join(workdir, f"{name}.h5")
+                model = build(name)
+                model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+                model.save(path)
+                results.append(compare(path, args.holdout, args.holdout_limit, args.batch_sizes, args.repeats,
+                                       name=f"{name} (untrained)"))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    latency_headers = " ".join(f"{f'batch {b} ms':>11}" for b in args.batch_sizes)
+    print(f"{'model':<44} {'input':>9} {'params':>11} {'MB':>7} {'load s':>7} {latency_headers} {'LIME s':>7} {'accuracy':>9}")
+    for r in results:
+        latencies = " ".join(f"{r['latency_ms'][str(b)]:>11.1f}" for b in args.batch_sizes)
+        accuracy = f"{r['test_accuracy']:>9.4f}" if "test_accuracy" in r else f"{'-':>9}"
+        print(f"{r['model']:<44} {'x'.join(map(str, r['input_shape'][:2])):>9} {r['parameters']:>11,} "
+              f"{r['file_mb']:>7.1f} {r['load_s']:>7.2f} {latencies} {r['lime_explanation_s']:>7.2f} {accuracy}")
+
+
+if __name__ == "__main__":
+    main()
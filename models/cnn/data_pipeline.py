@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Streaming, memory-bounded input pipeline for training the CT scan CNN.
+
+cnn_model.py used to decode every image into a Python list, convert it to a float64 array,
+normalise it in a Python loop and copy it again with train_test_split, so peak memory was many
+times the dataset size. This module replaces that with:
+
+  * parallel decode + resize (OpenCV releases the GIL, so a thread pool scales across cores);
+  * a uint8 tile cache in a memory-mapped .npy file on disk, built once and reused by later runs;
+  * stratified train/val/test splits computed on indices, never on copies of the pixels;
+  * a prefetching tf.data pipeline that gathers batches from the memmap and normalises them to
+    float32 on the fly.
+
+Only one batch of float32 pixels exists in memory at a time; the OS page cache holds the tiles.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+
+from augmentation import augment_dataset
+
+# Class folders and tile size used by cnn_model.py
+CATEGORIES = ['Bengin cases', 'Malignant cases', 'Normal cases']
+IMG_HEIGHT = 256
+IMG_WIDTH = 256
+
+
+def list_dataset(directory, categories=CATEGORIES):
+    """Returns (paths, labels) for every file under directory/<category>/."""
+    paths, labels = [], []
+    for label, cata in enumerate(categories):
+        folder = os.path.join(directory, cata)
+        for name in sorted(os.listdir(folder)):
+            paths.append(os.path.join(folder, name))
+            labels.append(label)
+    return paths, np.asarray(labels, dtype=np.int32)
+
+
+def _decode(path, size):
+    img_array = cv2.imread(path)
+    if img_array is None or img_array.size == 0:
+        return None
+    return cv2.resize(img_array, (size[1], size[0]))
+
+
+def build_tile_cache(paths, labels, cache_path, size=(IMG_HEIGHT, IMG_WIDTH), workers=None):
+    """Decodes and resizes every image in parallel into a uint8 memmap at cache_path (.npy).
+
+    Unreadable files are dropped. Returns (tiles, labels) where tiles is a read-only memmap of shape
+    (N, H, W, 3). An existing cache built from the same file list and size is reused as-is.
+    """
+    meta_path = cache_path + ".json"
+    signature = {"count": len(paths), "size": list(size), "first": paths[:1], "last": paths[-1:]}
+    if os.path.exists(cache_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("signature") == signature:
+            labels = np.asarray(meta["labels"], dtype=np.int32)
+            return np.load(cache_path, mmap_mode="r")[:len(labels)], labels
+
+    tiles = np.lib.format.open_memmap(cache_path + ".tmp", mode="w+", dtype=np.uint8,
+                                      shape=(len(paths), size[0], size[1], 3))
+    keep = np.zeros(len(paths), dtype=bool)
+
+    def _store(i):
+        tile = _decode(paths[i], size)
+        if tile is not None:
+            tiles[i] = tile
+            keep[i] = True
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(_store, range(len(paths))))
+    tiles.flush()
+
+    # Compact in place so the first len(valid) rows are the readable images; the unused tail of
+    # the file is simply never read
+    valid = np.flatnonzero(keep)
+    for dst, src in enumerate(valid):
+        if dst != src:
+            tiles[dst] = tiles[src]
+    tiles.flush()
+    del tiles
+    os.replace(cache_path + ".tmp", cache_path)
+
+    labels = np.asarray(labels, dtype=np.int32)[valid]
+    with open(meta_path, "w") as f:
+        json.dump({"signature": signature, "labels": labels.tolist()}, f)
+    return np.load(cache_path, mmap_mode="r")[:len(labels)], labels
+
+
+def stratified_split(labels, test_size=0.2, val_size=0.2, seed=42):
+    """Stratified train/val/test split over indices; val_size is a fraction of the non-test part."""
+    indices = np.arange(len(labels))
+    rest, test = train_test_split(indices, test_size=test_size, stratify=labels, random_state=seed)
+    train, val = train_test_split(rest, test_size=val_size, stratify=labels[rest], random_state=seed)
+    return np.sort(train), np.sort(val), np.sort(test)
+
+
+def make_dataset(tiles, labels, indices, batch_size=32, shuffle=False, seed=42, augment_seed=None):
+    """tf.data pipeline that gathers batches of tiles from the memmap and normalises to float32.
+
+    If augment_seed is given, the lazy augmentation stage from augmentation.py is applied to every
+    normalised batch (use it for the training split only).
+    """
+    height, width, channels = tiles.shape[1:]
+
+    def _gather(batch_indices):
+        # Sorted reads keep memmap access sequential within a batch
+        order = np.argsort(batch_indices)
+        rows = np.empty((len(batch_indices), height, width, channels), dtype=np.uint8)
+        rows[order] = tiles[batch_indices[order]]
+        return rows, labels[batch_indices]
+
+    def _load(batch_indices):
+        images, batch_labels = tf.numpy_function(_gather, [batch_indices], [tf.uint8, tf.int32])
+        images.set_shape((None, height, width, channels))
+        batch_labels.set_shape((None,))
+        return tf.cast(images, tf.float32) / 255.0, batch_labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(_load, num_parallel_calls=tf.data.AUTOTUNE)
+    if augment_seed is not None:
+        dataset = augment_dataset(dataset, seed=augment_seed)
+    return dataset.prefetch(tf.data.AUTOTUNE)
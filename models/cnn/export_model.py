@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""Export the trained CT scan CNN to a faster CPU serving format.
+
+Converts the lung_cancer_detection_model.h5 saved by cnn_model.py into one of:
+
+  * frozen       - a frozen GraphDef (.pb) with every variable folded into constants
+  * tflite-fp16  - a TFLite model with float16 weights (about half the size, float32 compute)
+  * tflite-int8  - a TFLite model with int8 dynamic-range quantized weights
+
+A metadata file (<artifact>.json) is written next to the artifact; the backend reads it when
+serving with MEDREAD_CT_RUNTIME=frozen|tflite and MEDREAD_CT_ARTIFACT=<artifact>.
+
+If --holdout points at a folder laid out like the training data (one sub-folder per class, see
+`categories` in cnn_model.py), the exported artifact is checked against the original model on those
+images: top-1 agreement, maximum probability difference and accuracy of both, plus per-batch latency.
+
+Usage:
+    python export_model.py lung_cancer_detection_model.h5 --format tflite-int8 \
+        --output lung_cancer_detection_model.int8.tflite --holdout Data1/test
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "medread_backend"))
+
+from cnn_runtime import TFLitePredictor, compile_predict_fn, load_frozen_predict_fn  # noqa: E402
+
+FORMATS = ("frozen", "tflite-fp16", "tflite-int8")
+
+# Same class folders as cnn_model.py
+categories = ['Bengin cases', 'Malignant cases', 'Normal cases']
+
+
+def concrete_function(model):
+    """Traces the model with a dynamic batch dimension."""
+    input_shape = (None,) + tuple(model.input_shape[1:])
+
+    @tf.function
+    def serve(x):
+        return model(x, training=False)
+
+    return serve.get_concrete_function(tf.TensorSpec(input_shape, tf.float32, name="input"))
+
+
+def export_frozen(model, output_path):
+    """Folds all variables into constants and writes the GraphDef."""
+    from tensorflow.python.framework.convert_to_constants import convert_variables_to_constants_v2
+
+    frozen = convert_variables_to_constants_v2(concrete_function(model))
+    with open(output_path, "wb") as f:
+        f.write(frozen.graph.as_graph_def().SerializeToString())
+    return {"input": frozen.inputs[0].name, "output": frozen.outputs[0].name}
+
+
+def export_tflite(model, output_path, quantization):
+    """Converts to TFLite with float16 weights or int8 dynamic-range quantization."""
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+    return {}
+
+
+def load_holdout(folder, limit=None, size=(256, 256)):
+    """Loads a held-out set with the same preprocessing as cnn_model.py (resize to the model's
+    (height, width), scale to [0, 1])."""
+    images, labels = [], []
+    for label, cata in enumerate(categories):
+        class_folder = os.path.join(folder, cata)
+        if not os.path.isdir(class_folder):
+            continue
+        for name in sorted(os.listdir(class_folder)):
+            img_array = cv2.imread(os.path.join(class_folder, name))
+            if img_array is None:
+                continue
+            images.append(cv2.resize(img_array, (size[1], size[0])))
+            labels.append(label)
+    if limit:
+        images, labels = images[:limit], labels[:limit]
+    return np.asarray(images, dtype=np.float32) / 255.0, np.asarray(labels)
+
+
+def run_batched(predict_fn, x, batch_size):
+    """Runs predict_fn over x in batches; returns outputs and mean seconds per batch."""
+    outputs, timings = [], []
+    for start in range(0, len(x), batch_size):
+        t0 = time.perf_counter()
+        outputs.append(np.asarray(predict_fn(x[start:start + batch_size])))
+        timings.append(time.perf_counter() - t0)
+    return np.concatenate(outputs), float(np.mean(timings))
+
+
+def parity_check(reference_fn, candidate_fn, x, y, batch_size):
+    """Compares the exported artifact with the original model on the held-out set."""
+    reference, reference_latency = run_batched(reference_fn, x, batch_size)
+    candidate, candidate_latency = run_batched(candidate_fn, x, batch_size)
+    return {
+        "samples": int(len(x)),
+        "top1_agreement": float(np.mean(reference.argmax(1) == candidate.argmax(1))),
+        "max_abs_prob_diff": float(np.max(np.abs(reference - candidate))),
+        "reference_accuracy": float(np.mean(reference.argmax(1) == y)),
+        "candidate_accuracy": float(np.mean(candidate.argmax(1) == y)),
+        "reference_batch_latency_ms": reference_latency * 1000.0,
+        "candidate_batch_latency_ms": candidate_latency * 1000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the CT scan CNN for CPU serving")
+    parser.add_argument("model", help="Path to lung_cancer_detection_model.h5")
+    parser.add_argument("--format", choices=FORMATS, default="tflite-int8")
+    parser.add_argument("--output", help="Artifact path (default: next to the model)")
+    parser.add_argument("--holdout", help="Held-out image folder for the accuracy-parity check")
+    parser.add_argument("--holdout-limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="Fail (exit 1) if top-1 agreement on the held-out set is below this")
+    args = parser.parse_args()
+
+    suffix = ".pb" if args.format == "frozen" else f".{args.format.split('-')[1]}.tflite"
+    output_path = args.output or os.path.splitext(args.model)[0] + suffix
+
+    model = load_model(args.model)
+    if args.format == "frozen":
+        tensors = export_frozen(model, output_path)
+    else:
+        tensors = export_tflite(model, output_path, args.format.split("-")[1])
+
+    metadata = dict(tensors, format=args.format, source=os.path.basename(args.model),
+                    input_shape=list(model.input_shape[1:]),
+                    source_bytes=os.path.getsize(args.model), artifact_bytes=os.path.getsize(output_path))
+    print(f"Wrote {output_path} ({metadata['artifact_bytes'] / 1e6:.1f} MB, "
+          f"source {metadata['source_bytes'] / 1e6:.1f} MB)")
+
+    if args.holdout:
+        x, y = load_holdout(args.holdout, args.holdout_limit, size=model.input_shape[1:3])
+        with open(output_path + ".json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+        candidate_fn = load_frozen_predict_fn(output_path) if args.format == "frozen" else TFLitePredictor(output_path)
+        metadata["parity"] = parity_check(compile_predict_fn(model), candidate_fn, x, y, args.batch_size)
+        print(json.dumps(metadata["parity"], indent=2))
+
+    with open(output_path + ".json", "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+    if "parity" in metadata and metadata["parity"]["top1_agreement"] < args.min_agreement:
+        print(f"Top-1 agreement {metadata['parity']['top1_agreement']:.4f} is below {args.min_agreement}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Command-line training of the CT scan CNN on CPU training machines.
+
+cnn_model.py is a Colab notebook: it trains in float32 with TensorFlow's default thread settings
+and saves nothing until the last epoch. This entry point trains the same architectures
+(architectures.py, --architecture reference|lightweight) from the same streaming tile cache
+(data_pipeline.py) with:
+
+  * CPU threading set up before TensorFlow starts: oneDNN kernels on, intra-op threads = the cores
+    this process may use, a small inter-op pool (override with --intra-op-threads /
+    --inter-op-threads);
+  * bfloat16 mixed precision (--precision auto picks it when the CPU has native bf16 support,
+    AVX512-BF16 or AMX; the output layer stays float32);
+  * the prefetching tf.data pipeline with lazy augmentation for the training split;
+  * early stopping, best-weights checkpoints and crash-safe backups (callbacks.py). Re-running an
+    interrupted command with the same --checkpoint-dir resumes from the last backup;
+  * per-epoch wall time and training samples/sec, printed and appended to <checkpoint_dir>/epochs.jsonl.
+
+The final model is saved as a float32 .h5, loadable by the backend as before.
+
+Usage:
+    python train.py Data1/train --output lung_cancer_detection_model.h5 --epochs 15
+    python train.py Data1/train --architecture lightweight --output lung_cancer_detection_model_lightweight.h5
+    python train.py --synthetic-images 512 --size 128 --epochs 2 --precision float32   # benchmark
+"""
+
+import argparse
+import json
+import os
+import tempfile
+
+PRECISIONS = ("auto", "float32", "mixed_bfloat16")
+# architectures.INPUT_SIZES (not imported here: TensorFlow must start after configure_cpu)
+ARCHITECTURE_SIZES = {"reference": 256, "lightweight": 128}
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure_cpu(intra_op_threads=None, inter_op_threads=2, onednn=True):
+    """Threading environment for TensorFlow's CPU kernels. Must run before TensorFlow is imported;
+    variables already set in the environment win. A thread count of 0 keeps TensorFlow's default."""
+    if intra_op_threads is None:
+        intra_op_threads = available_cores()
+    os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "1" if onednn else "0")
+    # Only read by OpenMP-based oneDNN builds (e.g. intel-tensorflow); harmless elsewhere
+    if intra_op_threads:
+        os.environ.setdefault("OMP_NUM_THREADS", str(intra_op_threads))
+        os.environ.setdefault("KMP_BLOCKTIME", "1")
+        os.environ.setdefault("KMP_AFFINITY", "granularity=fine,compact,1,0")
+
+    import tensorflow as tf
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    return intra_op_threads, inter_op_threads
+
+
+def bf16_supported():
+    """True when the CPU has native bfloat16 arithmetic (Linux /proc/cpuinfo flags)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def set_precision(precision):
+    """Sets the global Keras dtype policy and returns its name."""
+    import tensorflow as tf
+    if precision == "auto":
+        precision = "mixed_bfloat16" if bf16_supported() else "float32"
+    tf.keras.mixed_precision.set_global_policy(precision)
+    return precision
+
+
+def save_for_serving(model, path, architecture, input_shape):
+    """Saves the weights in a float32 copy of the architecture, so the backend runs it in float32
+    whatever policy it was trained under."""
+    import tensorflow as tf
+    from architectures import build
+
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy("float32")
+    try:
+        serving_model = build(architecture, input_shape)
+        serving_model.set_weights(model.get_weights())
+        serving_model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+        serving_model.save(path)
+    finally:
+        tf.keras.mixed_precision.set_global_policy(policy)
+
+
+def synthetic_tiles(directory, count, size, seed=0):
+    """Random uint8 tiles and labels in a memmap, for timing training without the dataset."""
+    import numpy as np
+    path = os.path.join(directory, "synthetic_tiles.npy")
+    tiles = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(count, size, size, 3))
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, 64):
+        tiles[start:start + 64] = rng.integers(0, 256, size=tiles[start:start + 64].shape, dtype=np.uint8)
+    tiles.flush()
+    return np.load(path, mmap_mode="r"), rng.integers(0, 3, size=count).astype(np.int32)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the CT scan CNN on CPU")
+    parser.add_argument("data", nargs="?", help="Training folder with one sub-folder per class")
+    parser.add_argument("--tile-cache", help="uint8 tile cache path (default: <data>_tiles_<size>.npy)")
+    parser.add_argument("--synthetic-images", type=int, help="Train on N random tiles instead (benchmarking)")
+    parser.add_argument("--architecture", choices=list(ARCHITECTURE_SIZES), default="reference")
+    parser.add_argument("--size", type=int, help="Input height and width (default: the architecture's, 256 or 128)")
+    parser.add_argument("--output", default="lung_cancer_detection_model.h5")
+    parser.add_argument("--checkpoint-dir", default="checkpoints")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--precision", choices=PRECISIONS, default="auto")
+    parser.add_argument("--intra-op-threads", type=int, default=None, help="Default: cores available to this process; 0 keeps TensorFlow's default")
+    parser.add_argument("--inter-op-threads", type=int, default=2, help="0 keeps TensorFlow's default")
+    parser.add_argument("--no-onednn", action="store_true", help="Disable oneDNN kernels")
+    parser.add_argument("--monitor", default="val_accuracy", help="Metric for early stopping and best checkpoints")
+    parser.add_argument("--patience", type=int, default=3)
+    parser.add_argument("--save-freq", default="epoch", help='Backup every "epoch" or every N training steps')
+    parser.add_argument("--no-augment", action="store_true")
+    parser.add_argument("--summary-json", help="Write the run configuration and per-epoch timings here")
+    args = parser.parse_args(argv)
+    if args.size is None:
+        args.size = ARCHITECTURE_SIZES[args.architecture]
+    if not args.data and not args.synthetic_images:
+        parser.error("give a training folder or --synthetic-images")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    intra_op, inter_op = configure_cpu(args.intra_op_threads, args.inter_op_threads, onednn=not args.no_onednn)
+    precision = set_precision(args.precision)
+
+    import numpy as np
+
+    from architectures import build
+    from callbacks import training_callbacks
+    from data_pipeline import build_tile_cache, list_dataset, make_dataset, stratified_split
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.synthetic_images:
+            tiles, labels = synthetic_tiles(workdir, args.synthetic_images, args.size)
+        else:
+            cache_path = args.tile_cache or f"{args.data.rstrip(os.sep)}_tiles_{args.size}.npy"
+            paths, labels = list_dataset(args.data)
+            tiles, labels = build_tile_cache(paths, labels, cache_path, size=(args.size, args.size))
+
+        train_idx, val_idx, test_idx = stratified_split(labels, test_size=0.2, val_size=0.2)
+        train_ds = make_dataset(tiles, labels, train_idx, batch_size=args.batch_size, shuffle=True,
+                                augment_seed=None if args.no_augment else 12)
+        val_ds = make_dataset(tiles, labels, val_idx, batch_size=args.batch_size)
+        test_ds = make_dataset(tiles, labels, test_idx, batch_size=args.batch_size)
+
+        model = build(args.architecture, tiles.shape[1:])
+        model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['accuracy'])
+        save_freq = args.save_freq if args.save_freq == "epoch" else int(args.save_freq)
+        callbacks = training_callbacks(args.checkpoint_dir, len(train_idx), monitor=args.monitor,
+                                       patience=args.patience, save_freq=save_freq,
+                                       log_path=os.path.join(args.checkpoint_dir, "epochs.jsonl"))
+        print(f"architecture={args.architecture} precision={precision} intra_op_threads={intra_op} inter_op_threads={inter_op} "
+              f"onednn={os.environ.get('TF_ENABLE_ONEDNN_OPTS')} train={len(train_idx)} val={len(val_idx)}")
+        model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=callbacks)
+
+        test_loss, test_accuracy = model.evaluate(test_ds)
+        print("Test Loss:", test_loss)
+        print("Test Accuracy:", test_accuracy)
+        save_for_serving(model, args.output, args.architecture, tiles.shape[1:])
+
+    epochs = callbacks[-1].epochs
+    summary = {
+        "architecture": args.architecture, "parameters": int(model.count_params()),
+        "precision": precision, "intra_op_threads": intra_op, "inter_op_threads": inter_op,
+        "onednn": os.environ.get("TF_ENABLE_ONEDNN_OPTS") == "1", "batch_size": args.batch_size,
+        "size": args.size, "train_samples": int(len(train_idx)), "epochs": epochs,
+        "test_accuracy": float(test_accuracy),
+        # The first epoch includes graph tracing; later epochs show the steady state
+        "steady_samples_per_second": float(np.mean([e["samples_per_second"] for e in epochs[1:] or epochs])) if epochs else None,
+    }
+    if args.summary_json:
+        with open(args.summary_json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""Scaling of text-classifier training: in-memory (nlp_model.py) vs chunked (streaming_tfidf.py).
+
+Writes synthetic report CSVs of increasing size (no dataset needed; Findings / Impression /
+Category columns like the training data) and trains on each in a fresh process with:
+  * in-memory - pd.read_csv of the whole file, preprocess_batch, TfidfVectorizer.fit_transform and a
+                single RandomForestClassifier fit, as nlp_model.py does;
+  * chunked   - streaming_tfidf.train_streaming (two passes over blocks of --chunk-rows, staged
+                forest).
+For every run it reports the time spent preprocessing, vectorising and training, the total, and the
+peak RSS of the process, so memory growth with corpus size can be compared directly.
+
+Usage:
+    python bench_training.py --rows 5000 20000 80000 --n-jobs -1 --n-estimators 50
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+
+NLP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, NLP_DIR)
+
+CATEGORIES = ["Benign", "Malignant", "Normal"]
+
+
+def write_corpus(path, rows, seed=0, vocabulary_size=20000):
+    """Writes a synthetic report CSV; each class draws half of its words from its own part of the vocabulary."""
+    import csv
+    rng = random.Random(seed)
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+             for _ in range(vocabulary_size)]
+    share = vocabulary_size // (2 * len(CATEGORIES))
+
+    def sentence(label, length):
+        start = label * share
+        return " ".join(rng.choice(words[start:start + share]) if rng.random() < 0.5 else rng.choice(words)
+                        for _ in range(length))
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Findings", "Impression", "Category"])
+        for _ in range(rows):
+            label = rng.randrange(len(CATEGORIES))
+            writer.writerow([sentence(label, rng.randint(20, 80)) + ".", sentence(label, rng.randint(4, 15)) + ".",
+                             CATEGORIES[label]])
+
+
+def peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    return float("nan")
+
+
+def train_in_memory(csv_path, n_jobs, n_estimators):
+    """The nlp_model.py pipeline, timed."""
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+
+    from streaming_tfidf import make_vectorizer
+    from text_preprocessing import preprocess_batch
+
+    timings = {}
+    started = time.perf_counter()
+    data = pd.read_csv(csv_path)
+    data['text'] = data['Findings'] + ' ' + data['Impression']
+    data['Category'] = data['Category'].str.strip()
+    data['text'] = preprocess_batch(data['text'].tolist(), n_jobs=n_jobs)
+    timings["preprocess_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    X_train, _, y_train, _ = train_test_split(data['text'], data['Category'], test_size=0.2, random_state=42,
+                                              stratify=data['Category'])
+    X_train_tfidf = make_vectorizer().fit_transform(X_train)
+    timings["vectorize_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs).fit(X_train_tfidf, y_train)
+    timings["train_s"] = time.perf_counter() - started
+    return timings
+
+
+def run_child(args):
+    if args.mode == "in-memory":
+        timings = train_in_memory(args.csv, args.n_jobs, args.n_estimators)
+    else:
+        from streaming_tfidf import train_streaming
+        *_, timings = train_streaming(args.csv, chunk_rows=args.chunk_rows, n_jobs=args.n_jobs,
+                                      n_estimators=args.n_estimators, log=lambda message: None)
+    timings["total_s"] = sum(timings.values())
+    timings["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(timings))
+
+
+def run_mode(args, mode, csv_path):
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--csv", csv_path,
+               "--n-jobs", str(args.n_jobs), "--n-estimators", str(args.n_estimators),
+               "--chunk-rows", str(args.chunk_rows)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Text classifier training scaling benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[5000, 20000, 80000], help="Corpus sizes")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--n-estimators", type=int, default=50)
+    parser.add_argument("--chunk-rows", type=int, default=5000)
+    parser.add_argument("--modes", nargs="+", default=["in-memory", "chunked"], choices=["in-memory", "chunked"])
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("--child", choices=["in-memory", "chunked"], dest="mode", help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_child(args)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            csv_path = os.path.join(workdir, f"reports_{rows}.csv")
+            write_corpus(csv_path, rows)
+            csv_mb = os.path.getsize(csv_path) / 1e6
+            for mode in args.modes:
+                results.append(dict(run_mode(args, mode, csv_path), rows=rows, mode=mode, csv_mb=csv_mb))
+            os.remove(csv_path)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'rows':>8} {'csv MB':>7} {'mode':<10} {'prep s':>7} {'tfidf s':>8} {'train s':>8} {'total s':>8} {'peak MB':>8}")
+    for r in results:
+        print(f"{r['rows']:>8} {r['csv_mb']:>7.1f} {r['mode']:<10} {r['preprocess_s']:>7.2f} {r['vectorize_s']:>8.2f} "
+              f"{r['train_s']:>8.2f} {r['total_s']:>8.2f} {r['peak_rss_mb']:>8.0f}")
+    for rows in args.rows:
+        by_mode = {r["mode"]: r for r in results if r["rows"] == rows}
+        if len(by_mode) == 2:
+            speedup = by_mode["in-memory"]["total_s"] / by_mode["chunked"]["total_s"]
+            print(f"{rows} rows: chunked is {speedup:.2f}x the in-memory speed, "
+                  f"{by_mode['chunked']['peak_rss_mb'] - by_mode['in-memory']['peak_rss_mb']:+.0f} MB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
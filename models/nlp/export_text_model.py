@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""Export the trained text classifier and TF-IDF vectorizer to the compact serving format.
+
+Converts the lung_cancer_classifier.pkl / tfidf_vectorizer.pkl pickles saved by nlp_model.py into a
+directory of flat .npy arrays plus model.json (see medread_backend/compact_text_model.py). The backend
+memory-maps it when serving with MEDREAD_TEXT_RUNTIME=compact and MEDREAD_TEXT_ARTIFACT=<directory>.
+
+Before exporting, a self-check needing no dataset fits small TF-IDF + RandomForest models on synthetic
+reports, exports them and loads both runtimes through compact_text_model.load_text_model: the TF-IDF
+values and predict_proba of the compact format must match sklearn's. --check runs only this.
+
+If --texts points at a file of reports (one per line, or a .csv with the Findings and Impression
+columns used for training), the export is checked against the pickles on those reports: identical
+predicted classes and the maximum probability difference, plus per-batch latency of both.
+
+Usage:
+    python export_text_model.py lung_cancer_classifier.pkl tfidf_vectorizer.pkl \
+        --output text_model_compact --texts synthetic_lung_cancer_cases.csv
+    python export_text_model.py --check
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "medread_backend"))
+
+from compact_text_model import export_compact, load_compact, load_text_model  # noqa: E402
+from text_preprocessing import preprocess_batch  # noqa: E402
+
+# The compact format reproduces sklearn's arithmetic, so anything above rounding noise is a bug
+PARITY_TOLERANCE = 1e-12
+
+# Words of the synthetic self-check reports: one list per class, plus filler shared by all of them
+SELF_CHECK_CLASS_WORDS = (
+    ("nodule", "spiculated", "mass", "malignancy", "biopsy", "lymphadenopathy", "suspicious"),
+    ("clear", "normal", "patent", "unremarkable", "stable", "benign", "resolved"),
+    ("effusion", "emphysema", "fibrosis", "consolidation", "atelectasis", "opacity", "thickening"),
+)
+SELF_CHECK_FILLER = ("the", "lung", "lobe", "right", "left", "upper", "lower", "is", "seen", "with", "no", "and",
+                     "chest", "of", "in", "There", "Findings", "Impression", "CT")
+# Vectorizer settings covered by the self-check: the training configuration of nlp_model.py, and
+# n-grams with sublinear tf and a document-frequency cut-off
+SELF_CHECK_VECTORIZERS = (
+    {"stop_words": "english", "max_features": 5000},
+    {"ngram_range": (1, 2), "sublinear_tf": True, "min_df": 2},
+)
+
+
+def load_texts(path, limit=None):
+    """Reads reports from a .csv (Findings + Impression, as in nlp_model.py) or a text file, one per line."""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            texts = [f"{row['Findings']} {row['Impression']}" for row in csv.DictReader(f)]
+        else:
+            texts = [line.strip() for line in f if line.strip()]
+    return texts[:limit] if limit else texts
+
+
+def run_batched(classifier, vectorizer, texts, batch_size):
+    """Vectorizes and classifies texts in batches; returns probabilities and mean seconds per batch."""
+    outputs, timings = [], []
+    for start in range(0, len(texts), batch_size):
+        t0 = time.perf_counter()
+        outputs.append(classifier.predict_proba(vectorizer.transform(texts[start:start + batch_size])))
+        timings.append(time.perf_counter() - t0)
+    return np.concatenate(outputs), float(np.mean(timings))
+
+
+def parity_check(reference, candidate, texts, batch_size):
+    """Compares the compact export with the pickled models on the same preprocessed reports."""
+    reference_features = reference[1].transform(texts)
+    candidate_features = candidate[1].transform(texts)
+    reference_proba, reference_latency = run_batched(*reference, texts, batch_size)
+    candidate_proba, candidate_latency = run_batched(*candidate, texts, batch_size)
+    return {
+        "samples": len(texts),
+        "max_abs_tfidf_diff": float(abs(reference_features - candidate_features).max()) if texts else 0.0,
+        "top1_agreement": float(np.mean(reference_proba.argmax(1) == candidate_proba.argmax(1))),
+        "max_abs_prob_diff": float(np.max(np.abs(reference_proba - candidate_proba))),
+        "reference_batch_latency_ms": reference_latency * 1000.0,
+        "candidate_batch_latency_ms": candidate_latency * 1000.0,
+    }
+
+
+def parity_ok(parity):
+    """True when the compact export reproduces the reference classes, TF-IDF values and probabilities."""
+    return (parity["top1_agreement"] == 1.0 and parity["max_abs_tfidf_diff"] <= PARITY_TOLERANCE
+            and parity["max_abs_prob_diff"] <= PARITY_TOLERANCE)
+
+
+def synthetic_reports(count, seed=0):
+    """Random reports mixing one class's words with shared filler, in mixed case with punctuation."""
+    rng = np.random.default_rng(seed)
+    texts, labels = [], []
+    for _ in range(count):
+        label = int(rng.integers(len(SELF_CHECK_CLASS_WORDS)))
+        words = list(rng.choice(SELF_CHECK_CLASS_WORDS[label], size=rng.integers(3, 8)))
+        words += list(rng.choice(SELF_CHECK_FILLER, size=rng.integers(4, 12)))
+        # A word from another class now and then, so the trees do not separate the classes perfectly
+        if rng.random() < 0.3:
+            words.append(rng.choice(SELF_CHECK_CLASS_WORDS[(label + 1) % len(SELF_CHECK_CLASS_WORDS)]))
+        rng.shuffle(words)
+        texts.append(" ".join(word.upper() if rng.random() < 0.1 else word for word in words) + ".")
+        labels.append(label)
+    return texts, np.array(labels)
+
+
+def self_check(batch_size):
+    """Fits small models on synthetic reports for each of SELF_CHECK_VECTORIZERS, pickles and exports them,
+    loads both runtimes with load_text_model and compares them on unseen synthetic reports."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    texts, labels = synthetic_reports(300)
+    held_out, _ = synthetic_reports(200, seed=1)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for index, settings in enumerate(SELF_CHECK_VECTORIZERS):
+            vectorizer = TfidfVectorizer(**settings).fit(texts)
+            classifier = RandomForestClassifier(n_estimators=20, random_state=index)
+            classifier.fit(vectorizer.transform(texts), labels)
+            model_path = os.path.join(workdir, f"classifier_{index}.pkl")
+            vectorizer_path = os.path.join(workdir, f"vectorizer_{index}.pkl")
+            artifact = os.path.join(workdir, f"compact_{index}")
+            joblib.dump(classifier, model_path)
+            joblib.dump(vectorizer, vectorizer_path)
+            export_compact(classifier, vectorizer, artifact)
+
+            reference = load_text_model(model_path, vectorizer_path, runtime="sklearn")
+            candidate = load_text_model(model_path, vectorizer_path, runtime="compact", artifact=artifact)
+            parity = parity_check(reference, candidate, held_out, batch_size)
+            results.append(dict(parity, vectorizer=settings, ok=parity_ok(parity)))
+    return results
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the text classifier for serving")
+    parser.add_argument("model", nargs="?", help="Path to lung_cancer_classifier.pkl")
+    parser.add_argument("vectorizer", nargs="?", help="Path to tfidf_vectorizer.pkl")
+    parser.add_argument("--check", action="store_true", help="Only run the self-check on synthetic reports")
+    parser.add_argument("--output", default="text_model_compact", help="Output directory")
+    parser.add_argument("--texts", help="Reports (.csv or one per line) for the parity check")
+    parser.add_argument("--texts-limit", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+    if not args.check and not (args.model and args.vectorizer):
+        parser.error("give the classifier and vectorizer pickles, or --check")
+
+    checks = self_check(args.batch_size)
+    for check in checks:
+        print(f"Self-check {check['vectorizer']}: {'ok' if check['ok'] else 'MISMATCH'} "
+              f"(max TF-IDF diff {check['max_abs_tfidf_diff']:.2e}, max probability diff {check['max_abs_prob_diff']:.2e})")
+    if not all(check["ok"] for check in checks):
+        print("The compact format does not reproduce sklearn on synthetic reports")
+        sys.exit(1)
+    if args.check:
+        return
+
+    classifier, vectorizer = joblib.load(args.model), joblib.load(args.vectorizer)
+    header = export_compact(classifier, vectorizer, args.output)
+    source_bytes = os.path.getsize(args.model) + os.path.getsize(args.vectorizer)
+    print(f"Wrote {args.output} ({header['n_trees']} trees, {header['n_nodes']} nodes, {header['n_features']} terms; "
+          f"{directory_bytes(args.output) / 1e6:.1f} MB, pickles {source_bytes / 1e6:.1f} MB)")
+
+    if args.texts:
+        texts = preprocess_batch(load_texts(args.texts, args.texts_limit))
+        parity = parity_check((classifier, vectorizer), load_compact(args.output), texts, args.batch_size)
+        print(json.dumps(parity, indent=2))
+        if not parity_ok(parity):
+            print("The compact export does not match the pickled models")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,9 +17,6 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.pipeline import make_pipeline
 from sklearn.metrics import classification_report
 import nltk
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
-import re
 from google.colab import drive
 
 !pip install lime shap nltk
@@ -33,56 +30,57 @@ nltk.download('stopwords')
 nltk.download('wordnet')
 nltk.download('omw-1.4')
 
-# Load data from Google Drive
+# Text preprocessing (shared with the backend): upload medread_backend/text_preprocessing.py next to this
+# notebook. It keeps one stopword set and lemmatizer per process, memoises lemmas, and can spread a
+# corpus over several processes, so training and serving normalise text identically.
+import sys
+sys.path.append('/content/drive/MyDrive/Colab Notebooks')
+from text_preprocessing import preprocess_text, preprocess_batch
+
+# Data source. Corpora too large for memory: set chunked_training = True to train with
+# streaming_tfidf.py (upload it next to this notebook) instead. It streams the CSV in blocks,
+# preprocesses them in parallel and learns the same vocabulary in two passes, so the reports are never
+# all in memory; the forest is grown in stages and checkpointed after each one.
 data_path = '/content/drive/MyDrive/Colab Notebooks/synthetic_lung_cancer_cases.csv'
-data = pd.read_csv(data_path)
-
-# Combine 'Findings' and 'Impression' into a single text feature
-data['text'] = data['Findings'] + ' ' + data['Impression']
-
-# Preprocess target labels
-data['Category'] = data['Category'].str.strip()
-
-# Text preprocessing function
-def preprocess_text(text):
-    """Normalize and preprocess text data."""
-    # Lowercase
-    text = text.lower()
-
-    # Remove special characters and numbers
-    text = re.sub(r'[^a-zA-Z\s]', '', text)
-
-    # Tokenize and remove stopwords
-    stop_words = set(stopwords.words('english'))
-    tokens = text.split()
-    tokens = [word for word in tokens if word not in stop_words]
-
-    # Lemmatize
-    lemmatizer = WordNetLemmatizer()
-    tokens = [lemmatizer.lemmatize(word) for word in tokens]
-
-    return ' '.join(tokens)
-
-# Apply preprocessing to the text data
-data['text'] = data['text'].apply(preprocess_text)
-
-# Split the dataset
-X = data['text']
-y = data['Category']
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
-
-# Vectorize text using TF-IDF
-tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
-X_train_tfidf = tfidf.fit_transform(X_train)
-X_test_tfidf = tfidf.transform(X_test)
-
-# Train a classifier
-clf = RandomForestClassifier(random_state=42)
-clf.fit(X_train_tfidf, y_train)
-
-# Evaluate the model
-y_pred = clf.predict(X_test_tfidf)
-print(classification_report(y_test, y_pred))
+chunked_training = False
+
+if chunked_training:
+    from streaming_tfidf import train_streaming
+    clf, tfidf, X_test_tfidf, y_test, timings = train_streaming(
+        data_path, workdir='/content', n_jobs=-1,
+        checkpoint_path='/content/drive/MyDrive/Colab Notebooks/lung_cancer_classifier_checkpoint.pkl')
+    print(timings)
+    print(classification_report(y_test, clf.predict(X_test_tfidf)))
+else:
+    # Load data from Google Drive
+    data = pd.read_csv(data_path)
+
+    # Combine 'Findings' and 'Impression' into a single text feature
+    data['text'] = data['Findings'] + ' ' + data['Impression']
+
+    # Preprocess target labels
+    data['Category'] = data['Category'].str.strip()
+
+    # Apply preprocessing to the text data
+    data['text'] = preprocess_batch(data['text'].tolist(), n_jobs=-1)
+
+    # Split the dataset
+    X = data['text']
+    y = data['Category']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+
+    # Vectorize text using TF-IDF
+    tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
+    X_train_tfidf = tfidf.fit_transform(X_train)
+    X_test_tfidf = tfidf.transform(X_test)
+
+    # Train a classifier
+    clf = RandomForestClassifier(random_state=42)
+    clf.fit(X_train_tfidf, y_train)
+
+    # Evaluate the model
+    y_pred = clf.predict(X_test_tfidf)
+    print(classification_report(y_test, y_pred))
 
 # Save the model and vectorizer to Google Drive
 import joblib
@@ -91,21 +89,31 @@ vectorizer_path = '/content/drive/MyDrive/Colab Notebooks/tfidf_vectorizer_updat
 joblib.dump(clf, model_path)
 joblib.dump(tfidf, vectorizer_path)
 
+# Export the compact serving format as well (flat node tables + memory-mapped vocabulary, see
+# medread_backend/compact_text_model.py); serve it with MEDREAD_TEXT_RUNTIME=compact.
+from compact_text_model import export_compact
+export_compact(clf, tfidf, '/content/drive/MyDrive/Colab Notebooks/text_model_compact')
+
 # Function to classify new radiology reports
+_loaded_model = None
+_loaded_vectorizer = None
+
 def classify_report(report):
     """Classify a new radiology report."""
-    # Load the saved model and vectorizer
-    model = joblib.load('/content/drive/MyDrive/Colab Notebooks/lung_cancer_classifier_updated.pkl')
-    vectorizer = joblib.load('/content/drive/MyDrive/Colab Notebooks/tfidf_vectorizer_updated.pkl')
+    global _loaded_model, _loaded_vectorizer
+    # Load the saved model and vectorizer once, on first use
+    if _loaded_model is None:
+        _loaded_model = joblib.load('/content/drive/MyDrive/Colab Notebooks/lung_cancer_classifier_updated.pkl')
+        _loaded_vectorizer = joblib.load('/content/drive/MyDrive/Colab Notebooks/tfidf_vectorizer_updated.pkl')
 
     # Preprocess the input report
     report = preprocess_text(report)
 
     # Transform the input report
-    report_tfidf = vectorizer.transform([report])
+    report_tfidf = _loaded_vectorizer.transform([report])
 
     # Predict the category
-    prediction = model.predict(report_tfidf)
+    prediction = _loaded_model.predict(report_tfidf)
     return prediction[0]
 
 # Example usage
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""Chunked, memory-bounded training of the TF-IDF + RandomForest text classifier.
+
+nlp_model.py reads the whole CSV into a DataFrame, preprocesses every report in memory and fits
+TfidfVectorizer and RandomForestClassifier in one go, so the corpus has to fit in RAM several times
+over. This module trains the same two models from a stream:
+
+  * pass 1 - the CSV is read in blocks of --chunk-rows; blocks are preprocessed (text_preprocessing)
+             and tokenised in parallel worker processes, only a bounded window of blocks is in
+             flight, and the workers return per-block term and document counts. The normalised
+             reports are spilled to a line-per-report file on disk;
+  * vocabulary - the merged counts give exactly the vocabulary and idf weights that
+             TfidfVectorizer.fit would have learnt on the training rows (same min_df / max_df /
+             max_features rules, same tie-breaking);
+  * pass 2 - the spill file is vectorised block by block in parallel into sparse TF-IDF rows;
+  * forest - trees are added in stages with warm_start (n_jobs parallel within each stage), so
+             progress is reported and can be checkpointed, and max_samples can cap the rows each
+             tree is grown on.
+
+Only the sparse TF-IDF matrix (a few dozen non-zeros per report) and the term counts are ever
+resident; raw and preprocessed text stay on disk. A HashingVectorizer would avoid the second pass,
+but it has no feature names, which the tree explainer and the compact serving format
+(compact_text_model.py) need, so the two-pass vocabulary keeps the saved vectorizer a plain
+TfidfVectorizer that the backend loads as before.
+
+The train/test split is drawn row by row from a seeded generator per block (not stratified), so for
+a given --chunk-rows it does not depend on the number of workers.
+
+Usage:
+    python streaming_tfidf.py synthetic_lung_cancer_cases.csv --output-dir out/ --n-jobs -1 --export-compact
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "medread_backend"))
+
+from text_preprocessing import preprocess_text  # noqa: E402
+
+# Columns of the training CSV, as in nlp_model.py
+TEXT_COLUMNS = ("Findings", "Impression")
+LABEL_COLUMN = "Category"
+
+CHUNK_ROWS = 10_000
+
+
+def make_vectorizer(**params):
+    """The TfidfVectorizer configuration of nlp_model.py (overridable)."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    return TfidfVectorizer(**{"stop_words": "english", "max_features": 5000, **params})
+
+
+def iter_csv_chunks(csv_path, chunk_rows=CHUNK_ROWS):
+    """Yields (texts, labels) per block of rows; text is Findings + ' ' + Impression as in nlp_model.py."""
+    import pandas as pd
+    columns = list(TEXT_COLUMNS) + [LABEL_COLUMN]
+    for chunk in pd.read_csv(csv_path, usecols=columns, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+        texts = chunk[TEXT_COLUMNS[0]].str.cat(chunk[list(TEXT_COLUMNS[1:])], sep=" ")
+        yield texts.tolist(), chunk[LABEL_COLUMN].str.strip().tolist()
+
+
+def map_bounded(function, items, n_jobs):
+    """Ordered parallel map that keeps at most 2 * n_jobs items in flight, so a long input stream is never
+    queued up in memory. Runs inline for n_jobs == 1."""
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs <= 1:
+        yield from map(function, items)
+        return
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        window = deque()
+        for item in items:
+            window.append(pool.submit(function, item))
+            if len(window) >= 2 * n_jobs:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def _first_pass_chunk(task):
+    """Worker: preprocesses one block, draws its split and counts terms of its training rows."""
+    index, texts, labels, vectorizer, test_size, seed = task
+    processed = [preprocess_text(text) for text in texts]
+    is_test = np.random.default_rng([seed, index]).random(len(texts)) < test_size
+    analyze = vectorizer.build_analyzer()
+    term_counts, document_counts = Counter(), Counter()
+    for text, test in zip(processed, is_test):
+        if not test:
+            tokens = analyze(text)
+            term_counts.update(tokens)
+            document_counts.update(set(tokens))
+    return processed, labels, is_test.tolist(), term_counts, document_counts
+
+
+def first_pass(chunks, spill_path, vectorizer, n_jobs=1, test_size=0.2, seed=42):
+    """Pass 1: preprocesses and counts every block, writing one JSON line [label, is_test, text] per
+    report to spill_path. Returns (training rows, test rows, term counts, document counts)."""
+    tasks = ((index, texts, labels, vectorizer, test_size, seed) for index, (texts, labels) in enumerate(chunks))
+    n_train = n_test = 0
+    term_counts, document_counts = Counter(), Counter()
+    with open(spill_path, "w", encoding="utf-8") as spill:
+        for processed, labels, is_test, chunk_terms, chunk_documents in map_bounded(_first_pass_chunk, tasks, n_jobs):
+            for text, label, test in zip(processed, labels, is_test):
+                spill.write(json.dumps([label, test, text]) + "\n")
+            n_test += sum(is_test)
+            n_train += len(is_test) - sum(is_test)
+            term_counts.update(chunk_terms)
+            document_counts.update(chunk_documents)
+    return n_train, n_test, term_counts, document_counts
+
+
+def fit_vocabulary(vectorizer, n_documents, term_counts, document_counts):
+    """Sets vocabulary_ and idf_ from corpus counts exactly as TfidfVectorizer.fit would (min_df, max_df
+    and max_features pruning, then smoothed idf)."""
+    from numbers import Integral
+
+    if vectorizer.vocabulary is not None or not vectorizer.use_idf:
+        raise ValueError("Streaming training learns the vocabulary and idf weights (vocabulary=None, use_idf=True)")
+    terms = sorted(document_counts)
+    dfs = np.array([document_counts[term] for term in terms], dtype=np.int64)
+    # TfidfVectorizer counts in float64, and binary=True clips counts to 1 before pruning
+    tfs = dfs.astype(np.float64) if vectorizer.binary else np.array([term_counts[term] for term in terms], dtype=np.float64)
+
+    max_df, min_df = vectorizer.max_df, vectorizer.min_df
+    high = max_df if isinstance(max_df, Integral) else max_df * n_documents
+    low = min_df if isinstance(min_df, Integral) else min_df * n_documents
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+    mask = (dfs <= high) & (dfs >= low)
+    limit = vectorizer.max_features
+    if limit is not None and mask.sum() > limit:
+        keep = np.flatnonzero(mask)[(-tfs[mask]).argsort()[:limit]]
+        mask = np.zeros(len(terms), dtype=bool)
+        mask[keep] = True
+    kept = np.flatnonzero(mask)
+    if len(kept) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+
+    vectorizer.vocabulary_ = {terms[i]: column for column, i in enumerate(kept)}
+    vectorizer.fixed_vocabulary_ = False
+    smooth = int(vectorizer.smooth_idf)
+    idf = np.full(len(kept), fill_value=n_documents + smooth, dtype=np.float64)
+    idf /= dfs[kept].astype(np.float64) + float(smooth)
+    np.log(idf, out=idf)
+    idf += 1.0
+    vectorizer.idf_ = idf
+    return vectorizer
+
+
+def iter_spill_chunks(spill_path, chunk_rows=CHUNK_ROWS):
+    """Yields lists of [label, is_test, text] rows from the spill file, chunk_rows at a time."""
+    rows = []
+    with open(spill_path, encoding="utf-8") as spill:
+        for line in spill:
+            rows.append(json.loads(line))
+            if len(rows) >= chunk_rows:
+                yield rows
+                rows = []
+    if rows:
+        yield rows
+
+
+def _second_pass_chunk(task):
+    """Worker: TF-IDF rows for one block of the spill file, split into train and test."""
+    rows, vectorizer = task
+    labels = np.array([row[0] for row in rows], dtype=object)
+    is_test = np.array([row[1] for row in rows], dtype=bool)
+    features = vectorizer.transform([row[2] for row in rows])
+    return features[~is_test], labels[~is_test], features[is_test], labels[is_test]
+
+
+def second_pass(spill_path, vectorizer, chunk_rows=CHUNK_ROWS, n_jobs=1):
+    """Pass 2: vectorises the spill file block by block. Returns X_train, y_train, X_test, y_test."""
+    tasks = ((rows, vectorizer) for rows in iter_spill_chunks(spill_path, chunk_rows))
+    parts = list(map_bounded(_second_pass_chunk, tasks, n_jobs))
+    X_train = sp.vstack([part[0] for part in parts], format="csr")
+    X_test = sp.vstack([part[2] for part in parts], format="csr")
+    return X_train, np.concatenate([part[1] for part in parts]), X_test, np.concatenate([part[3] for part in parts])
+
+
+def train_forest(X, y, n_estimators=100, trees_per_stage=25, n_jobs=-1, max_samples=None, random_state=42,
+                 checkpoint_path=None, log=print):
+    """Grows the RandomForestClassifier of nlp_model.py in stages of trees_per_stage trees (warm_start).
+    With a fixed random_state the result is identical to a single fit; after every stage the forest is
+    optionally saved to checkpoint_path."""
+    from sklearn.ensemble import RandomForestClassifier
+
+    clf = RandomForestClassifier(n_estimators=0, random_state=random_state, n_jobs=n_jobs,
+                                 max_samples=max_samples, warm_start=True)
+    while clf.n_estimators < n_estimators:
+        started = time.perf_counter()
+        clf.set_params(n_estimators=min(n_estimators, clf.n_estimators + trees_per_stage))
+        clf.fit(X, y)
+        log(f"{clf.n_estimators}/{n_estimators} trees ({time.perf_counter() - started:.1f}s for this stage)")
+        if checkpoint_path:
+            import joblib
+            joblib.dump(clf, checkpoint_path)
+    clf.set_params(warm_start=False)
+    return clf
+
+
+def train_streaming(csv_path, workdir=None, chunk_rows=CHUNK_ROWS, n_jobs=-1, test_size=0.2, seed=42,
+                    n_estimators=100, trees_per_stage=25, max_samples=None, vectorizer=None,
+                    checkpoint_path=None, log=print):
+    """Runs both passes and the staged forest fit. Returns (clf, vectorizer, X_test, y_test, timings)."""
+    vectorizer = vectorizer or make_vectorizer()
+    timings = {}
+    with tempfile.TemporaryDirectory(dir=workdir) as spill_dir:
+        spill_path = os.path.join(spill_dir, "reports.jsonl")
+
+        started = time.perf_counter()
+        n_train, n_test, term_counts, document_counts = first_pass(
+            iter_csv_chunks(csv_path, chunk_rows), spill_path, vectorizer, n_jobs, test_size, seed)
+        timings["preprocess_s"] = time.perf_counter() - started
+        log(f"Pass 1: {n_train} training and {n_test} test reports, {len(document_counts)} distinct terms")
+
+        started = time.perf_counter()
+        fit_vocabulary(vectorizer, n_train, term_counts, document_counts)
+        del term_counts, document_counts
+        X_train, y_train, X_test, y_test = second_pass(spill_path, vectorizer, chunk_rows, n_jobs)
+        timings["vectorize_s"] = time.perf_counter() - started
+        log(f"Pass 2: {X_train.shape[1]} features, {X_train.nnz} non-zeros in the training matrix")
+
+    started = time.perf_counter()
+    clf = train_forest(X_train, y_train, n_estimators, trees_per_stage, n_jobs, max_samples, seed,
+                       checkpoint_path, log)
+    timings["train_s"] = time.perf_counter() - started
+    return clf, vectorizer, X_test, y_test, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the text classifier from a CSV in chunks")
+    parser.add_argument("csv", help="Training CSV with Findings, Impression and Category columns")
+    parser.add_argument("--output-dir", default=".", help="Where the classifier and vectorizer are written")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Worker processes (-1: every core)")
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--trees-per-stage", type=int, default=25)
+    parser.add_argument("--max-samples", type=float, default=None,
+                        help="Fraction of the training rows each tree is grown on (default: all)")
+    parser.add_argument("--checkpoint", action="store_true", help="Save the forest after every stage")
+    parser.add_argument("--export-compact", action="store_true",
+                        help="Also write the compact serving format (text_model_compact/)")
+    args = parser.parse_args()
+
+    import joblib
+    from sklearn.metrics import classification_report
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    model_path = os.path.join(args.output_dir, "lung_cancer_classifier.pkl")
+    clf, vectorizer, X_test, y_test, timings = train_streaming(
+        args.csv, workdir=args.output_dir, chunk_rows=args.chunk_rows, n_jobs=args.n_jobs,
+        test_size=args.test_size, n_estimators=args.n_estimators, trees_per_stage=args.trees_per_stage,
+        max_samples=args.max_samples, checkpoint_path=model_path if args.checkpoint else None)
+    if X_test.shape[0]:
+        print(classification_report(y_test, clf.predict(X_test)))
+    print(json.dumps(timings, indent=2))
+
+    joblib.dump(clf, model_path)
+    joblib.dump(vectorizer, os.path.join(args.output_dir, "tfidf_vectorizer.pkl"))
+    if args.export_compact:
+        from compact_text_model import export_compact
+        export_compact(clf, vectorizer, os.path.join(args.output_dir, "text_model_compact"))
+
+
+if __name__ == "__main__":
+    main()